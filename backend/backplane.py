@@ -0,0 +1,260 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from outbound import encode_message
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Awaitable[None]]
+PeerLostHandler = Callable[[str], Awaitable[None]]
+PeerJoinedHandler = Callable[[str], Awaitable[None]]
+
+
+def default_node_id() -> str:
+    return os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class Backplane(ABC):
+    """Cross-worker pub/sub bus under ConnectionManager
+
+    Every envelope published by a node reaches every other node; a node's own
+    envelopes are dropped on receipt (echo suppression). Nodes heartbeat so
+    peers that die without saying goodbye are noticed and their presence purged.
+    A node says hello on start and whenever it first hears from a peer (new, or
+    back after being purged); every node answers a hello through
+    on_peer_joined, which republishes its state for the newcomer.
+    publish() only queues; a background task does the network I/O.
+    """
+
+    def __init__(self, node_id: Optional[str] = None, heartbeat_interval: float = 5.0):
+        self.node_id = node_id or default_node_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.peers: Dict[str, float] = {}  # node_id -> monotonic time last heard from
+        self._handler: Optional[Handler] = None
+        self._on_peer_lost: Optional[PeerLostHandler] = None
+        self._on_peer_joined: Optional[PeerJoinedHandler] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        # Metrics
+        self.published = 0
+        self.received = 0
+        self.echoes_suppressed = 0
+        self.failed = 0
+
+    async def start(self, handler: Handler, on_peer_lost: Optional[PeerLostHandler] = None,
+                    on_peer_joined: Optional[PeerJoinedHandler] = None):
+        self._handler = handler
+        self._on_peer_lost = on_peer_lost
+        self._on_peer_joined = on_peer_joined
+        self._outbox = asyncio.Queue()
+        await self._connect()
+        # Peers that already know this node id (a restart) still resend their state
+        self.publish({'kind': 'hello'})
+        self._tasks = [
+            asyncio.create_task(self._publish_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+        logger.info(f"🛰️ {type(self).__name__} started as node {self.node_id}")
+
+    def publish(self, envelope: dict):
+        """Queue an envelope for every other node"""
+        if self._outbox is None:
+            return
+        self._outbox.put_nowait(encode_message({**envelope, 'node': self.node_id}))
+
+    async def close(self):
+        """Tell peers we're leaving, flush the outbox and disconnect"""
+        if self._outbox is None:
+            return
+        self.publish({'kind': 'bye'})
+        try:
+            await asyncio.wait_for(self._outbox.join(), timeout=2.0)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Backplane outbox not drained before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await self._disconnect()
+        self._outbox = None
+
+    async def _publish_loop(self):
+        while True:
+            data = await self._outbox.get()
+            try:
+                await self._send(data)
+                self.published += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Backplane publish failed: {e}")
+            finally:
+                self._outbox.task_done()
+
+    async def _heartbeat_loop(self):
+        while True:
+            self.publish({'kind': 'heartbeat'})
+            await asyncio.sleep(self.heartbeat_interval)
+            deadline = time.monotonic() - 3 * self.heartbeat_interval
+            for node_id, last_seen in list(self.peers.items()):
+                if last_seen < deadline:
+                    logger.warning(f"🛰️ Node {node_id} stopped heartbeating")
+                    await self._peer_gone(node_id)
+
+    async def _peer_gone(self, node_id: str):
+        if self.peers.pop(node_id, None) is not None and self._on_peer_lost:
+            await self._on_peer_lost(node_id)
+
+    async def _dispatch(self, data):
+        """Called by subclasses for every envelope read off the bus"""
+        try:
+            envelope = json.loads(data)
+            node_id = envelope.get('node')
+            if node_id == self.node_id:
+                self.echoes_suppressed += 1
+                return
+            self.received += 1
+
+            kind = envelope.get('kind')
+            if kind == 'bye':
+                await self._peer_gone(node_id)
+                return
+            new_peer = node_id not in self.peers
+            self.peers[node_id] = time.monotonic()
+            if new_peer:
+                logger.info(f"🛰️ Node {node_id} joined")
+                # It may have missed what we and the others announced; ask everyone to resend
+                self.publish({'kind': 'hello'})
+            if (new_peer or kind == 'hello') and self._on_peer_joined:
+                await self._on_peer_joined(node_id)
+            if kind not in ('heartbeat', 'hello') and self._handler:
+                await self._handler(envelope)
+        except Exception as e:
+            logger.error(f"❌ Failed to handle backplane message: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'backend': type(self).__name__,
+            'node_id': self.node_id,
+            'peers': sorted(self.peers),
+            'outbox_depth': self._outbox.qsize() if self._outbox else 0,
+            'published': self.published,
+            'received': self.received,
+            'echoes_suppressed': self.echoes_suppressed,
+            'failed': self.failed,
+        }
+
+    # Transport hooks for subclasses
+    async def _connect(self):
+        pass
+
+    async def _disconnect(self):
+        pass
+
+    @abstractmethod
+    async def _send(self, data: str):
+        """Put one encoded envelope on the wire"""
+
+
+class InProcessBus:
+    """Shared bus for InProcessBackplane nodes living in the same event loop"""
+
+    def __init__(self):
+        self.nodes: List['InProcessBackplane'] = []
+
+
+class InProcessBackplane(Backplane):
+    """Backplane for a single process; nodes sharing an InProcessBus see each other
+
+    With its own private bus (the default) this is a single-node deployment.
+    """
+
+    def __init__(self, bus: Optional[InProcessBus] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.bus = bus or InProcessBus()
+
+    def publish(self, envelope: dict):
+        # Alone on the bus there is nobody to tell; skip the envelope encode
+        if len(self.bus.nodes) > 1:
+            super().publish(envelope)
+
+    async def _connect(self):
+        self.bus.nodes.append(self)
+
+    async def _disconnect(self):
+        if self in self.bus.nodes:
+            self.bus.nodes.remove(self)
+
+    async def _send(self, data: str):
+        for node in list(self.bus.nodes):
+            await node._dispatch(data)
+
+
+class RedisBackplane(Backplane):
+    """Backplane over Redis pub/sub (or any server speaking the Redis protocol)
+
+    url examples: redis://localhost:6379/0, unix:///var/run/redis/redis.sock
+    Needs the optional `redis` package (redis-py 4.2+).
+    """
+
+    def __init__(self, url: str, channel: str = "virtual-office:backplane", **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def _connect(self):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RedisBackplane needs the 'redis' package: pip install redis") from e
+
+        self._client = redis.from_url(self.url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    await self._dispatch(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Backplane subscription lost, resubscribing: {e}")
+                await asyncio.sleep(1.0)
+                try:
+                    await self._pubsub.subscribe(self.channel)
+                except Exception as resubscribe_error:
+                    logger.error(f"❌ Resubscribe failed: {resubscribe_error}")
+
+    async def _disconnect(self):
+        if self._reader:
+            self._reader.cancel()
+        if self._pubsub:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.close()
+        if self._client:
+            await self._client.close()
+
+    async def _send(self, data: str):
+        await self._client.publish(self.channel, data)
+
+
+def create_backplane(url: str = "") -> Backplane:
+    """Pick a backplane from a URL; empty means a single in-process node"""
+    if not url or url == "memory://":
+        return InProcessBackplane()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url)
+    raise ValueError(f"Unsupported BACKPLANE_URL: {url}")
@@ -0,0 +1,88 @@
+from fastapi import WebSocket
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+Emit = Callable[[str, dict, Optional[WebSocket]], None]
+
+
+class MessageBatcher:
+    """Holds high-frequency room messages for a short window and releases them as one frame
+
+    Only types listed in `types` are batched. Messages are grouped per room and
+    per (type, sender); when the room's window expires each group goes out as a
+    single '<type>_batch' frame (or unchanged if it holds one message). Callers
+    must flush() a room before relaying anything else to it so nothing
+    overtakes the batched messages (e.g. a 'clear' after a run of 'draw's).
+    """
+
+    def __init__(self, emit: Emit, types: Iterable[str] = ('draw',), window: float = 0.025):
+        self.emit = emit
+        self.types = frozenset(types)
+        self.window = window
+        # room_id -> {(type, sender): (exclude_websocket, messages)}, in arrival order
+        self.pending: Dict[str, Dict[Tuple[str, str], Tuple[Optional[WebSocket], List[dict]]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+        # Metrics
+        self.messages_in = 0
+        self.frames_out = 0
+
+    def wants(self, message: dict) -> bool:
+        message_type = message.get('type')
+        return self.window > 0 and isinstance(message_type, str) and message_type in self.types
+
+    def add(self, room_id: str, message: dict, exclude_websocket: Optional[WebSocket] = None):
+        room = self.pending.get(room_id)
+        if room is None:
+            room = self.pending[room_id] = {}
+            self._timers[room_id] = asyncio.get_running_loop().call_later(self.window, self.flush, room_id)
+
+        key = (message['type'], str(message.get('sender', message.get('id', ''))))
+        batch = room.get(key)
+        if batch is None:
+            batch = room[key] = (exclude_websocket, [])
+        batch[1].append(message)
+        self.messages_in += 1
+
+    def flush(self, room_id: str):
+        """Release everything held for a room now"""
+        timer = self._timers.pop(room_id, None)
+        if timer is not None:
+            timer.cancel()
+        room = self.pending.pop(room_id, None)
+        if not room:
+            return
+
+        for (message_type, sender), (exclude_websocket, messages) in room.items():
+            if len(messages) == 1:
+                message = messages[0]
+            else:
+                message = {
+                    'type': f'{message_type}_batch',
+                    'sender': sender,
+                    'messages': [
+                        {field: value for field, value in item.items() if field not in ('type', 'sender')}
+                        for item in messages
+                    ]
+                }
+            self.frames_out += 1
+            try:
+                self.emit(room_id, message, exclude_websocket)
+            except Exception as e:
+                logger.error(f"❌ Failed to emit {message_type} batch for room {room_id}: {e}")
+
+    def flush_all(self):
+        for room_id in list(self.pending):
+            self.flush(room_id)
+
+    def stats(self) -> dict:
+        return {
+            'types': sorted(self.types),
+            'window_ms': round(self.window * 1000, 1),
+            'pending_rooms': len(self.pending),
+            'messages_in': self.messages_in,
+            'frames_out': self.frames_out,
+        }
@@ -0,0 +1,122 @@
+"""Frames/sec and CPU for relaying 'draw' traffic with and without batching.
+
+Several senders in one room emit draw segments at mousemove rate while the
+rest of the room receives them through the real ConnectionManager and
+in-memory sockets. Each batching window (0 = off) is run in turn; a 'clear'
+is sent halfway to check nothing sent before it arrives after it.
+
+    cd backend && python -m bench.draw_batching --windows 0,16,25,33
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+import main
+from backplane import InProcessBackplane
+from batching import MessageBatcher
+
+
+class FakeWebSocket:
+    """Counts frames; optionally keeps them for the ordering check"""
+
+    def __init__(self, keep: bool = False):
+        self.frames = 0
+        self.kept = [] if keep else None
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        if self.kept is not None:
+            self.kept.append(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def ordering_ok(frames) -> bool:
+    """Every draw numbered below the clear's must arrive before it"""
+    clear_at, clear_seq, draws = None, None, []
+    for index, frame in enumerate(frames):
+        message = json.loads(frame)
+        if message['type'] == 'clear':
+            clear_at, clear_seq = index, message['seq']
+        elif message['type'] == 'draw':
+            draws.append((index, message['seq']))
+        elif message['type'] == 'draw_batch':
+            draws.extend((index, item['seq']) for item in message['messages'])
+    if clear_at is None:
+        return False
+    return all(index < clear_at for index, seq in draws if seq < clear_seq)
+
+
+async def run(window_ms: float, receivers: int, senders: int, rate: float, duration: float) -> dict:
+    manager = main.ConnectionManager(InProcessBackplane())
+    await manager.start()
+    manager.batcher = MessageBatcher(manager._broadcast_now, ['draw'], window_ms / 1000)
+
+    room_id = 'bench-room'
+    sender_sockets = [FakeWebSocket() for _ in range(senders)]
+    receiver_sockets = [FakeWebSocket(keep=(i == 0)) for i in range(receivers)]
+    for i, websocket in enumerate(sender_sockets + receiver_sockets):
+        await manager.connect(room_id, websocket, {'id': f'user-{i}', 'name': 'Bench', 'office_id': 'bench'})
+    await asyncio.sleep(0.05)
+    baseline = sum(websocket.frames for websocket in receiver_sockets)
+
+    ticks = int(duration * rate)
+    seq = 0
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for tick in range(ticks):
+        if tick == ticks // 2:
+            seq += 1
+            await manager.broadcast(room_id, {'type': 'clear', 'sender': 'user-0', 'seq': seq},
+                                    exclude_websocket=sender_sockets[0])
+        for i, websocket in enumerate(sender_sockets):
+            seq += 1
+            x = float(tick)
+            await manager.broadcast(room_id, {
+                'type': 'draw', 'from': {'x': x, 'y': x}, 'to': {'x': x + 1, 'y': x + 1},
+                'sender': f'user-{i}', 'seq': seq
+            }, exclude_websocket=websocket)
+        await asyncio.sleep(1 / rate)
+    manager.batcher.flush_all()
+    await asyncio.sleep(0.05)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    frames = sum(websocket.frames for websocket in receiver_sockets) - baseline
+    ordered = ordering_ok(receiver_sockets[0].kept)
+    for websocket in sender_sockets + receiver_sockets:
+        manager.disconnect(room_id, websocket)
+    await manager.close()
+    return {
+        'window_ms': window_ms,
+        'draw_messages': ticks * senders,
+        'frames_delivered': frames,
+        'frames_per_sec': round(frames / wall, 1),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_percent': round(100 * cpu / wall, 1),
+        'clear_ordering_ok': ordered,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--windows', default='0,16,25,33', help='comma-separated batching windows in ms')
+    parser.add_argument('--receivers', type=int, default=50)
+    parser.add_argument('--senders', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=120.0, help='draw messages per second per sender')
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per run')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = [
+        asyncio.run(run(float(window), args.receivers, args.senders, args.rate, args.duration))
+        for window in args.windows.split(',')
+    ]
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(result['clear_ordering_ok'] for result in results) else 1)
+
+
+if __name__ == '__main__':
+    main_cli()
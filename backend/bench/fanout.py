@@ -0,0 +1,140 @@
+"""Fan-out cost per event as an office grows, with and without subscriptions.
+
+Fills one office with each of --sizes members (rooms of --room-size) on the
+real ConnectionManager with in-memory sockets, adds --dashboards office-wide
+presence streams and --watchers streams following --watch-rooms rooms each,
+then times --events of each kind:
+
+  move    a member changes room (presence diff / user_moved_room)
+  churn   a member joins and leaves (presence join + leave, user_joined)
+  room    a whiteboard clear broadcast to one room
+
+For each it reports microseconds and frames queued per event, once with
+members receiving everything (how clients behaved before subscriptions) and
+once with members subscribed to presence 'none', as the web client is.
+
+    cd backend && python -m bench.fanout --sizes 1000,2000,5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+import main
+from interest import EVERYTHING, Interest
+
+OFFICE = 'office-bench'
+
+
+class FakeWebSocket:
+    """Accepts whatever the writer task sends"""
+
+    async def send_text(self, data: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def queued(manager: main.ConnectionManager) -> int:
+    return sum(len(connection.send_queue.pending) for connection in manager.registry.connections.values())
+
+
+async def settle(manager: main.ConnectionManager):
+    """Let writer tasks (and tasks queued by disconnects) empty every queue"""
+    await asyncio.sleep(0)
+    while queued(manager):
+        await asyncio.sleep(0)
+
+
+async def scenario(size: int, room_size: int, dashboards: int, watchers: int, watch_rooms: int,
+                   events: int, interest: Interest) -> dict:
+    manager = main.ConnectionManager()
+    await manager.start()
+    rooms = [f'room-{i}' for i in range(max(1, size // room_size))]
+
+    members = []
+    for i in range(size):
+        websocket, room_id = FakeWebSocket(), rooms[i % len(rooms)]
+        await manager.connect(room_id, websocket, {'id': f'user-{i}', 'name': 'Bench', 'office_id': OFFICE},
+                              interest=interest)
+        members.append((room_id, websocket))
+    streams = [FakeWebSocket() for _ in range(dashboards + watchers)]
+    for i, websocket in enumerate(streams):
+        manager.subscribe_presence(OFFICE, websocket)
+        if i >= dashboards:
+            manager.subscribe(manager.registry.get(websocket),
+                              {'presence': 'rooms', 'rooms': random.sample(rooms, min(watch_rooms, len(rooms)))})
+    await settle(manager)
+
+    async def move():
+        for _ in range(events):
+            await manager.move_user_to_room(f'user-{random.randrange(size)}', random.choice(rooms))
+
+    async def churn():
+        for i in range(events):
+            websocket, room_id = FakeWebSocket(), random.choice(rooms)
+            await manager.connect(room_id, websocket, {'id': f'guest-{i}', 'name': 'Bench', 'office_id': OFFICE},
+                                  interest=interest)
+            manager.disconnect(room_id, websocket)
+
+    async def room():
+        for _ in range(events):
+            await manager.broadcast(random.choice(rooms), {'type': 'clear', 'id': 'bench'})
+
+    result = {}
+    for name, run in (('move', move), ('churn', churn), ('room', room)):
+        started = time.perf_counter()
+        await run()
+        elapsed = time.perf_counter() - started
+        # Nothing above yields, so every frame it queued is still pending
+        # (user_left goes out from a task after a churn and isn't counted)
+        frames = queued(manager)
+        await settle(manager)
+        result[name] = {'us_per_event': round(elapsed / events * 1e6, 1), 'frames_per_event': round(frames / events, 1)}
+
+    for websocket in streams:
+        manager.unsubscribe_presence(OFFICE, websocket)
+    for room_id, websocket in members:
+        manager.disconnect(room_id, websocket)
+    await settle(manager)
+    await manager.close()
+    return result
+
+
+async def run(sizes, room_size: int, dashboards: int, watchers: int, watch_rooms: int, events: int) -> dict:
+    results = {}
+    for size in sizes:
+        results[size] = {
+            'everything': await scenario(size, room_size, dashboards, watchers, watch_rooms, events, EVERYTHING),
+            'subscribed': await scenario(size, room_size, dashboards, watchers, watch_rooms, events,
+                                         Interest(presence='none')),
+        }
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,2000,5000', help='comma-separated office sizes (members)')
+    parser.add_argument('--room-size', type=int, default=10)
+    parser.add_argument('--dashboards', type=int, default=5, help='office-wide presence streams')
+    parser.add_argument('--watchers', type=int, default=20, help='presence streams following a few rooms')
+    parser.add_argument('--watch-rooms', type=int, default=3)
+    parser.add_argument('--events', type=int, default=100, help='per kind; keep under half WS_SEND_QUEUE_SIZE')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.disable(logging.WARNING)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    result = asyncio.run(run(sizes, args.room_size, args.dashboards, args.watchers, args.watch_rooms, args.events))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main_cli()
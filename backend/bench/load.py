@@ -0,0 +1,409 @@
+"""Load test for the WebSocket server.
+
+Starts the app with uvicorn in a child process on localhost (or targets a
+running server with --url), connects many simulated clients that send the
+real join/chat/signal/draw message shapes, and prints one JSON document:
+
+  connect     connect+join latency (p50/p99) and connections/sec
+  traffic     messages sent/delivered per second and delivery latency per type
+  server      RSS per connection and event-loop lag (local server only)
+  disconnect  time until the server reports zero connections
+
+    cd backend && python -m bench.load --clients 2000 --duration 15 --output results.json
+    cd backend && python -m bench.load --baseline results.json   # exit 1 on regression
+    cd backend && python -m bench.load --protocol msgpack         # binary frames
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import resource
+import socket
+import sys
+import time
+import urllib.request
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import websockets
+
+import protocol
+
+DEFAULT_MIX = 'draw=0.6,chat=0.25,signal=0.15'
+
+
+def percentiles(values: List[float], scale: float = 1000.0) -> dict:
+    """p50/p90/p99/max of values (seconds), reported in ms"""
+    if not values:
+        return {'count': 0, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * scale, 3)
+
+    return {'count': len(ordered), 'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99),
+            'max': round(ordered[-1] * scale, 3)}
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, not current, off Linux
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# ---------------------------------------------------------------- server side
+
+def serve(port: int, control, lag_interval: float):
+    """Child process: run the app plus an event-loop lag probe; answer 'reset'/'report' on control"""
+    raise_fd_limit()
+    logging.disable(logging.INFO)
+    import uvicorn
+    import main
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        lags: List[float] = []
+
+        async def probe():
+            while True:
+                started = loop.time()
+                await asyncio.sleep(lag_interval)
+                lags.append(max(0.0, loop.time() - started - lag_interval))
+
+        def on_control():
+            request = control.recv()
+            if request == 'reset':
+                lags.clear()
+                control.send(None)
+            elif request == 'report':
+                control.send({'rss_bytes': rss_bytes(), 'loop_lag_ms': percentiles(lags)})
+
+        loop.add_reader(control.fileno(), on_control)
+        prober = asyncio.create_task(probe())
+        server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning'))
+        await server.serve()
+        prober.cancel()
+
+    asyncio.run(run())
+
+
+class LocalServer:
+    def __init__(self, lag_interval: float):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        context = multiprocessing.get_context('spawn')
+        self.control, child_control = context.Pipe()
+        self.process = context.Process(target=serve, args=(self.port, child_control, lag_interval), daemon=True)
+        self.url = f'ws://127.0.0.1:{self.port}'
+
+    async def start(self, timeout: float = 30.0):
+        self.process.start()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f'server did not start on port {self.port}')
+
+    def request(self, command: str):
+        self.control.send(command)
+        return self.control.recv()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(10)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+# ---------------------------------------------------------------- client side
+
+class Stats:
+    def __init__(self):
+        self.recording = False
+        self.sent = 0
+        self.delivered = 0
+        self.latency: Dict[str, List[float]] = defaultdict(list)  # message type -> seconds
+        self.connect_latency: List[float] = []
+        self.connect_failures = 0
+        self.errors = 0
+
+    def delivered_message(self, message_type: str, sent_at: Optional[float], now: float):
+        if not self.recording:
+            return
+        self.delivered += 1
+        if sent_at is not None:
+            self.latency[message_type].append(now - sent_at)
+
+
+class Client:
+    def __init__(self, index: int, room_id: str, room_peers: List[str], stats: Stats,
+                 codec: Optional[protocol.MessagePackCodec] = None):
+        self.codec = codec
+        self.encode = codec.encode if codec else json.dumps
+        self.decode = codec.decode if codec else json.loads
+        self.user_id = f'load-{index}-{uuid.uuid4().hex[:6]}'
+        self.room_id = room_id
+        self.room_peers = room_peers  # user ids in the same room, including ours
+        self.stats = stats
+        self.websocket = None
+        self.reader: Optional[asyncio.Task] = None
+        self.position = (random.uniform(0, 800), random.uniform(0, 600))
+
+    async def connect(self, url: str):
+        started = time.perf_counter()
+        self.websocket = await websockets.connect(f'{url}/ws/{self.room_id}', max_size=None, open_timeout=60,
+                                                  subprotocols=[self.codec.name] if self.codec else None)
+        await self.websocket.send(self.encode({
+            'type': 'join', 'id': self.user_id, 'name': 'Load Test', 'email': '', 'avatar': '',
+            'firebaseUid': '', 'displayName': 'Load Test', 'office_id': 'load-test', 'role': 'member'
+        }))
+        while self.decode(await self.websocket.recv()).get('type') != 'participants_list':
+            pass
+        self.stats.connect_latency.append(time.perf_counter() - started)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.websocket:
+                now = time.perf_counter()
+                message = self.decode(raw)
+                if message.get('type') == 'draw_batch':
+                    for item in message.get('messages', ()):
+                        self.stats.delivered_message('draw', item.get('sent_at'), now)
+                else:
+                    self.stats.delivered_message(message.get('type', 'unknown'), message.get('sent_at'), now)
+        except websockets.ConnectionClosed:
+            pass
+
+    def next_message(self, message_type: str) -> dict:
+        sent_at = time.perf_counter()
+        if message_type == 'draw':
+            x, y = self.position
+            to = (x + random.uniform(-5, 5), y + random.uniform(-5, 5))
+            self.position = to
+            return {'type': 'draw', 'id': self.user_id, 'from': {'x': x, 'y': y},
+                    'to': {'x': to[0], 'y': to[1]}, 'sent_at': sent_at}
+        if message_type == 'signal':
+            target = random.choice([peer for peer in self.room_peers if peer != self.user_id] or [self.user_id])
+            return {'type': 'signal', 'id': self.user_id, 'target': target, 'sent_at': sent_at,
+                    'signal': {'type': 'candidate', 'candidate': {
+                        'candidate': 'candidate:1 1 udp 2122260223 192.168.1.2 54321 typ host',
+                        'sdpMLineIndex': 0, 'sdpMid': '0'}}}
+        return {'type': 'chat', 'id': self.user_id, 'sender': self.user_id, 'text': 'load test message',
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ'), 'sent_at': sent_at}
+
+    async def drive(self, mix: Dict[str, float], rate: float, until: float):
+        types, weights = list(mix), list(mix.values())
+        # Random phase so clients don't all send on the same tick
+        await asyncio.sleep(random.uniform(0, 1 / rate))
+        while time.perf_counter() < until:
+            try:
+                await self.websocket.send(self.encode(self.next_message(random.choices(types, weights)[0])))
+                self.stats.sent += 1
+            except websockets.ConnectionClosed:
+                self.stats.errors += 1
+                return
+            await asyncio.sleep(random.expovariate(rate))
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self.reader is not None:
+            await self.reader
+
+
+def server_connections(http_url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(f'{http_url}/', timeout=5) as response:
+            return json.load(response).get('total_connections')
+    except Exception:
+        return None
+
+
+async def run(args) -> dict:
+    raise_fd_limit()
+    mix = {name: float(weight) for name, weight in (part.split('=') for part in args.mix.split(','))}
+    server = None if args.url else LocalServer(args.lag_interval)
+    if server:
+        await server.start()
+    url = args.url or server.url
+    http_url = url.replace('ws://', 'http://', 1).replace('wss://', 'https://', 1)
+    loop = asyncio.get_running_loop()
+
+    codec = protocol.MSGPACK if args.protocol == 'msgpack' else None
+    try:
+        stats = Stats()
+        rooms = max(1, args.clients // args.room_size)
+        room_peers: Dict[str, List[str]] = defaultdict(list)
+        clients = []
+        for index in range(args.clients):
+            room_id = f'load-room-{index % rooms}'
+            client = Client(index, room_id, room_peers[room_id], stats, codec)
+            room_peers[room_id].append(client.user_id)
+            clients.append(client)
+
+        rss_idle = server.request('report')['rss_bytes'] if server else None
+
+        # Connect phase
+        gate = asyncio.Semaphore(args.connect_concurrency)
+
+        async def connect(client):
+            async with gate:
+                try:
+                    await client.connect(url)
+                except Exception:
+                    stats.connect_failures += 1
+                    client.websocket = None
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(client) for client in clients))
+        connect_seconds = time.perf_counter() - started
+        connected = [client for client in clients if client.websocket is not None]
+        await asyncio.sleep(1.0)  # Let join broadcasts settle before measuring
+        rss_connected = server.request('report')['rss_bytes'] if server else None
+
+        # Traffic phase
+        if server:
+            server.request('reset')
+        stats.recording = True
+        started = time.perf_counter()
+        until = started + args.duration
+        await asyncio.gather(*(client.drive(mix, args.rate, until) for client in connected))
+        await asyncio.sleep(args.drain)
+        stats.recording = False
+        traffic_seconds = time.perf_counter() - started
+        server_report = server.request('report') if server else None
+
+        # Disconnect phase
+        started = time.perf_counter()
+        await asyncio.gather(*(client.close() for client in connected), return_exceptions=True)
+        remaining = None
+        deadline = time.perf_counter() + 30
+        while time.perf_counter() < deadline:
+            remaining = await loop.run_in_executor(None, server_connections, http_url)
+            if not remaining:
+                break
+            await asyncio.sleep(0.05)
+        disconnect_seconds = time.perf_counter() - started
+    finally:
+        if server:
+            server.stop()
+
+    all_latency = [value for values in stats.latency.values() for value in values]
+    return {
+        'config': {
+            'url': args.url or 'local', 'protocol': args.protocol, 'clients': args.clients,
+            'room_size': args.room_size, 'rate_per_client': args.rate, 'duration': args.duration, 'mix': mix,
+        },
+        'connect': {
+            'connected': len(connected),
+            'failed': stats.connect_failures,
+            'seconds': round(connect_seconds, 3),
+            'per_sec': round(len(connected) / connect_seconds, 1) if connect_seconds else None,
+            'latency_ms': percentiles(stats.connect_latency),
+        },
+        'traffic': {
+            'sent': stats.sent,
+            'delivered': stats.delivered,
+            'sent_per_sec': round(stats.sent / traffic_seconds, 1),
+            'delivered_per_sec': round(stats.delivered / traffic_seconds, 1),
+            'send_errors': stats.errors,
+            'latency_ms': percentiles(all_latency),
+            'latency_ms_by_type': {name: percentiles(values) for name, values in sorted(stats.latency.items())},
+        },
+        'server': {
+            'rss_idle_bytes': rss_idle,
+            'rss_connected_bytes': rss_connected,
+            'memory_per_connection_bytes': (
+                round((rss_connected - rss_idle) / len(connected)) if connected else None
+            ),
+            'loop_lag_ms': server_report['loop_lag_ms'],
+        } if server else None,
+        'disconnect': {
+            'seconds': round(disconnect_seconds, 3),
+            'server_connections_left': remaining,
+        },
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Compare the headline numbers against a previous run"""
+    checks = [
+        # (label, path, higher_is_worse)
+        ('traffic p99 latency', ('traffic', 'latency_ms', 'p99'), True),
+        ('traffic p50 latency', ('traffic', 'latency_ms', 'p50'), True),
+        ('delivered/sec', ('traffic', 'delivered_per_sec'), False),
+        ('connect p99 latency', ('connect', 'latency_ms', 'p99'), True),
+        ('memory per connection', ('server', 'memory_per_connection_bytes'), True),
+        ('loop lag p99', ('server', 'loop_lag_ms', 'p99'), True),
+        ('disconnect seconds', ('disconnect', 'seconds'), True),
+    ]
+    found = []
+    for label, path, higher_is_worse in checks:
+        current, previous = result, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (change > tolerance) if higher_is_worse else (change < -tolerance):
+            found.append(f'{label}: {previous} -> {current} ({change:+.0%})')
+    return found
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='', help='ws://host:port of a running server (default: start one locally)')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--room-size', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=2.0, help='messages per second per client')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of traffic')
+    parser.add_argument('--drain', type=float, default=1.0, help='seconds to wait for in-flight deliveries')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='message type weights')
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--lag-interval', type=float, default=0.01, help='event-loop lag probe interval (s)')
+    parser.add_argument('--protocol', choices=['json', 'msgpack'], default='json')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON result to this file')
+    parser.add_argument('--baseline', help='previous result to compare against; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative change vs baseline')
+    args = parser.parse_args()
+    if args.protocol == 'msgpack' and protocol.MSGPACK is None:
+        parser.error('--protocol msgpack needs the msgpack package (pip install msgpack)')
+
+    random.seed(args.seed)
+    result = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            result['regressions'] = regressions(result, json.load(baseline_file), args.tolerance)
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    sys.exit(1 if result.get('regressions') else 0)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,83 @@
+"""Cold-start time of the server.
+
+Runs `--runs` fresh processes and reports, as p50/max milliseconds:
+
+  import_ms   `import main` in a new interpreter (the part we control)
+  health_ms   spawning uvicorn until GET /health first answers 200
+
+Firebase connects in the background, so neither number waits on it. With
+--target-ms the exit status is 1 when the p50 time to /health is over it.
+
+    cd backend && python -m bench.startup --runs 5 --target-ms 2000
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_import() -> float:
+    code = 'import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def time_health(timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f'/health did not answer within {timeout}s')
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def summary(values) -> dict:
+    ordered = sorted(values)
+    return {'p50': round(ordered[len(ordered) // 2], 1), 'max': round(ordered[-1], 1)}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for /health')
+    parser.add_argument('--target-ms', type=float, help='fail when the p50 time to /health exceeds this')
+    args = parser.parse_args()
+
+    result = {
+        'runs': args.runs,
+        'import_ms': summary([time_import() for _ in range(args.runs)]),
+        'health_ms': summary([time_health(args.timeout) for _ in range(args.runs)]),
+    }
+    if args.target_ms is not None:
+        result['target_ms'] = args.target_ms
+        result['within_target'] = result['health_ms']['p50'] <= args.target_ms
+    print(json.dumps(result, indent=2))
+    if result.get('within_target') is False:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
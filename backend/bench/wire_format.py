@@ -0,0 +1,198 @@
+"""Bytes on the wire and encode/decode CPU per message type, JSON vs MessagePack.
+
+For each message type builds `--variants` realistic messages (varying
+coordinates, text and ids) and reports:
+
+  json_bytes / msgpack_bytes      mean frame size before compression
+  *_deflate_bytes                 after permessage-deflate with context takeover
+                                  (the default browsers and uvicorn negotiate)
+  *_deflate_isolated_bytes        after deflate without context (each frame alone)
+  encode_ns / decode_ns           per message, for each encoding
+  deflate_ns                      per message, compressing the JSON frame
+
+    cd backend && python -m bench.wire_format --variants 200 --repeat 20
+"""
+import argparse
+import json
+import logging
+import random
+import string
+import time
+import uuid
+import zlib
+from typing import Callable, Dict, List
+
+import protocol
+from outbound import encode_message
+
+
+def user_id() -> str:
+    return uuid.uuid4().hex[:28]
+
+
+def point() -> dict:
+    return {'x': round(random.uniform(0, 1200), 2), 'y': round(random.uniform(0, 800), 2)}
+
+
+def draw() -> dict:
+    sender = user_id()
+    return {'type': 'draw', 'id': sender, 'from': point(), 'to': point(), 'sender': sender}
+
+
+def draw_batch(segments: int = 12) -> dict:
+    sender = user_id()
+    return {'type': 'draw_batch', 'sender': sender,
+            'messages': [{'id': sender, 'from': point(), 'to': point()} for _ in range(segments)]}
+
+
+def chat() -> dict:
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(10)]
+    sender = user_id()
+    return {'type': 'chat', 'id': sender, 'sender': sender, 'text': ' '.join(words),
+            'timestamp': '2024-05-01T12:34:56.789Z', 'seq': random.randint(1, 5000)}
+
+
+def sdp() -> str:
+    """A browser-like offer: one audio and one video section with codecs, ICE and DTLS lines"""
+    fingerprint = ':'.join(f'{random.randrange(256):02X}' for _ in range(32))
+    ufrag, pwd = uuid.uuid4().hex[:4], uuid.uuid4().hex[:24]
+    lines = ['v=0', f'o=- {random.getrandbits(62)} 2 IN IP4 127.0.0.1', 's=-', 't=0 0',
+             'a=group:BUNDLE 0 1', 'a=extmap-allow-mixed', 'a=msid-semantic: WMS stream']
+    for mid, (kind, payloads) in enumerate((('audio', [111, 63, 9, 0, 8, 13, 110, 126]),
+                                            ('video', [96, 97, 98, 99, 100, 101, 102, 103, 104, 105, 106, 107]))):
+        lines += [f'm={kind} 9 UDP/TLS/RTP/SAVPF {" ".join(map(str, payloads))}', 'c=IN IP4 0.0.0.0',
+                  'a=rtcp:9 IN IP4 0.0.0.0', f'a=ice-ufrag:{ufrag}', f'a=ice-pwd:{pwd}',
+                  'a=ice-options:trickle', f'a=fingerprint:sha-256 {fingerprint}', 'a=setup:actpass',
+                  f'a=mid:{mid}', 'a=sendrecv', 'a=rtcp-mux', 'a=rtcp-rsize']
+        for payload in payloads:
+            codec = 'opus/48000/2' if kind == 'audio' else random.choice(['VP8/90000', 'VP9/90000', 'H264/90000'])
+            lines += [f'a=rtpmap:{payload} {codec}', f'a=rtcp-fb:{payload} transport-cc',
+                      f'a=fmtp:{payload} minptime=10;useinbandfec=1' if kind == 'audio'
+                      else f'a=fmtp:{payload} level-asymmetry-allowed=1;packetization-mode=1']
+        lines.append(f'a=ssrc:{random.getrandbits(31)} cname:{uuid.uuid4().hex[:16]}')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def signal_offer() -> dict:
+    sender = user_id()
+    return {'type': 'signal', 'id': sender, 'sender': sender, 'target': user_id(),
+            'signal': {'type': 'offer', 'sdp': sdp()}}
+
+
+def signal_candidate() -> dict:
+    sender = user_id()
+    return {'type': 'signal', 'id': sender, 'sender': sender, 'target': user_id(),
+            'signal': {'candidate': {
+                'candidate': f'candidate:{random.getrandbits(32)} 1 udp 2122260223 192.168.1.{random.randint(2, 254)} '
+                             f'{random.randint(40000, 65000)} typ host generation 0 ufrag {uuid.uuid4().hex[:4]}',
+                'sdpMLineIndex': 0, 'sdpMid': '0'}}}
+
+
+def participants_list(size: int = 10) -> dict:
+    return {'type': 'participants_list', 'participants': [
+        {'id': user_id(), 'name': f'User {i}', 'email': f'user{i}@example.com',
+         'avatar': f'https://lh3.googleusercontent.com/a/{uuid.uuid4().hex}', 'firebaseUid': user_id(),
+         'displayName': f'User {i}', 'office_id': 'office-1', 'role': 'member',
+         'joined_at': '2024-05-01T12:00:00.000000', 'room_id': 'room-1'}
+        for i in range(size)
+    ]}
+
+
+def whiteboard_snapshot(strokes: int = 40, points: int = 30) -> dict:
+    return {'type': 'whiteboard_snapshot', 'strokes': [
+        [value for _ in range(points) for value in point().values()] for _ in range(strokes)
+    ]}
+
+
+def ping() -> dict:
+    return {'type': 'ping'}
+
+
+MESSAGES: Dict[str, Callable[[], dict]] = {
+    'draw': draw,
+    'draw_batch': draw_batch,
+    'chat': chat,
+    'signal_offer': signal_offer,
+    'signal_candidate': signal_candidate,
+    'participants_list': participants_list,
+    'whiteboard_snapshot': whiteboard_snapshot,
+    'ping': ping,
+}
+
+
+def per_call_ns(func: Callable, values: list, repeat: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(repeat):
+        for value in values:
+            func(value)
+    return (time.perf_counter_ns() - started) / (repeat * len(values))
+
+
+def deflated_sizes(frames: List[bytes], context: bool) -> List[int]:
+    """Frame sizes after permessage-deflate (raw deflate, sync flush, trailing 4 bytes stripped)"""
+    sizes = []
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15, 5)
+    for frame in frames:
+        if not context:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15, 5)
+        data = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        sizes.append(len(data) - 4)
+    return sizes
+
+
+def mean(values) -> float:
+    values = list(values)
+    return round(sum(values) / len(values), 1)
+
+
+def measure(messages: List[dict], repeat: int) -> dict:
+    codec = protocol.MSGPACK
+    json_frames = [encode_message(message) for message in messages]
+    json_bytes = [frame.encode('utf-8') for frame in json_frames]
+    result = {
+        'json_bytes': mean(len(frame) for frame in json_bytes),
+        'json_deflate_bytes': mean(deflated_sizes(json_bytes, context=True)),
+        'json_deflate_isolated_bytes': mean(deflated_sizes(json_bytes, context=False)),
+        'json_encode_ns': round(per_call_ns(encode_message, messages, repeat)),
+        'json_decode_ns': round(per_call_ns(json.loads, json_frames, repeat)),
+    }
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15, 5)
+    result['deflate_ns'] = round(per_call_ns(
+        lambda frame: compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH), json_bytes, repeat))
+
+    if codec is not None:
+        binary_frames = [codec.encode(message) for message in messages]
+        result.update({
+            'msgpack_bytes': mean(len(frame) for frame in binary_frames),
+            'msgpack_deflate_bytes': mean(deflated_sizes(binary_frames, context=True)),
+            'msgpack_deflate_isolated_bytes': mean(deflated_sizes(binary_frames, context=False)),
+            'msgpack_encode_ns': round(per_call_ns(codec.encode, messages, repeat)),
+            'msgpack_decode_ns': round(per_call_ns(codec.decode, binary_frames, repeat)),
+            # What a fan-out pays once when any binary client is in the room
+            'msgpack_from_json_ns': round(per_call_ns(codec.from_json_frame, json_frames, repeat)),
+        })
+        result['msgpack_saved_pct'] = round(100 * (1 - result['msgpack_bytes'] / result['json_bytes']), 1)
+    result['json_deflate_saved_pct'] = round(100 * (1 - result['json_deflate_bytes'] / result['json_bytes']), 1)
+    return result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', type=int, default=200, help='distinct messages per type')
+    parser.add_argument('--repeat', type=int, default=20, help='timing passes over the variants')
+    parser.add_argument('--types', default=','.join(MESSAGES), help='comma-separated message types')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    logging.disable(logging.INFO)
+    results = {'msgpack_available': protocol.MSGPACK is not None}
+    for name in args.types.split(','):
+        messages = [MESSAGES[name]() for _ in range(args.variants)]
+        results[name] = measure(messages, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,185 @@
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Deque, Optional, Tuple
+import json
+import logging
+import os
+import uuid
+
+from outbound import encode_message
+
+logger = logging.getLogger(__name__)
+
+
+class RoomChat:
+    """Ring buffer of one room's recent chat messages, oldest first"""
+
+    __slots__ = ('epoch', 'messages', 'next_seq', 'nbytes')
+
+    def __init__(self, epoch: Optional[str] = None):
+        # Sequence numbers restart when a room is recreated; the epoch tells clients apart from the old ones
+        self.epoch = epoch or uuid.uuid4().hex[:8]
+        self.messages: Deque[Tuple[dict, int]] = deque()  # (message with 'seq', encoded size)
+        self.next_seq = 1
+        self.nbytes = 0
+
+    @property
+    def first_seq(self) -> int:
+        return self.messages[0][0]['seq'] if self.messages else self.next_seq
+
+
+class ChatHistory:
+    """Recent chat per room, numbered so clients can ask for just what they missed
+
+    Each room keeps at most `max_messages` messages and `max_bytes` of encoded
+    JSON; the oldest go first. At most `max_rooms` rooms are kept, least
+    recently active evicted first. Each room's sequence numbers belong to
+    its epoch; a last_seq from another epoch (a restart without the log, or
+    a room evicted and recreated) means "send everything".
+
+    With `log_path` set, messages are also appended to a JSON-lines file that
+    is replayed (and compacted) on startup, and compacted again by flush()
+    once it grows past `compact_ratio` times what is still kept.
+    """
+
+    def __init__(self, max_messages: int = 200, max_bytes: int = 256 * 1024, max_rooms: int = 1000,
+                 log_path: Optional[str] = None, compact_ratio: float = 4):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_rooms = max_rooms
+        self.rooms: 'OrderedDict[str, RoomChat]' = OrderedDict()  # least recently active first
+        self.log_path = log_path
+        self.compact_ratio = compact_ratio
+        self._log = None
+        self.log_bytes = 0  # Written to the log since it was last compacted, as encoded characters
+        self.compactions = 0
+        self.evicted_rooms = 0
+        if log_path:
+            self._load(log_path)
+
+    def record(self, room_id: str, message: dict) -> int:
+        """Number a chat message (sets message['seq'] and ['epoch']) and keep it; returns the seq"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = self.rooms[room_id] = RoomChat()
+            if len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+                self.evicted_rooms += 1
+        else:
+            self.rooms.move_to_end(room_id)
+
+        message['seq'] = room.next_seq
+        message['epoch'] = room.epoch  # Lets clients that never sent chat resume against this numbering
+        room.next_seq += 1
+        self._append(room, message)
+        if self._log:
+            line = encode_message({'room': room_id, 'epoch': room.epoch, 'msg': message}) + '\n'
+            self._log.write(line)
+            self.log_bytes += len(line)
+        return message['seq']
+
+    def _append(self, room: RoomChat, message: dict):
+        size = len(encode_message(message))
+        room.messages.append((message, size))
+        room.nbytes += size
+        while room.messages and (len(room.messages) > self.max_messages or room.nbytes > self.max_bytes):
+            room.nbytes -= room.messages.popleft()[1]
+
+    def since(self, room_id: str, last_seq: Optional[int] = None, epoch: Optional[str] = None) -> dict:
+        """The chat_history frame for a client that has seen up to last_seq (None = nothing)"""
+        if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+            last_seq = None  # Straight from the client; anything else means "nothing seen"
+        room = self.rooms.get(room_id)
+        if room is None:
+            return {'type': 'chat_history', 'room_id': room_id, 'epoch': None, 'last_seq': 0,
+                    'truncated': bool(last_seq), 'messages': []}
+        if last_seq is None or epoch != room.epoch:
+            last_seq = 0
+        first_seq = room.first_seq
+        start = max(0, last_seq - first_seq + 1)
+        return {
+            'type': 'chat_history',
+            'room_id': room_id,
+            'epoch': room.epoch,
+            'last_seq': room.next_seq - 1,
+            'truncated': 0 < last_seq < first_seq - 1,  # Some messages after last_seq are no longer kept
+            'messages': [message for message, _ in islice(room.messages, start, None)],
+        }
+
+    def flush(self):
+        """Push appended lines to the OS; called periodically rather than per message
+
+        Also compacts the log when most of it is messages no longer kept.
+        """
+        if not self._log:
+            return
+        self._log.flush()
+        # The cheap check first: the log can't be compact_ratio times the kept bytes until it's that times one room
+        if self.log_bytes > self.compact_ratio * self.max_bytes and \
+                self.log_bytes > self.compact_ratio * sum(room.nbytes for room in self.rooms.values()):
+            try:
+                self.compact()
+            except OSError as e:
+                logger.error(f"❌ Chat history log {self.log_path} not compacted, still appending: {e}")
+
+    def compact(self):
+        """Rewrite the log with only what is still kept"""
+        if self._log:
+            self._log.close()
+            self._log = None
+        try:
+            self._rewrite(self.log_path)
+        finally:
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+        self.compactions += 1
+
+    def close(self):
+        if self._log:
+            self._log.close()
+            self._log = None
+
+    def _load(self, path: str):
+        """Replay the log, then rewrite it with only what is still kept"""
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as log:
+                    for line in log:
+                        entry = json.loads(line)
+                        message = entry['msg']
+                        room = self.rooms.get(entry['room'])
+                        if room is None or room.epoch != entry['epoch']:
+                            room = self.rooms[entry['room']] = RoomChat(entry['epoch'])
+                        self.rooms.move_to_end(entry['room'])
+                        room.next_seq = message['seq'] + 1
+                        self._append(room, message)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"❌ Chat history log {path} unreadable, keeping what loaded: {e}")
+            while len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+
+        self._rewrite(path)
+        self._log = open(path, 'a', encoding='utf-8')
+        logger.info(f"💬 Loaded chat history for {len(self.rooms)} rooms from {path}")
+
+    def _rewrite(self, path: str):
+        temporary = f"{path}.tmp"
+        written = 0
+        with open(temporary, 'w', encoding='utf-8') as log:
+            for room_id, room in self.rooms.items():
+                for message, _ in room.messages:
+                    line = encode_message({'room': room_id, 'epoch': room.epoch, 'msg': message}) + '\n'
+                    log.write(line)
+                    written += len(line)
+        os.replace(temporary, path)
+        self.log_bytes = written
+
+    def stats(self) -> dict:
+        return {
+            'rooms': len(self.rooms),
+            'messages': sum(len(room.messages) for room in self.rooms.values()),
+            'bytes': sum(room.nbytes for room in self.rooms.values()),
+            'evicted_rooms': self.evicted_rooms,
+            'persistent': self._log is not None,
+            'log_bytes': self.log_bytes,
+            'compactions': self.compactions,
+        }
@@ -0,0 +1,130 @@
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    from registry import Connection
+
+PRESENCE_SCOPES = ('office', 'rooms', 'none')
+ROOM_TOPICS = ('whiteboard', 'chat')
+# Room traffic a client can opt out of, by message type; every other type goes to the whole room
+TOPICS = {'draw': 'whiteboard', 'draw_batch': 'whiteboard', 'clear': 'whiteboard', 'chat': 'chat'}
+MAX_PRESENCE_ROOMS = 64
+
+
+class Interest:
+    """What a connection wants beyond messages addressed to it
+
+    presence is 'office' (every presence change in the office), 'rooms'
+    (only changes touching `rooms`) or 'none'; topics are the room traffic
+    it still receives. The default is everything, which is what clients got
+    before they could subscribe.
+    """
+
+    __slots__ = ('presence', 'rooms', 'topics')
+
+    def __init__(self, presence: str = 'office', rooms: Iterable[str] = (), topics: Iterable[str] = ROOM_TOPICS):
+        self.presence = presence
+        self.rooms: FrozenSet[str] = frozenset(rooms)
+        self.topics: FrozenSet[str] = frozenset(topics)
+
+    def update(self, request: dict) -> 'Interest':
+        """A copy with the fields present in a subscribe request changed; ValueError if one is malformed"""
+        presence = request.get('presence', self.presence)
+        if presence not in PRESENCE_SCOPES:
+            raise ValueError(f"presence must be one of {', '.join(PRESENCE_SCOPES)}")
+        rooms = request.get('rooms', self.rooms)
+        if not isinstance(rooms, (list, frozenset)) or not all(isinstance(room, str) for room in rooms):
+            raise ValueError("rooms must be a list of room ids")
+        if len(rooms) > MAX_PRESENCE_ROOMS:
+            raise ValueError(f"at most {MAX_PRESENCE_ROOMS} presence rooms")
+        topics = set(self.topics)
+        for topic in ROOM_TOPICS:
+            if topic in request:
+                if not isinstance(request[topic], bool):
+                    raise ValueError(f"{topic} must be true or false")
+                (topics.add if request[topic] else topics.discard)(topic)
+        return Interest(presence, rooms, topics)
+
+    def presence_rooms(self) -> Optional[FrozenSet[str]]:
+        """Rooms presence is limited to; None for the whole office"""
+        return self.rooms if self.presence == 'rooms' else None
+
+    def to_dict(self) -> dict:
+        return {'presence': self.presence, 'rooms': sorted(self.rooms),
+                **{topic: topic in self.topics for topic in ROOM_TOPICS}}
+
+
+EVERYTHING = Interest()
+
+
+class InterestIndex:
+    """Subscribers per room topic and per presence scope
+
+    A fan-out walks only the connections that asked for what it sends, so a
+    presence change costs the office-wide subscribers plus those watching the
+    rooms it touches, not every socket in the office. Kept in step with the
+    registry by its add()/remove().
+    """
+
+    def __init__(self):
+        self.room_topics: Dict[str, Dict[str, Dict[int, 'Connection']]] = {}  # room_id -> topic -> {id: record}
+        self.office_presence: Dict[str, Dict[int, 'Connection']] = {}  # office_id -> {id: record}
+        self.room_presence: Dict[Tuple[str, str], Dict[int, 'Connection']] = {}  # (office_id, room_id) -> {id: record}
+
+    def add(self, connection: 'Connection'):
+        interest = connection.interest
+        if connection.room_id is not None:
+            topics = self.room_topics.setdefault(connection.room_id, {})
+            for topic in interest.topics:
+                topics.setdefault(topic, {})[connection.id] = connection
+        if connection.office_id is None:
+            return  # Not joined yet: no presence
+        if interest.presence == 'office':
+            self.office_presence.setdefault(connection.office_id, {})[connection.id] = connection
+        elif interest.presence == 'rooms':
+            for room_id in interest.rooms:
+                self.room_presence.setdefault((connection.office_id, room_id), {})[connection.id] = connection
+
+    def remove(self, connection: 'Connection'):
+        interest = connection.interest
+        if connection.room_id is not None:
+            topics = self.room_topics.get(connection.room_id, {})
+            for topic in interest.topics:
+                self._discard(topics, topic, connection)
+            if not topics:
+                self.room_topics.pop(connection.room_id, None)
+        if connection.office_id is None:
+            return
+        if interest.presence == 'office':
+            self._discard(self.office_presence, connection.office_id, connection)
+        elif interest.presence == 'rooms':
+            for room_id in interest.rooms:
+                self._discard(self.room_presence, (connection.office_id, room_id), connection)
+
+    @staticmethod
+    def _discard(index: dict, key, connection: 'Connection'):
+        bucket = index.get(key)
+        if bucket is None or bucket.get(connection.id) is not connection:
+            return
+        del bucket[connection.id]
+        if not bucket:
+            del index[key]
+
+    def room(self, room_id: str, topic: str) -> Iterator['Connection']:
+        return iter(self.room_topics.get(room_id, {}).get(topic, {}).values())
+
+    def presence(self, office_id: str, room_ids: Iterable[str]) -> Iterator['Connection']:
+        """Everyone who should see a presence change touching room_ids, once each"""
+        yield from self.office_presence.get(office_id, {}).values()
+        seen = set()
+        for room_id in room_ids:
+            for connection in self.room_presence.get((office_id, room_id), {}).values():
+                if connection.id not in seen:
+                    seen.add(connection.id)
+                    yield connection
+
+    def stats(self) -> dict:
+        return {
+            'office_presence': sum(len(bucket) for bucket in self.office_presence.values()),
+            'room_presence': sum(len(bucket) for bucket in self.room_presence.values()),
+            'rooms': len(self.room_topics),
+        }
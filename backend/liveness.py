@@ -0,0 +1,136 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import math
+import time
+
+from registry import Connection
+
+logger = logging.getLogger(__name__)
+
+
+class LivenessSweeper:
+    """Pings idle connections and evicts the ones that stop answering
+
+    Connections sit in a hashed timing wheel (one slot per `tick` seconds)
+    under the time they next need looking at. Receiving a frame only
+    updates connection.last_seen, so the wheel is never touched on the
+    message path. When a slot comes due each of its connections is either:
+
+      - idle for less than `interval`: rescheduled for last_seen + interval
+      - idle for `interval` or more: pinged, rechecked at last_seen + timeout
+      - idle for `timeout` or more: evicted, if it answers pings
+
+    Clients that never said they answer pings (connection.answers_pings) are
+    pinged every `interval` but never evicted; older clients only send traffic
+    when their user does something. Dead TCP under them is still caught by
+    the server's protocol-level WebSocket pings.
+
+    Each connection is visited about once per interval, so a sweep costs
+    O(connections / interval) per second, spread evenly over the ticks.
+    """
+
+    def __init__(self, ping: Callable[[Connection], None], evict: Callable[[Connection], None],
+                 report: Optional[Callable[[Connection], Awaitable[None]]] = None,
+                 interval: float = 15.0, timeout: float = 45.0, tick: float = 1.0):
+        self.ping = ping
+        self.evict = evict
+        self.report = report  # Called for connections seen since their last report (e.g. Firebase last_seen)
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self.slots: List[Dict[int, Connection]] = [{} for _ in range(math.ceil(timeout / tick) + 2)]
+        self.cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.tracked = 0
+        self.pings = 0
+        self.evicted = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def track(self, connection: Connection):
+        connection.last_seen = time.monotonic()
+        self._schedule(connection, connection.last_seen + self.interval)
+        self.tracked += 1
+
+    def untrack(self, connection: Connection):
+        if connection.sweep_slot is not None:
+            if self.slots[connection.sweep_slot].pop(connection.id, None) is not None:
+                self.tracked -= 1
+            connection.sweep_slot = None
+
+    @staticmethod
+    def touch(connection: Connection):
+        connection.last_seen = time.monotonic()
+
+    def _schedule(self, connection: Connection, at: float):
+        ticks = math.ceil((at - time.monotonic()) / self.tick)
+        ticks = min(max(ticks, 1), len(self.slots) - 1)
+        index = (self.cursor + ticks) % len(self.slots)
+        self.slots[index][connection.id] = connection
+        connection.sweep_slot = index
+
+    def advance(self) -> List[Connection]:
+        """Process the next slot; returns live connections whose activity should be reported"""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        due, self.slots[self.cursor] = self.slots[self.cursor], {}
+        now = time.monotonic()
+        to_report = []
+
+        for connection in due.values():
+            connection.sweep_slot = None
+            idle = now - connection.last_seen
+            if idle >= self.timeout and connection.answers_pings:
+                self.tracked -= 1
+                self.evicted += 1
+                try:
+                    self.evict(connection)
+                except Exception as e:
+                    logger.error(f"❌ Failed to evict connection {connection.id}: {e}")
+                continue
+
+            if idle >= self.interval:
+                self.ping(connection)
+                self.pings += 1
+                if connection.answers_pings:
+                    self._schedule(connection, connection.last_seen + self.timeout)
+                else:
+                    self._schedule(connection, now + self.interval)
+            else:
+                self._schedule(connection, connection.last_seen + self.interval)
+            if connection.last_seen != connection.reported_seen:
+                connection.reported_seen = connection.last_seen
+                to_report.append(connection)
+        return to_report
+
+    async def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # Catch up on ticks missed while the loop was busy
+            while next_tick <= time.monotonic():
+                next_tick += self.tick
+                for connection in self.advance():
+                    if self.report:
+                        try:
+                            await self.report(connection)
+                        except Exception as e:
+                            logger.error(f"❌ Failed to report activity: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'tracked': self.tracked,
+            'interval_seconds': self.interval,
+            'timeout_seconds': self.timeout,
+            'pings': self.pings,
+            'evicted': self.evicted,
+        }
@@ -0,0 +1,110 @@
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+import atexit
+import json
+import logging
+import queue
+import time
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is a structured field
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, plus any `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread
+
+    The stock prepare() formats the message in the calling thread; records
+    never leave this process, so they can be queued as they are.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(level: str = "INFO", fmt: str = "text") -> QueueListener:
+    """Route all logging through a queue so the event loop never waits on stderr or disk
+
+    Records are formatted and written by a listener thread; the caller pays
+    for building the record and one queue put.
+    """
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers[:] = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level.upper())
+    listener.start()
+    atexit.register(listener.stop)  # Flush what's queued on exit
+    return listener
+
+
+class HotPathLog:
+    """Per-message log lines, off by default and rate-limited per (event, room, type)
+
+    log() is a level check when the level is disabled. When enabled, each
+    (event, room, type) key gets at most `per_second` lines per second; the
+    next line that gets through reports how many were suppressed. Arguments
+    are only formatted by the listener thread, and only for lines emitted.
+    """
+
+    LABELS = {'received': '📥 Received from', 'broadcast': '📡 Broadcasting to'}
+
+    def __init__(self, logger: logging.Logger, level: int = logging.DEBUG, per_second: float = 1.0,
+                 max_keys: int = 10000):
+        self.logger = logger
+        self.level = level
+        self.per_second = per_second
+        self.max_keys = max_keys
+        self._windows: Dict[Tuple[str, str, str], list] = {}  # key -> [window start, lines, suppressed]
+
+    def log(self, event: str, room_id: str, message_type: Optional[str]):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        message_type = message_type if message_type and isinstance(message_type, str) else 'unknown'  # Part of a dict key
+        suppressed = 0
+        if self.per_second > 0:
+            key = (event, room_id, message_type)
+            now = time.monotonic()
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 1.0:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._prune(now)
+                window = self._windows[key] = [now, 0, 0]
+            if window[1] >= self.per_second:
+                window[2] += 1
+                return
+            window[1] += 1
+
+        self.logger.log(
+            self.level, "%s room %s: %s message%s", self.LABELS.get(event, event), room_id, message_type,
+            f" (+{suppressed} suppressed)" if suppressed else "",
+            extra={'event': event, 'room_id': room_id, 'type': message_type, 'suppressed': suppressed}
+        )
+
+    def _prune(self, now: float):
+        for key in [key for key, window in self._windows.items() if now - window[0] >= 1.0]:
+            del self._windows[key]
@@ -1,22 +1,171 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+import time
+
+_import_started = time.perf_counter()  # Startup timing, reported by GET / and logged when ready
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, List, Optional
 import json
 import logging
+import math
+import random
+import signal
 import uuid
-from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore, db as firebase_db
-import pyrebase
+from datetime import datetime, timedelta
 import os
 import asyncio
+import secrets
+import threading
+from outbound import OutboundQueue, OverflowPolicy, coalesce_key, encode_message
+from write_behind import FirebaseWriteBehind
+from presence import PresenceCache
+from registry import Connection, ConnectionRegistry
+from backplane import Backplane, InProcessBackplane, create_backplane
+from whiteboard import WhiteboardStore
+from chat_history import ChatHistory
+from sessions import SessionStore
+from interest import EVERYTHING, TOPICS, Interest
+import protocol
+from batching import MessageBatcher
+from profiler import SamplingProfiler
+from logs import HotPathLog, configure_logging
+from liveness import LivenessSweeper
+from ratelimit import (FRAME_TOO_BIG_CLOSE_CODE, RATE_LIMIT_CLOSE_CODE, RateLimitAction, RateLimiter,
+                       parse_limits)
+import metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (written from a background thread; LOG_FORMAT=json for structured output)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Per-message lines (received/broadcast): level, and max lines per second per room and type (0 = no limit)
+LOG_HOT_PATH_LEVEL = getattr(logging, os.getenv("LOG_HOT_PATH_LEVEL", "DEBUG").upper())
+LOG_HOT_PATH_RATE = float(os.getenv("LOG_HOT_PATH_RATE", "1"))
+
+configure_logging(LOG_LEVEL, LOG_FORMAT)
 logger = logging.getLogger(__name__)
+message_log = HotPathLog(logger, LOG_HOT_PATH_LEVEL, LOG_HOT_PATH_RATE)
+
+# Per-connection outbound queue settings
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+SEND_QUEUE_POLICY = OverflowPolicy(os.getenv("WS_SEND_QUEUE_POLICY", OverflowPolicy.DROP_OLDEST.value))
+
+# Firebase connection: made in the background after startup, retried with backoff
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "serviceAccountKey.json")
+FIREBASE_DATABASE_URL = os.getenv("FIREBASE_DATABASE_URL", "https://typio-57fa9.firebaseio.com")
+FIREBASE_CONNECT_MAX_BACKOFF = float(os.getenv("FIREBASE_CONNECT_MAX_BACKOFF", "60"))  # seconds
+
+# Firebase write-behind settings
+FIREBASE_FLUSH_INTERVAL = float(os.getenv("FIREBASE_FLUSH_INTERVAL", "0.05"))
+FIREBASE_MAX_WORKERS = int(os.getenv("FIREBASE_MAX_WORKERS", "4"))
+
+# Cross-worker backplane ("" = single node; redis://host:6379/0 or unix:///path/redis.sock)
+BACKPLANE_URL = os.getenv("BACKPLANE_URL", "")
+
+# Whiteboard stroke log settings
+WHITEBOARD_MAX_BYTES_PER_ROOM = int(os.getenv("WHITEBOARD_MAX_BYTES_PER_ROOM", str(1024 * 1024)))
+WHITEBOARD_COMPACT_EVERY = int(os.getenv("WHITEBOARD_COMPACT_EVERY", "512"))  # segments
+WHITEBOARD_COMPACT_INTERVAL = float(os.getenv("WHITEBOARD_COMPACT_INTERVAL", "30"))  # seconds
+
+# Chat history: per-room ring buffer caps, LRU room cap, optional append-only log file
+CHAT_HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", "200"))
+CHAT_HISTORY_BYTES = int(os.getenv("CHAT_HISTORY_BYTES", str(256 * 1024)))
+CHAT_HISTORY_ROOMS = int(os.getenv("CHAT_HISTORY_ROOMS", "1000"))
+CHAT_LOG_PATH = os.getenv("CHAT_LOG_PATH", "")
+CHAT_LOG_FLUSH_INTERVAL = float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1"))  # seconds
+
+# Session resumption: how long a dropped participant is held for a reconnect, and what is buffered meanwhile
+SESSION_GRACE_SECONDS = float(os.getenv("SESSION_GRACE_SECONDS", "30"))  # 0 disables resumption
+SESSION_REPLAY_FRAMES = int(os.getenv("SESSION_REPLAY_FRAMES", "128"))  # beyond this the client gets a fresh snapshot
+
+# High-frequency message batching: comma-separated types, window in ms (0 disables)
+BATCH_TYPES = [t.strip() for t in os.getenv("WS_BATCH_TYPES", "draw").split(",") if t.strip()]
+BATCH_WINDOW_MS = float(os.getenv("WS_BATCH_WINDOW_MS", "25"))
+
+# Liveness: ping connections idle for LIVENESS_PING_INTERVAL, evict after LIVENESS_TIMEOUT of silence
+# (only clients that answer pings: 'ping' in join capabilities, or any pong received)
+LIVENESS_PING_INTERVAL = float(os.getenv("LIVENESS_PING_INTERVAL", "15"))
+LIVENESS_TIMEOUT = float(os.getenv("LIVENESS_TIMEOUT", "45"))
+LIVENESS_CLOSE_CODE = 1001  # Going away
+PING_KEY, PING_FRAME = coalesce_key({'type': 'ping'}), encode_message({'type': 'ping'})
+# Firebase participant nodes not refreshed for this long are leftovers from crashed workers
+FIREBASE_STALE_AFTER = float(os.getenv("FIREBASE_STALE_AFTER", "300"))
+FIREBASE_REAP_INTERVAL = float(os.getenv("FIREBASE_REAP_INTERVAL", "300"))
+
+# Rate limits as type=rate/burst (tokens per second), '*' for other types; "off" disables
+RATE_LIMITS = parse_limits(os.getenv(
+    "WS_RATE_LIMITS", "draw=200/400,chat=5/20,signal=50/200,clear=2/5,*=20/50"))
+ROOM_RATE_LIMITS = parse_limits(os.getenv(
+    "WS_ROOM_RATE_LIMITS", "draw=2000/4000,chat=50/100,signal=500/1000,*=300/600"))
+RATE_LIMIT_ACTION = RateLimitAction(os.getenv("WS_RATE_LIMIT_ACTION", RateLimitAction.DROP.value))
+MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(64 * 1024)))
+
+# Graceful drain (SIGTERM or POST /admin/drain): sockets are closed in DRAIN_BATCHES evenly spaced batches
+# over DRAIN_SECONDS; clients are told to wait a random 0..DRAIN_RECONNECT_JITTER_MS before reconnecting
+DRAIN_SECONDS = float(os.getenv("DRAIN_SECONDS", "8"))
+DRAIN_BATCHES = int(os.getenv("DRAIN_BATCHES", "16"))
+DRAIN_RECONNECT_JITTER_MS = int(os.getenv("DRAIN_RECONNECT_JITTER_MS", "5000"))
+DRAIN_ON_SIGTERM = os.getenv("DRAIN_ON_SIGTERM", "true").lower() in ("1", "true", "yes")
+DRAIN_CLOSE_CODE = 1012  # Service restart
 
-app = FastAPI(title="Virtual Office WebSocket Server", version="1.0.0")
+# Observability: event-loop lag probe interval, and the token that unlocks /debug endpoints (unset = disabled)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here waits on Firebase: it connects in the background while we serve from memory
+    firebase_participants.start()
+    await manager.start()
+    app.state.loop_lag_task = asyncio.create_task(metrics.monitor_loop_lag(LOOP_LAG_INTERVAL))
+    if DRAIN_ON_SIGTERM:
+        _install_drain_on_sigterm()
+    startup_timings['ready_seconds'] = round(time.perf_counter() - _import_started, 3)
+    logger.info(
+        f"🚀 Ready in {startup_timings['ready_seconds'] * 1000:.0f}ms"
+        f" (imports {startup_timings['import_seconds'] * 1000:.0f}ms)"
+    )
+    
+    yield
+    
+    app.state.loop_lag_task.cancel()
+    profiler.stop()
+    # Don't lose queued joins/leaves when the process stops
+    await manager.close()
+    await firebase_participants.close()
+
+def _install_drain_on_sigterm():
+    """Drain before exiting on SIGTERM (what platforms send on deploys and scale-downs)
+    
+    Wraps uvicorn's SIGTERM handler and hands the signal back to it once
+    drained, so its normal shutdown follows. A second SIGTERM skips the rest
+    of the drain.
+    """
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+    
+    def exit_now():
+        signal.signal(signal.SIGTERM, previous)
+        signal.raise_signal(signal.SIGTERM)
+    
+    async def drain_then_exit():
+        await manager.drain()
+        exit_now()
+    
+    def start_drain():
+        if manager.draining:
+            exit_now()
+        else:
+            manager.drain_task = asyncio.create_task(drain_then_exit())
+    
+    try:
+        signal.signal(signal.SIGTERM, lambda signum, frame: loop.call_soon_threadsafe(start_drain))
+    except ValueError:  # Not the main thread (e.g. under a test client)
+        logger.warning("⚠️ Can't install a SIGTERM handler here; drain with POST /admin/drain instead")
+
+app = FastAPI(title="Virtual Office WebSocket Server", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -29,53 +178,138 @@ app.add_middleware(
 
 # Health check endpoint
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "firebase": FIREBASE_INITIALIZED}
-
-# Initialize Firebase with Realtime Database
-FIREBASE_INITIALIZED = False
-firebase_ref = None
-
-try:
-    # Initialize Firebase Admin SDK
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://typio-57fa9.firebaseio.com'
-    })
-    logger.info("Firebase Admin SDK initialized successfully")
-    
-    # Try to get database reference (will work if properly configured)
-    try:
-        firebase_ref = firebase_db.reference('/')
-        FIREBASE_INITIALIZED = True
-        logger.info("✅ Firebase Realtime Database connected")
-    except Exception as db_error:
-        logger.warning(f"Firebase Realtime Database not configured: {db_error}")
-        
-except Exception as e:
-    logger.warning(f"Firebase not initialized: {e}")
+async def health_check(response: Response):
+    # The server is usable before Firebase connects (participants are kept in memory meanwhile)
+    if manager.draining:
+        # Load balancers stop sending new connections here
+        response.status_code = 503
+    return {
+        "status": "draining" if manager.draining else "healthy",
+        "firebase": firebase_participants.use_firebase,
+        "firebase_state": firebase_participants.state,
+    }
 
 class FirebaseParticipantManager:
-    """Manages participant data in Firebase Realtime Database"""
+    """Manages participant data in Firebase Realtime Database
+    
+    Starts on the in-memory fallback. start() connects in the background
+    (retrying with backoff); once connected, the participants collected in
+    memory meanwhile are written to Firebase and Firebase takes over.
+    """
     
     def __init__(self):
-        self.use_firebase = FIREBASE_INITIALIZED and firebase_ref is not None
+        self.use_firebase = False
+        self.state = "starting"  # starting -> connecting -> connected, or disabled (no credentials)
+        self.root_ref = None
         self.fallback_data = {}  # Fallback to memory if Firebase unavailable
+        self.writer: Optional[FirebaseWriteBehind] = None
+        self.connect_attempts = 0
+        self._connect_task: Optional[asyncio.Task] = None
+    
+    @staticmethod
+    def participant_path(office_id: str, room_id: str, user_id: str) -> str:
+        return f"offices/{office_id}/rooms/{room_id}/participants/{user_id}"
+    
+    def start(self):
+        """Begin connecting in the background; returns immediately"""
+        if self._connect_task is None:
+            self._connect_task = asyncio.create_task(self._connect_loop())
+    
+    async def flush(self):
+        """Send pending Firebase writes now"""
+        if self.writer:
+            await self.writer.flush()
+    
+    async def close(self):
+        """Flush pending Firebase writes; called on shutdown"""
+        if self._connect_task and not self._connect_task.done():
+            self._connect_task.cancel()
+        if self.writer:
+            await self.writer.close()
+    
+    @staticmethod
+    def _initialize():
+        """Blocking SDK setup, run on a worker thread; the SDK is only imported here"""
+        import firebase_admin
+        from firebase_admin import credentials, db as firebase_db
+        
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS), {
+                'databaseURL': FIREBASE_DATABASE_URL
+            })
+        root_ref = firebase_db.reference('/')
+        # initialize_app() doesn't touch the network; a shallow read proves the database answers
+        root_ref.get(shallow=True)
+        return root_ref
+    
+    async def _connect_loop(self):
+        if not os.path.exists(FIREBASE_CREDENTIALS):
+            self.state = "disabled"
+            logger.warning(f"Firebase not initialized: {FIREBASE_CREDENTIALS} not found, keeping participants in memory")
+            return
+        
+        self.state = "connecting"
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while True:
+            self.connect_attempts += 1
+            started = time.perf_counter()
+            try:
+                root_ref = await loop.run_in_executor(None, self._initialize)
+                break
+            except Exception as e:
+                # Full jitter so a fleet of restarting workers doesn't retry in step
+                wait = random.uniform(0, delay)
+                logger.warning(f"Firebase connect attempt {self.connect_attempts} failed, retrying in {wait:.1f}s: {e}")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, FIREBASE_CONNECT_MAX_BACKOFF)
+        
+        # Blocking SDK calls are batched and run on a thread pool, never on the event loop
+        self.root_ref = root_ref
+        self.writer = FirebaseWriteBehind(
+            root_ref,
+            flush_interval=FIREBASE_FLUSH_INTERVAL,
+            max_workers=FIREBASE_MAX_WORKERS
+        )
+        self.writer.start()
+        reconciled = self._reconcile()
+        self.use_firebase = True
+        self.state = "connected"
+        startup_timings['firebase_seconds'] = round(time.perf_counter() - _import_started, 3)
+        logger.info(
+            f"✅ Firebase Realtime Database connected after {self.connect_attempts} attempt(s)"
+            f" ({(time.perf_counter() - started) * 1000:.0f}ms); moved {reconciled} participants from memory"
+        )
+    
+    def _reconcile(self) -> int:
+        """Queue everyone who joined while we were on the fallback, then drop the fallback"""
+        moved = 0
+        for office_id, rooms in self.fallback_data.items():
+            for room_id, participants in rooms.items():
+                for user_id, participant in participants.items():
+                    self.writer.set(self.participant_path(office_id, room_id, user_id), participant)
+                    moved += 1
+        self.fallback_data = {}
+        return moved
+    
+    def writer_stats(self) -> dict:
+        return self.writer.stats() if self.writer else {}
         
     async def add_participant(self, office_id: str, room_id: str, user_data: dict):
         """Add participant to Firebase or fallback storage"""
         try:
             if self.use_firebase:
-                # Store in Firebase Realtime Database
-                participant_ref = firebase_ref.child('offices').child(office_id).child('rooms').child(room_id).child('participants').child(user_data['id'])
-                participant_ref.set({
+                # Queue the write for the next batched flush
+                self.writer.set(self.participant_path(office_id, room_id, user_data['id']), {
                     **user_data,
                     'joined_at': user_data.get('joined_at', datetime.now().isoformat()),
                     'last_seen': datetime.now().isoformat(),
                     'office_id': office_id,
                     'room_id': room_id
                 })
-                logger.info(f"✅ Added participant {user_data['name']} to Firebase: {office_id}/{room_id}")
+                logger.info(f"✅ Queued participant {user_data['name']} for Firebase: {office_id}/{room_id}")
             else:
                 # Fallback to memory
                 if office_id not in self.fallback_data:
@@ -97,62 +331,29 @@ class FirebaseParticipantManager:
         """Remove participant from Firebase or fallback storage"""
         try:
             if self.use_firebase:
-                participant_ref = firebase_ref.child('offices').child(office_id).child('rooms').child(room_id).child('participants').child(user_id)
-                participant_ref.delete()
-                logger.info(f"🗑️ Removed participant {user_id} from Firebase: {office_id}/{room_id}")
+                self.writer.delete(self.participant_path(office_id, room_id, user_id))
+                logger.info(f"🗑️ Queued removal of participant {user_id} from Firebase: {office_id}/{room_id}")
             else:
                 # Fallback to memory
                 if (office_id in self.fallback_data and 
                     room_id in self.fallback_data[office_id] and 
                     user_id in self.fallback_data[office_id][room_id]):
                     del self.fallback_data[office_id][room_id][user_id]
+                    # Drop emptied rooms/offices so the fallback doesn't grow forever
+                    if not self.fallback_data[office_id][room_id]:
+                        del self.fallback_data[office_id][room_id]
+                    if not self.fallback_data[office_id]:
+                        del self.fallback_data[office_id]
                     logger.info(f"🗑️ Removed participant {user_id} from memory: {office_id}/{room_id}")
         except Exception as e:
             logger.error(f"❌ Failed to remove participant: {e}")
     
-    async def get_office_participants(self, office_id: str) -> dict:
-        """Get all participants in an office grouped by room"""
-        try:
-            if self.use_firebase:
-                office_ref = firebase_ref.child('offices').child(office_id).child('rooms')
-                office_data = office_ref.get()
-                
-                if not office_data:
-                    return {}
-                
-                rooms = {}
-                for room_id, room_data in office_data.items():
-                    participants = room_data.get('participants', {})
-                    # Convert dict to list and clean data
-                    rooms[room_id] = [
-                        {k: v for k, v in participant.items() if k != 'websocket'}
-                        for participant in participants.values()
-                    ] if participants else []
-                
-                return rooms
-            else:
-                # Fallback to memory
-                if office_id not in self.fallback_data:
-                    return {}
-                
-                rooms = {}
-                for room_id, participants in self.fallback_data[office_id].items():
-                    rooms[room_id] = [
-                        {k: v for k, v in participant.items() if k != 'websocket'}
-                        for participant in participants.values()
-                    ]
-                
-                return rooms
-        except Exception as e:
-            logger.error(f"❌ Failed to get office participants: {e}")
-            return {}
-    
     async def update_participant_activity(self, office_id: str, room_id: str, user_id: str):
         """Update participant's last seen timestamp"""
         try:
             if self.use_firebase:
-                participant_ref = firebase_ref.child('offices').child(office_id).child('rooms').child(room_id).child('participants').child(user_id)
-                participant_ref.child('last_seen').set(datetime.now().isoformat())
+                path = self.participant_path(office_id, room_id, user_id)
+                self.writer.set(f"{path}/last_seen", datetime.now().isoformat())
             else:
                 # Fallback to memory
                 if (office_id in self.fallback_data and 
@@ -161,6 +362,40 @@ class FirebaseParticipantManager:
                     self.fallback_data[office_id][room_id][user_id]['last_seen'] = datetime.now().isoformat()
         except Exception as e:
             logger.error(f"❌ Failed to update participant activity: {e}")
+    
+    async def reap_stale_participants(self, max_age: float, is_live: Callable[[str, str, str], bool]) -> int:
+        """Delete participant nodes whose last_seen is older than max_age seconds
+        
+        Live workers refresh last_seen for their users, so anything this old was
+        left behind by a worker that died without running its disconnect path.
+        """
+        if not self.use_firebase:
+            return 0  # The in-memory fallback dies with its worker
+        try:
+            offices = await self.writer.run(self.root_ref.child('offices').get)
+        except Exception as e:
+            logger.error(f"❌ Failed to read participants for reaping: {e}")
+            return 0
+        
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        reaped = 0
+        for office_id, office in (offices or {}).items():
+            rooms = office.get('rooms') if isinstance(office, dict) else None
+            for room_id, room in (rooms or {}).items():
+                participants = room.get('participants') if isinstance(room, dict) else None
+                for user_id, participant in (participants or {}).items():
+                    if is_live(office_id, room_id, user_id):
+                        continue
+                    try:
+                        last_seen = datetime.fromisoformat(participant['last_seen'])
+                    except (KeyError, TypeError, ValueError):
+                        last_seen = None
+                    if last_seen is None or last_seen < cutoff:
+                        self.writer.delete(self.participant_path(office_id, room_id, user_id))
+                        reaped += 1
+        if reaped:
+            logger.info(f"🧹 Reaped {reaped} stale Firebase participants")
+        return reaped
 
 # Initialize Firebase participant manager
 firebase_participants = FirebaseParticipantManager()
@@ -168,172 +403,672 @@ firebase_participants = FirebaseParticipantManager()
 class ConnectionManager:
     """Stores active WebSocket connections grouped by room id"""
 
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-        self.room_participants: Dict[str, Dict[str, dict]] = {}  # room_id -> {user_id: user_info}
-        self.office_participants: Dict[str, Dict[str, dict]] = {}  # office_id -> {user_id: user_info}
-        self.user_to_office: Dict[str, str] = {}  # user_id -> office_id
-        self.user_to_room: Dict[str, str] = {}  # user_id -> room_id
+    def __init__(self, backplane: Optional[Backplane] = None):
+        self.registry = ConnectionRegistry()  # Connection records with socket/user/room/office indexes
+        self.unknown_target_drops: Dict[str, int] = {}  # message type -> targeted messages with no recipient
+        self.presence = PresenceCache()  # Served to dashboards instead of reading Firebase
+        self.presence_subscribers: Dict[str, Dict[int, Connection]] = {}  # office_id -> presence stream connections
+        self.backplane: Backplane = backplane or create_backplane(BACKPLANE_URL)
+        self.remote_rooms: Dict[str, Dict[str, dict]] = {}  # room_id -> {user_id: participant} on other nodes
+        self.remote_users: Dict[str, Dict[str, list]] = {}  # node_id -> {user_id: [office_id, room_id, current_room]}
+        self.whiteboard = WhiteboardStore(WHITEBOARD_MAX_BYTES_PER_ROOM, WHITEBOARD_COMPACT_EVERY)
+        self.chat = ChatHistory(CHAT_HISTORY_MESSAGES, CHAT_HISTORY_BYTES, CHAT_HISTORY_ROOMS, CHAT_LOG_PATH or None)
+        self.sessions = SessionStore(SESSION_GRACE_SECONDS, min(SESSION_REPLAY_FRAMES, SEND_QUEUE_SIZE // 2))
+        self.limiter = RateLimiter(RATE_LIMITS, ROOM_RATE_LIMITS, RATE_LIMIT_ACTION, MAX_FRAME_BYTES)
+        self.batcher = MessageBatcher(self._broadcast_now, BATCH_TYPES, BATCH_WINDOW_MS / 1000)
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._chat_flush_task: Optional[asyncio.Task] = None
+        self.draining = False  # Set by drain(); no new connections from then on
+        self.drain_task: Optional[asyncio.Task] = None
+        self.drain_progress = {'connections': 0, 'closed': 0, 'started': None, 'finished': None}
+        self.liveness = LivenessSweeper(
+            self._ping, self._evict, self._report_activity,
+            interval=LIVENESS_PING_INTERVAL, timeout=LIVENESS_TIMEOUT
+        )
+
+    async def start(self):
+        try:
+            await self.backplane.start(self._on_backplane_message, self._on_peer_lost, self._on_peer_joined)
+        except Exception as e:
+            logger.error(f"❌ Backplane unavailable, running as a single node: {e}")
+            self.backplane = InProcessBackplane()
+            await self.backplane.start(self._on_backplane_message, self._on_peer_lost, self._on_peer_joined)
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+        self._reaper_task = asyncio.create_task(self._reaper_loop())
+        self._chat_flush_task = asyncio.create_task(self._chat_flush_loop()) if CHAT_LOG_PATH else None
+        self.liveness.start()
+
+    async def close(self):
+        self.batcher.flush_all()
+        self.liveness.stop()
+        for task in (self._maintenance_task, self._reaper_task, self._chat_flush_task):
+            if task:
+                task.cancel()
+        self.chat.close()
+        self.sessions.close()
+        await self.backplane.close()
+
+    async def drain(self, seconds: float = DRAIN_SECONDS, batches: int = DRAIN_BATCHES):
+        """Hand every client over to another instance without a reconnect spike
+        
+        Stops taking connections, ends held sessions (their tokens are no good
+        elsewhere), tells each client how long to wait before reconnecting, and
+        closes sockets in `batches` evenly spaced groups over `seconds`. Leaves
+        go through the normal path so Firebase isn't left with ghosts, and
+        pending Firebase writes are flushed at the end.
+        """
+        if self.draining:
+            return
+        self.draining = True
+        started = time.monotonic()
+        self.drain_progress['started'] = datetime.now().isoformat()
+        self.batcher.flush_all()
+        for connection in self.sessions.held():
+            self.sessions.discard(connection)
+            self._remove(connection)
+        
+        connections = list(self.registry.connections.values())
+        random.shuffle(connections)  # Don't empty one room at a time
+        self.drain_progress['connections'] = len(connections)
+        logger.warning(
+            f"🚰 Draining {len(connections)} connections over {seconds:g}s",
+            extra={'event': 'drain', 'connections': len(connections)}
+        )
+        for connection in connections:
+            connection.send_queue.enqueue({
+                'type': 'reconnect',
+                'reason': 'restart',
+                'delay_ms': random.randint(0, DRAIN_RECONNECT_JITTER_MS)
+            })
+        
+        batches = max(1, batches)
+        batch_size = max(1, math.ceil(len(connections) / batches))
+        for start in range(0, len(connections), batch_size):
+            # The first wait also lets the reconnect hints go out
+            await asyncio.sleep(seconds / batches)
+            for connection in connections[start:start + batch_size]:
+                websocket = connection.websocket
+                if self.registry.get(websocket) is not connection:
+                    continue  # Left (or was resumed elsewhere) meanwhile
+                if connection.room_id is not None:
+                    # Not resumable: this process is going away
+                    self.disconnect(connection.room_id, websocket)
+                # Presence streams clean up after themselves when their socket closes
+                asyncio.create_task(self._close_quietly(websocket, DRAIN_CLOSE_CODE))
+                self.drain_progress['closed'] += 1
+        
+        await asyncio.sleep(0)  # Let the queued Firebase removals run
+        self.chat.flush()
+        await firebase_participants.flush()
+        self.drain_progress['finished'] = datetime.now().isoformat()
+        logger.warning(f"🚰 Drained in {time.monotonic() - started:.1f}s", extra={'event': 'drained'})
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(WHITEBOARD_COMPACT_INTERVAL)
+            self.whiteboard.compact_all()
+
+    async def _chat_flush_loop(self):
+        while True:
+            await asyncio.sleep(CHAT_LOG_FLUSH_INTERVAL)
+            self.chat.flush()
+
+    async def _reaper_loop(self):
+        while True:
+            await asyncio.sleep(FIREBASE_REAP_INTERVAL)
+            # Users on other nodes count too: idle ones that don't answer pings never refresh last_seen
+            await firebase_participants.reap_stale_participants(
+                FIREBASE_STALE_AFTER,
+                lambda office_id, room_id, user_id: self._still_in_room(room_id, user_id)
+            )
+
+    def _ping(self, connection: Connection):
+        self._fan_out_frame((connection,), PING_KEY, PING_FRAME)
+
+    def _evict(self, connection: Connection):
+        """Drop a connection that stopped answering pings (half-open TCP, frozen tab)"""
+        logger.warning(
+            f"💀 Evicting unresponsive connection in room {connection.room_id} (user {connection.user_id})",
+            extra={'event': 'evict', 'room_id': connection.room_id, 'user_id': connection.user_id}
+        )
+        metrics.liveness_evictions.inc()
+        websocket = connection.websocket
+        # A frozen tab or a laptop waking up may still come back with its token
+        self.disconnect(connection.room_id, websocket, resumable=True)
+        asyncio.create_task(self._close_quietly(websocket))
+
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int = LIVENESS_CLOSE_CODE):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=5.0)
+        except Exception as e:
+            logger.debug(f"Socket already closed: {e}")
+
+    async def _report_activity(self, connection: Connection):
+        if connection.user_id:
+            await firebase_participants.update_participant_activity(
+                connection.office_id, connection.room_id, connection.user_id
+            )
+
+    def _new_send_queue(self, websocket: WebSocket, codec: Optional[protocol.MessagePackCodec] = None) -> OutboundQueue:
+        # Every connection gets its own bounded queue and writer task
+        send_queue = OutboundQueue(websocket, max_size=SEND_QUEUE_SIZE, policy=SEND_QUEUE_POLICY,
+                                   encode=codec.encode if codec else encode_message)
+        send_queue.start()
+        return send_queue
 
-    async def connect(self, room_id: str, websocket: WebSocket, user_info: dict = None):
+    async def connect(self, room_id: str, websocket: WebSocket, user_info: dict = None,
+                      codec: Optional[protocol.MessagePackCodec] = None, interest: Interest = EVERYTHING):
         # Note: WebSocket should already be accepted before calling this method
-        self.active_connections.setdefault(room_id, []).append(websocket)
+        send_queue = self._new_send_queue(websocket, codec)
         
-        # Store user info
-        if user_info:
-            user_id = user_info.get('id', str(uuid.uuid4()))
-            office_id = user_info.get('office_id', 'default')
-            
-            # Store in room participants (local for WebSocket management)
-            self.room_participants.setdefault(room_id, {})[user_id] = {
-                **user_info,
-                'websocket': websocket,
-                'joined_at': datetime.now().isoformat(),
-                'room_id': room_id
-            }
-            
-            # Store in office participants (local for WebSocket management)
-            self.office_participants.setdefault(office_id, {})[user_id] = {
-                **user_info,
-                'websocket': websocket,
-                'joined_at': datetime.now().isoformat(),
-                'room_id': room_id,
-                'current_room': room_id
-            }
-            
-            # Update mappings
-            self.user_to_office[user_id] = office_id
-            self.user_to_room[user_id] = room_id
-            
-            # Store in Firebase Realtime Database
-            await firebase_participants.add_participant(office_id, room_id, user_info)
+        if not user_info:
+            connection = self.registry.add(websocket, send_queue, room_id, interest=interest)
+            connection.codec = codec
+            self.liveness.track(connection)
+            logger.info(f"✅ New connection to room {room_id}. Total in room: {self.registry.room_size(room_id)}")
+            return connection
+        
+        user_id = user_info.get('id', str(uuid.uuid4()))
+        office_id = user_info.get('office_id', 'default')
+        joined_at = datetime.now().isoformat()
+        
+        # Public participant record (what participants_list shows)
+        participant = {**user_info, 'joined_at': joined_at, 'room_id': room_id}
+        connection = self.registry.add(websocket, send_queue, room_id, office_id, user_id, participant, interest)
+        connection.codec = codec
+        self.liveness.track(connection)
+        
+        # Office presence entry (local cache + pushed diffs), mirrored on other nodes
+        self._presence_joined(office_id, room_id, participant)
+        self.backplane.publish({
+            'kind': 'member', 'op': 'join', 'office_id': office_id, 'room_id': room_id,
+            'user_id': user_id, 'participant': participant
+        })
         
-        logger.info(f"✅ New connection to room {room_id}. Total in room: {len(self.active_connections[room_id])}")
+        # Store in Firebase Realtime Database
+        await firebase_participants.add_participant(office_id, room_id, user_info)
+        
+        logger.info(
+            f"✅ New connection to room {room_id}. Total in room: {self.registry.room_size(room_id)}",
+            extra={'event': 'join', 'room_id': room_id, 'office_id': office_id, 'user_id': user_id}
+        )
         
         # Notify other participants about the new user
-        if user_info:
-            await self.broadcast(room_id, {
-                'type': 'user_joined',
-                'user': user_info,
-                'participants_count': len(self.room_participants.get(room_id, {}))
-            }, exclude_websocket=websocket)
-
-    def disconnect(self, room_id: str, websocket: WebSocket):
-        room = self.active_connections.get(room_id)
-        if room and websocket in room:
-            room.remove(websocket)
-            
-            # Remove user from participants
-            participants = self.room_participants.get(room_id, {})
-            user_to_remove = None
-            for user_id, user_data in participants.items():
-                if user_data.get('websocket') == websocket:
-                    user_to_remove = user_id
-                    break
+        await self.broadcast(room_id, {
+            'type': 'user_joined',
+            'user': user_info,
+            'participants_count': self.room_participant_count(room_id)
+        }, exclude_websocket=websocket)
+        return connection
+
+    def disconnect(self, room_id: str, websocket: WebSocket, resumable: bool = False):
+        connection = self.registry.get(websocket)
+        if connection is None:
+            return
+        
+        self.liveness.untrack(connection)
+        if resumable and self._detach(connection):
+            return
+        connection.send_queue.stop()
+        self.sessions.discard(connection)
+        self._remove(connection)
+
+    def _detach(self, connection: Connection) -> bool:
+        """Hold a dropped participant for the grace period instead of announcing a leave"""
+        replay = self.sessions.detach(connection, self._remove)
+        if replay is None:
+            return False
+        connection.send_queue.stop()
+        connection.send_queue = replay  # Room traffic is buffered for the replay from here on
+        self.registry.rebind(connection)
+        logger.info(
+            f"⏸️ Holding {connection.user_id} in room {connection.room_id} for {self.sessions.grace:g}s",
+            extra={'event': 'detach', 'room_id': connection.room_id, 'user_id': connection.user_id}
+        )
+        return True
+
+    def resume(self, room_id: str, websocket: WebSocket, user_id: str, token: str,
+               codec: Optional[protocol.MessagePackCodec] = None) -> Optional[Connection]:
+        """Reattach a returning client to its held connection; None if the token isn't valid here"""
+        connection = self.sessions.lookup(token, room_id, user_id)
+        if connection is None:
+            return None
+        
+        if self.registry.get(connection.websocket) is connection:
+            # The old socket still looks open to us (half-open TCP) but the client has moved on
+            old_websocket = connection.websocket
+            self.liveness.untrack(connection)
+            self._detach(connection)
+            asyncio.create_task(self._close_quietly(old_websocket))
+        
+        replay = self.sessions.reattach(connection)
+        # Buffered frames are in the old socket's encoding; a client that switched gets a resync
+        resync = replay.overflowed or codec is not connection.codec
+        connection.codec = codec
+        connection.send_queue = self._new_send_queue(websocket, codec)
+        self.registry.rebind(connection, websocket)
+        self.liveness.track(connection)
+        
+        token = self.sessions.issue(connection)
+        connection.send_queue.enqueue({
+            'type': 'resumed',
+            'token': token,
+            'grace_seconds': self.sessions.grace,
+            'replayed': 0 if resync else len(replay.frames),
+            'resync': resync,
+        })
+        if resync:
+            # Too much happened to replay; current state is smaller
+            connection.send_queue.enqueue({'type': 'participants_list', 'participants': self.get_room_participants(room_id)})
+            whiteboard_snapshot = 'whiteboard' in connection.interest.topics and self.whiteboard.snapshot_message(room_id)
+            if whiteboard_snapshot:
+                connection.send_queue.enqueue(whiteboard_snapshot)
+        else:
+            for key, frame in replay.frames:
+                connection.send_queue.enqueue_frame(key, frame)
+        logger.info(
+            f"▶️ Resumed {user_id} in room {room_id}"
+            f" ({'resync' if resync else f'{len(replay.frames)} frames replayed'})",
+            extra={'event': 'resume', 'room_id': room_id, 'user_id': user_id}
+        )
+        return connection
+
+    def _remove(self, connection: Connection):
+        """Forget a connection for good and tell everyone the user left"""
+        # A new join by the same user in the same room has taken over; its records must stay
+        superseded = connection.user_id and self.registry.room_user(connection.room_id, connection.user_id) is not connection
+        self.registry.remove(connection)
+        room_id = connection.room_id
+        user_id = connection.user_id
+        office_id = connection.office_id
+        
+        if user_id and not superseded:
+            self.backplane.publish({
+                'kind': 'member', 'op': 'leave', 'office_id': office_id, 'room_id': room_id,
+                'user_id': user_id, 'current_room': connection.current_room
+            })
             
-            if user_to_remove:
-                user_info = participants.pop(user_to_remove, {})
-                
+            # A held session expiring after its user came back on another node: they never left
+            if user_id not in self.remote_rooms.get(room_id, {}):
                 # Remove from Firebase
-                office_id = self.user_to_office.get(user_to_remove, 'default')
-                asyncio.create_task(firebase_participants.remove_participant(office_id, room_id, user_to_remove))
-                
-                # Clean up mappings
-                self.user_to_office.pop(user_to_remove, None)
-                self.user_to_room.pop(user_to_remove, None)
+                asyncio.create_task(firebase_participants.remove_participant(office_id, room_id, user_id))
+                self._presence_left(office_id, connection.current_room, user_id)
                 
                 # Notify other participants about user leaving
-                if room:  # If there are still connections
+                if self.registry.room_size(room_id) or room_id in self.remote_rooms:  # If there are still connections
                     asyncio.create_task(self.broadcast(room_id, {
                         'type': 'user_left',
-                        'user_id': user_to_remove,
-                        'participants_count': len(participants)
+                        'user_id': user_id,
+                        'participants_count': self.room_participant_count(room_id)
                     }))
-            
-            logger.info(f"❌ Disconnection from room {room_id}. Remaining in room: {len(room)}")
-            
-            if not room:
-                # Clean up empty room
-                del self.active_connections[room_id]
-                if room_id in self.room_participants:
-                    del self.room_participants[room_id]
-                logger.info(f"🧹 Room {room_id} is now empty and removed")
+        
+        remaining = self.registry.room_size(room_id)
+        logger.info(
+            f"❌ Disconnection from room {room_id}. Remaining in room: {remaining}",
+            extra={'event': 'leave', 'room_id': room_id, 'office_id': connection.office_id, 'user_id': user_id}
+        )
+        if not remaining:
+            self._room_emptied(room_id)
+
+    def _room_emptied(self, room_id: str):
+        if self.registry.room_size(room_id) or room_id in self.remote_rooms:
+            return
+        # Nobody left on any node: per-room state can go
+        self.whiteboard.drop(room_id)
+        self.limiter.forget_room(room_id)
+        logger.info(f"🧹 Room {room_id} is now empty and removed")
+
+    def send_personal(self, websocket: WebSocket, message: dict) -> bool:
+        """Queue a message for a single connection"""
+        connection = self.registry.get(websocket)
+        if connection is None:
+            return False
+        metrics.messages_out.inc(metrics.message_type(message.get('type')))
+        return connection.send_queue.enqueue(message)
+
+    def send_to_user(self, room_id: str, user_id: str, message: dict) -> bool:
+        """Deliver a message to one participant of a room instead of the whole room"""
+        connection = self.registry.room_user(room_id, user_id)
+        if connection is None and user_id in self.remote_rooms.get(room_id, {}):
+            # The peer is connected to another node
+            self.backplane.publish({
+                'kind': 'target', 'room_id': room_id, 'user_id': user_id,
+                'key': coalesce_key(message), 'frame': encode_message(message)
+            })
+            return True
+        if connection is None:
+            message_type = metrics.message_type(message.get('type'))  # The client's; may not even be a string
+            self.unknown_target_drops[message_type] = self.unknown_target_drops.get(message_type, 0) + 1
+            logger.warning(f"🎯 Dropping {message_type} message for unknown target {user_id} in room {room_id}")
+            return False
+        metrics.messages_out.inc(metrics.message_type(message.get('type')))
+        return connection.send_queue.enqueue(message)
+
+    def _fan_out(self, connections: Iterable[Connection], message: dict, exclude_websocket: WebSocket = None):
+        """Encode once and queue the same frame for every recipient"""
+        self._fan_out_frame(connections, coalesce_key(message), encode_message(message), exclude_websocket)
+
+    @staticmethod
+    def _fan_out_frame(connections: Iterable[Connection], key: str, frame: str, exclude_websocket: WebSocket = None) -> int:
+        recipients = 0
+        binary = None  # Re-encoded at most once per fan-out, and only if a binary client is listening
+        for connection in connections:
+            if connection.websocket is not exclude_websocket:
+                if connection.codec is None:
+                    connection.send_queue.enqueue_frame(key, frame)
+                else:
+                    if binary is None:
+                        binary = connection.codec.from_json_frame(frame)
+                    connection.send_queue.enqueue_frame(key, binary)
+                recipients += 1
+        # The coalesce key starts with the message type; count once per fan-out, not per recipient
+        metrics.messages_out.inc(metrics.message_type(key.split(':', 1)[0]), amount=recipients)
+        return recipients
 
     async def broadcast(self, room_id: str, message: dict, exclude_websocket: WebSocket = None):
-        logger.info(f"📡 Broadcasting to room {room_id}: {message.get('type', 'unknown')} message")
-        connections = self.active_connections.get(room_id, [])
+        if self.batcher.wants(message):
+            self.batcher.add(room_id, message, exclude_websocket)
+            return
+        # Nothing may overtake batched messages already held for this room
+        self.batcher.flush(room_id)
+        message_log.log("broadcast", room_id, message.get('type'))
+        self._broadcast_now(room_id, message, exclude_websocket)
+
+    def _broadcast_now(self, room_id: str, message: dict, exclude_websocket: WebSocket = None):
+        started = time.perf_counter()
+        key = coalesce_key(message)
+        frame = encode_message(message)
         
-        for connection in connections:
-            if exclude_websocket and connection == exclude_websocket:
-                continue
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"❌ Failed to send message to connection: {e}")
-                # Remove broken connection
-                if connection in connections:
-                    connections.remove(connection)
+        # Only enqueue here; each connection's writer task does the actual send
+        # The type is the client's; only strings can name a topic (TOPICS.get would raise on a list)
+        message_type = message.get('type')
+        topic = TOPICS.get(message_type) if isinstance(message_type, str) else None
+        recipients = self._fan_out_frame(self.registry.room(room_id, topic), key, frame, exclude_websocket)
+        self.backplane.publish({'kind': 'room', 'room_id': room_id, 'key': key, 'frame': frame})
+        metrics.fanout_size.observe(recipients, 'room')
+        metrics.broadcast_seconds.observe(time.perf_counter() - started, 'room')
 
     def get_room_participants(self, room_id: str) -> List[dict]:
-        participants = self.room_participants.get(room_id, {})
+        local = self.registry.room_users.get(room_id, {})
+        # A user who moved nodes can briefly be both ours (held) and another node's; list them once
+        remote = [participant for user_id, participant in self.remote_rooms.get(room_id, {}).items() if user_id not in local]
+        return [connection.participant for connection in local.values()] + remote
+    
+    def room_participant_count(self, room_id: str) -> int:
+        local = self.registry.room_users.get(room_id, {})
+        return len(local) + sum(1 for user_id in self.remote_rooms.get(room_id, {}) if user_id not in local)
+    
+    def get_connection_stats(self, room_id: str) -> List[dict]:
+        """Per-connection send queue counters for a room"""
         return [
-            {k: v for k, v in user_data.items() if k != 'websocket'}
-            for user_data in participants.values()
+            {'connection_id': connection.id, 'user_id': connection.user_id,
+             'idle_seconds': round(time.monotonic() - connection.last_seen, 1), **connection.send_queue.stats()}
+            for connection in self.registry.room(room_id)
         ]
     
-    def get_office_participants(self, office_id: str) -> Dict[str, List[dict]]:
-        """Get all participants in an office grouped by room"""
-        office_participants = self.office_participants.get(office_id, {})
-        rooms = {}
-        
-        for user_id, user_data in office_participants.items():
-            room_id = user_data.get('current_room', 'unknown')
-            if room_id not in rooms:
-                rooms[room_id] = []
-            
-            # Clean user data (remove websocket)
-            clean_user_data = {k: v for k, v in user_data.items() if k != 'websocket'}
-            rooms[room_id].append(clean_user_data)
-        
-        return rooms
-    
     async def broadcast_to_office(self, office_id: str, message: dict, exclude_websocket: WebSocket = None):
         """Broadcast message to all participants in an office"""
-        office_participants = self.office_participants.get(office_id, {})
+        started = time.perf_counter()
+        key = coalesce_key(message)
+        frame = encode_message(message)
+        recipients = self._fan_out_frame(self.registry.office_members(office_id), key, frame, exclude_websocket)
+        self.backplane.publish({'kind': 'office', 'office_id': office_id, 'key': key, 'frame': frame})
+        metrics.fanout_size.observe(recipients, 'office')
+        metrics.broadcast_seconds.observe(time.perf_counter() - started, 'office')
+    
+    def subscribe_presence(self, office_id: str, websocket: WebSocket):
+        """Register a presence stream socket and send it the current snapshot"""
+        connection = self.registry.add(websocket, self._new_send_queue(websocket), office_id=office_id)
+        self.presence_subscribers.setdefault(office_id, {})[connection.id] = connection
+        connection.send_queue.enqueue(self.presence_snapshot_message(office_id))
+
+    def unsubscribe_presence(self, office_id: str, websocket: WebSocket):
+        connection = self.registry.get(websocket)
+        if connection is None:
+            return
+        connection.send_queue.stop()
+        self.registry.remove(connection)
+        subscribers = self.presence_subscribers.get(office_id)
+        if subscribers is not None:
+            subscribers.pop(connection.id, None)
+            if not subscribers:
+                del self.presence_subscribers[office_id]
+
+    def publish_presence(self, office_id: str, diff: Optional[dict], office_message: Optional[dict] = None):
+        """Send a presence diff to the connections subscribed to the office or to a room it touches
+
+        Office members get office_message instead when one is given (e.g. user_moved_room);
+        it must carry the diff's versions so clients can spot gaps and send presence_sync.
+        """
+        if not diff:
+            return
+        started = time.perf_counter()
+        recipients = self.registry.interests.presence(office_id, diff['room_versions'])
+        if office_message is None:
+            delivered = self._fan_out_frame(recipients, coalesce_key(diff), encode_message(diff))
+        else:
+            streams, members = [], []
+            for connection in recipients:
+                (streams if connection.user_id is None else members).append(connection)
+            self._fan_out(streams, diff)
+            self._fan_out(members, office_message)
+            delivered = len(streams) + len(members)
+        metrics.fanout_size.observe(delivered, 'presence')
+        metrics.broadcast_seconds.observe(time.perf_counter() - started, 'presence')
+
+    def presence_snapshot_message(self, office_id: str, interest: Interest = EVERYTHING) -> dict:
+        """Roster (all of it, or the subscribed rooms) for clients that start up or detect a version gap"""
+        return {'type': 'presence_snapshot', **self.presence.snapshot(office_id, interest.presence_rooms())}
+
+    def subscribe(self, connection: Connection, request: dict):
+        """Change what a connection receives and answer with the resulting subscription"""
+        previous = connection.interest
+        try:
+            interest = previous.update(request)
+        except ValueError as e:
+            logger.warning(f"🔕 Ignoring invalid subscription from {connection.user_id}: {e}")
+            connection.send_queue.enqueue({'type': 'subscribed', 'error': str(e), **previous.to_dict()})
+            return
+        self.registry.subscribe(connection, interest)
+        connection.send_queue.enqueue({'type': 'subscribed', **interest.to_dict()})
         
-        for user_data in office_participants.values():
-            websocket = user_data.get('websocket')
-            if websocket and websocket != exclude_websocket:
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    logger.error(f"❌ Failed to send office message to connection: {e}")
+        # Diffs for what it just started watching weren't sent; begin it from current state
+        if (connection.office_id is not None and interest.presence != 'none'
+                and interest.presence_rooms() != previous.presence_rooms()):
+            connection.send_queue.enqueue(self.presence_snapshot_message(connection.office_id, interest))
+        if connection.room_id is not None and 'whiteboard' in interest.topics - previous.topics:
+            whiteboard_snapshot = self.whiteboard.snapshot_message(connection.room_id)
+            if whiteboard_snapshot:
+                connection.send_queue.enqueue(whiteboard_snapshot)
+
+    def _presence_joined(self, office_id: str, room_id: str, participant: dict):
+        office_entry = {**participant, 'current_room': room_id}
+        self.publish_presence(office_id, self.presence.join(office_id, room_id, office_entry))
+
+    def _presence_left(self, office_id: str, current_room: str, user_id: str):
+        self.publish_presence(office_id, self.presence.leave(office_id, current_room, user_id))
+
+    def _presence_moved(self, office_id: str, user_id: str, old_room_id: str, new_room_id: str):
+        # Office members get just the changed entry, tagged with the presence version
+        diff = self.presence.move(office_id, user_id, old_room_id, new_room_id)
+        if diff:
+            self.publish_presence(office_id, diff, {
+                'type': 'user_moved_room',
+                'user_id': user_id,
+                'from_room': old_room_id,
+                'to_room': new_room_id,
+                'version': diff['version'],
+                'room_versions': diff['room_versions'],
+                'changes': diff['changes']
+            })
+
+    async def _on_backplane_message(self, envelope: dict):
+        """Deliver another node's traffic to our local sockets and mirror its presence"""
+        kind = envelope.get('kind')
+        if kind == 'room':
+            frame = envelope['frame']
+            if envelope['key'].startswith('chat:'):
+                # Renumber in this node's sequence so local clients can resume against it
+                message = json.loads(frame)
+                self.chat.record(envelope['room_id'], message)
+                frame = encode_message(message)
+            topic = TOPICS.get(envelope['key'].split(':', 1)[0])
+            self._fan_out_frame(self.registry.room(envelope['room_id'], topic), envelope['key'], frame)
+            if envelope['key'].startswith(('draw:', 'draw_batch:', 'clear:')):
+                # Keep our copy of the room's stroke log in step with other nodes
+                self.whiteboard.record(envelope['room_id'], json.loads(envelope['frame']))
+        elif kind == 'office':
+            self._fan_out_frame(self.registry.office_members(envelope['office_id']), envelope['key'], envelope['frame'])
+        elif kind == 'target':
+            connection = self.registry.room_user(envelope['room_id'], envelope['user_id'])
+            if connection:
+                self._fan_out_frame((connection,), envelope['key'], envelope['frame'])
+        elif kind == 'member' and envelope.get('op') == 'sync':
+            self._apply_remote_roster(envelope['node'], envelope['users'])
+        elif kind == 'member':
+            self._apply_remote_member(envelope['node'], envelope)
+
+    def _apply_remote_member(self, node_id: str, event: dict):
+        office_id, room_id, user_id = event['office_id'], event['room_id'], event['user_id']
+        node_users = self.remote_users.setdefault(node_id, {})
+        
+        if event['op'] == 'join':
+            self.remote_rooms.setdefault(room_id, {})[user_id] = event['participant']
+            node_users[user_id] = [office_id, room_id, room_id]
+            self._presence_joined(office_id, room_id, event['participant'])
+        elif event['op'] == 'leave':
+            self._forget_remote_user(node_id, user_id)
+            if not self._still_in_room(room_id, user_id):
+                self._presence_left(office_id, event.get('current_room', room_id), user_id)
+                self._room_emptied(room_id)
+        elif event['op'] == 'move' and user_id in node_users:
+            node_users[user_id][2] = event['to_room']
+            self._presence_moved(office_id, user_id, event['from_room'], event['to_room'])
+
+    def _apply_remote_roster(self, node_id: str, users: List[dict]):
+        """Make what we know about a node's participants match its full roster
+        
+        Idempotent: applying the same roster twice changes nothing. Users we
+        didn't know are announced to local room members, and users missing
+        from the roster are dropped, as when a node is lost.
+        """
+        known = dict(self.remote_users.get(node_id, {}))
+        roster = {user['user_id']: user for user in users}
+        
+        for user_id, (office_id, room_id, current_room) in known.items():
+            user = roster.get(user_id)
+            if user is not None and user['room_id'] == room_id:
+                continue
+            self._forget_remote_user(node_id, user_id)
+            if self._still_in_room(room_id, user_id):
+                continue
+            self._presence_left(office_id, current_room, user_id)
+            self._fan_out(self.registry.room(room_id), {
+                'type': 'user_left',
+                'user_id': user_id,
+                'participants_count': self.room_participant_count(room_id)
+            })
+            self._room_emptied(room_id)
+        
+        node_users = self.remote_users.setdefault(node_id, {})
+        for user_id, user in roster.items():
+            office_id, room_id, current_room = user['office_id'], user['room_id'], user['current_room']
+            self.remote_rooms.setdefault(room_id, {})[user_id] = user['participant']
+            location = node_users.get(user_id)
+            if location is None:
+                node_users[user_id] = [office_id, room_id, room_id]
+                self._presence_joined(office_id, room_id, user['participant'])
+                self._fan_out(self.registry.room(room_id), {
+                    'type': 'user_joined',
+                    'user': user['participant'],
+                    'participants_count': self.room_participant_count(room_id)
+                })
+                location = node_users[user_id]
+            if location[2] != current_room:
+                self._presence_moved(office_id, user_id, location[2], current_room)
+                location[2] = current_room
+        if not node_users:
+            self.remote_users.pop(node_id, None)
+
+    async def _on_peer_joined(self, node_id: str):
+        """A node appeared (or came back after a purge): publish our whole roster for it"""
+        self.backplane.publish({'kind': 'member', 'op': 'sync', 'users': [
+            {'office_id': connection.office_id, 'room_id': connection.room_id, 'user_id': connection.user_id,
+             'current_room': connection.current_room, 'participant': connection.participant}
+            for connection in self.registry.users.values()
+        ]})
+
+    def _forget_remote_user(self, node_id: str, user_id: str) -> Optional[list]:
+        node_users = self.remote_users.get(node_id, {})
+        location = node_users.pop(user_id, None)
+        if not node_users:
+            self.remote_users.pop(node_id, None)
+        # Another node may host the same user in the same room (they reconnected there); keep that entry
+        if location and not any(other.get(user_id, (None, None))[1] == location[1] for other in self.remote_users.values()):
+            room = self.remote_rooms.get(location[1], {})
+            room.pop(user_id, None)
+            if not room:
+                self.remote_rooms.pop(location[1], None)
+        return location
     
+    def _still_in_room(self, room_id: str, user_id: str) -> bool:
+        """Whether a user one node stopped hosting is still in the room here or on another node"""
+        return self.registry.room_user(room_id, user_id) is not None or user_id in self.remote_rooms.get(room_id, {})
+
+    async def _on_peer_lost(self, node_id: str):
+        """A node went away: drop everyone it was hosting"""
+        for user_id in list(self.remote_users.get(node_id, {})):
+            office_id, room_id, current_room = self._forget_remote_user(node_id, user_id)
+            if self._still_in_room(room_id, user_id):
+                continue
+            self._presence_left(office_id, current_room, user_id)
+            self._fan_out(self.registry.room(room_id), {
+                'type': 'user_left',
+                'user_id': user_id,
+                'participants_count': self.room_participant_count(room_id)
+            })
+            self._room_emptied(room_id)
+        logger.info(f"🛰️ Purged presence for lost node {node_id}")
+
     async def move_user_to_room(self, user_id: str, new_room_id: str):
         """Move a user from one room to another while keeping office connection"""
-        if user_id not in self.user_to_office:
+        connection = self.registry.user(user_id)
+        if connection is None:
             return False
         
-        office_id = self.user_to_office[user_id]
-        old_room_id = self.user_to_room.get(user_id)
+        office_id = connection.office_id
+        old_room_id = connection.current_room
         
         # Update office participant record
-        if office_id in self.office_participants and user_id in self.office_participants[office_id]:
-            self.office_participants[office_id][user_id]['current_room'] = new_room_id
-            self.user_to_room[user_id] = new_room_id
-        
-        # Notify office participants about room change
-        await self.broadcast_to_office(office_id, {
-            'type': 'user_moved_room',
-            'user_id': user_id,
-            'from_room': old_room_id,
-            'to_room': new_room_id,
-            'office_participants': self.get_office_participants(office_id)
+        connection.current_room = new_room_id
+        
+        # Notify office participants about room change with just the changed entry
+        self._presence_moved(office_id, user_id, old_room_id, new_room_id)
+        self.backplane.publish({
+            'kind': 'member', 'op': 'move', 'office_id': office_id, 'room_id': connection.room_id,
+            'user_id': user_id, 'from_room': old_room_id, 'to_room': new_room_id
         })
         
         return True
 
 manager = ConnectionManager()
+profiler = SamplingProfiler()
+
+metrics.REGISTRY.register(metrics.Gauge(
+    'ws_connections', 'Open room websockets on this node', lambda: len(manager.registry.connections)))
+metrics.REGISTRY.register(metrics.Gauge(
+    'ws_rooms', 'Rooms with at least one local connection', lambda: len(manager.registry.rooms)))
+metrics.REGISTRY.register(metrics.Gauge(
+    'ws_presence_subscribers', 'Open office presence streams',
+    lambda: sum(len(subscribers) for subscribers in manager.presence_subscribers.values())))
+metrics.REGISTRY.register(metrics.Gauge(
+    'ws_sessions_held', 'Dropped participants held for a resume',
+    lambda: manager.sessions.stats()['held']))
+metrics.REGISTRY.register(metrics.Gauge(
+    'firebase_write_queue_depth', 'Firebase writes waiting for the next flush',
+    lambda: firebase_participants.writer_stats().get('queue_depth', 0)))
 
 # Pydantic models
 class InviteRequest(BaseModel):
@@ -358,10 +1093,67 @@ async def healthcheck():
         "status": "ok",
         "service": "Virtual Office WebSocket Server",
         "version": "1.0.0",
-        "active_rooms": len(manager.active_connections),
-        "total_connections": sum(len(conns) for conns in manager.active_connections.values())
+        "active_rooms": len(manager.registry.rooms),
+        "total_connections": sum(len(conns) for conns in manager.registry.rooms.values()),
+        "signals_dropped_unknown_target": manager.unknown_target_drops.get('signal', 0),
+        "firebase_writes": firebase_participants.writer_stats(),
+        "backplane": manager.backplane.stats(),
+        "whiteboard": manager.whiteboard.stats(),
+        "chat_history": manager.chat.stats(),
+        "sessions": manager.sessions.stats(),
+        "protocols": ["json", *protocol.available()],
+        "startup": {**startup_timings, "firebase_state": firebase_participants.state},
+        "batching": manager.batcher.stats(),
+        "liveness": manager.liveness.stats(),
+        "rate_limits": manager.limiter.stats(),
+        "interests": manager.registry.interests.stats(),
+        "drain": {"draining": manager.draining, **manager.drain_progress}
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(request: Request):
+    """Guard for /debug and /admin endpoints: they only exist when ADMIN_TOKEN is set"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/debug/profiler")
+async def get_profiler(request: Request, limit: int = 50):
+    """Profiler status plus the most frequent folded stacks so far"""
+    require_admin(request)
+    return {**profiler.status(), "top": profiler.folded(limit).splitlines()}
+
+@app.post("/debug/profiler/start")
+async def start_profiler(request: Request, interval_ms: float = 10.0):
+    """Start sampling the event loop thread; no restart needed"""
+    require_admin(request)
+    profiler.start(max(interval_ms, 1.0) / 1000, threading.get_ident())
+    return profiler.status()
+
+@app.post("/debug/profiler/stop")
+async def stop_profiler(request: Request):
+    """Stop sampling and return folded stacks (feed to flamegraph.pl or speedscope)"""
+    require_admin(request)
+    profiler.stop()
+    return PlainTextResponse(profiler.folded())
+
+@app.post("/admin/drain")
+async def start_drain(request: Request, seconds: float = DRAIN_SECONDS, shutdown: bool = False):
+    """Drain this instance ahead of a restart; with shutdown=true the process stops once drained"""
+    require_admin(request)
+    if not manager.draining:
+        async def run():
+            await manager.drain(max(seconds, 0.0))
+            if shutdown:
+                signal.raise_signal(signal.SIGTERM)
+        manager.drain_task = asyncio.create_task(run())
+    return {"draining": True, **manager.drain_progress}
+
 @app.get("/rooms/{room_id}/participants")
 async def get_room_participants(room_id: str):
     """Get list of participants in a room"""
@@ -372,19 +1164,30 @@ async def get_room_participants(room_id: str):
         "count": len(participants)
     }
 
-@app.get("/offices/{office_id}/participants")
-async def get_office_participants(office_id: str):
-    """Get all participants in an office grouped by room"""
-    rooms_with_participants = await firebase_participants.get_office_participants(office_id)
-    total_participants = sum(len(participants) for participants in rooms_with_participants.values())
-    
+@app.get("/rooms/{room_id}/connections")
+async def get_room_connections(room_id: str):
+    """Get outbound queue depth and counters for each connection in a room"""
+    connections = manager.get_connection_stats(room_id)
     return {
-        "office_id": office_id,
-        "rooms": rooms_with_participants,
-        "total_participants": total_participants,
-        "active_rooms": len([room for room, participants in rooms_with_participants.items() if participants])
+        "room_id": room_id,
+        "policy": SEND_QUEUE_POLICY.value,
+        "connections": connections,
+        "count": len(connections)
     }
 
+@app.get("/offices/{office_id}/participants")
+async def get_office_participants(office_id: str, request: Request, response: Response):
+    """Get all participants in an office grouped by room (served from the presence cache)"""
+    etag = manager.presence.etag(office_id)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return manager.presence.snapshot(office_id)
+
 @app.post("/invite")
 async def send_invitation(invite: InviteRequest):
     """Send email invitation to join a room"""
@@ -422,17 +1225,51 @@ async def send_invitation(invite: InviteRequest):
         logger.error(f"❌ Failed to send invitation: {e}")
         raise HTTPException(status_code=500, detail="Failed to send invitation")
 
+@app.websocket("/ws/offices/{office_id}/presence")
+async def presence_endpoint(websocket: WebSocket, office_id: str):
+    """Push an office presence snapshot followed by presence diffs, replacing dashboard polling"""
+    if manager.draining:
+        await websocket.close(code=DRAIN_CLOSE_CODE)
+        return
+    await websocket.accept()
+    manager.subscribe_presence(office_id, websocket)
+    
+    try:
+        while True:
+            data = await websocket.receive_json()
+            connection = manager.registry.get(websocket)
+            # A snapshot after a version gap, or narrowing the stream to some rooms
+            if data.get('type') == 'presence_sync':
+                manager.send_personal(websocket, manager.presence_snapshot_message(office_id, connection.interest))
+            elif data.get('type') == 'subscribe':
+                manager.subscribe(connection, data)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"❌ Presence stream error for office {office_id}: {e}")
+    finally:
+        manager.unsubscribe_presence(office_id, websocket)
+
 @app.websocket("/ws/{room_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str):
     """Handle WebSocket connections for real-time communication in rooms"""
     logger.info(f"🔗 WebSocket connection attempt for room: {room_id}")
+    if manager.draining:
+        # Rejected during the handshake; the client retries and lands on another instance
+        await websocket.close(code=DRAIN_CLOSE_CODE)
+        return
     
-    # Accept connection first
-    await websocket.accept()
+    # Accept connection first, in binary mode if the client asked for it (JSON text otherwise)
+    codec = protocol.negotiate(websocket.scope.get('subprotocols', ()))
+    await websocket.accept(subprotocol=codec.name if codec else None)
     
     # Wait for initial user info
     try:
-        initial_data = await websocket.receive_json()
+        if codec:
+            initial_data = codec.decode(await websocket.receive_bytes())
+        else:
+            initial_data = await websocket.receive_json()
+        metrics.messages_in.inc(metrics.message_type(initial_data.get('type')))
         user_info = None
         
         if initial_data.get('type') == 'join':
@@ -447,40 +1284,138 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
                 'role': initial_data.get('role', 'member'),
             }
             logger.info(f"👤 User {user_info['name']} (Firebase: {user_info['firebaseUid']}) joining room {room_id}")
+        
+        # What the client wants to receive, set before its first fan-out (default: everything)
+        interest = EVERYTHING
+        if isinstance(initial_data.get('subscribe'), dict):
+            try:
+                interest = EVERYTHING.update(initial_data['subscribe'])
+            except ValueError as e:
+                logger.warning(f"🔕 Ignoring invalid subscription in join for room {room_id}: {e}")
     except Exception as e:
         logger.error(f"❌ Failed to receive initial data: {e}")
         await websocket.close()
         return
     
-    # Use the proper connection manager with office tracking
-    await manager.connect(room_id, websocket, user_info)
+    # A client back within the grace period picks up its held connection: no join broadcast, no Firebase write
+    connection = None
+    resume_token = initial_data.get('resume_token')
+    if user_info and resume_token and isinstance(resume_token, str):  # Anything else is treated as no token
+        connection = manager.resume(room_id, websocket, user_info['id'], resume_token, codec)
+    resumed = connection is not None
     
-    if user_info:
-        # Send current participants to new user
-        await websocket.send_json({
-            'type': 'participants_list',
-            'participants': manager.get_room_participants(room_id)
-        })
+    if not resumed:
+        # Use the proper connection manager with office tracking
+        connection = await manager.connect(room_id, websocket, user_info, codec, interest)
     
+    # From here on the connection is registered; whatever happens, disconnect() must run
+    resumable = False  # Closes we initiate (rate limits, oversize frames) end the session
     try:
+        if user_info and not resumed and manager.sessions.enabled:
+            manager.send_personal(websocket, {
+                'type': 'session',
+                'token': manager.sessions.issue(connection),
+                'grace_seconds': manager.sessions.grace
+            })
+        
+        # Only clients that say they answer pings are evicted for going quiet
+        capabilities = initial_data.get('capabilities')
+        if isinstance(capabilities, list) and 'ping' in capabilities:
+            connection.answers_pings = True
+        
+        if user_info and not resumed:
+            # Send current participants to new user (through its queue to keep ordering)
+            manager.send_personal(websocket, {
+                'type': 'participants_list',
+                'participants': manager.get_room_participants(room_id)
+            })
+        
+            # Replay the whiteboard so far in one frame
+            whiteboard_snapshot = 'whiteboard' in connection.interest.topics and manager.whiteboard.snapshot_message(room_id)
+            if whiteboard_snapshot:
+                manager.send_personal(websocket, whiteboard_snapshot)
+        
+        if user_info and 'chat' in connection.interest.topics:
+            # Chat the client hasn't seen: everything kept, or the tail after its last_seq when rejoining
+            chat_history = manager.chat.since(room_id, initial_data.get('last_seq'), initial_data.get('chat_epoch'))
+            if chat_history['messages'] or chat_history['truncated']:
+                manager.send_personal(websocket, chat_history)
+        
         while True:
-            data = await websocket.receive_json()
-            logger.info(f"📥 Received from room {room_id}: {data.get('type', 'unknown')} message")
+            raw = await (websocket.receive_bytes() if codec else websocket.receive_text())
+            manager.liveness.touch(connection)
+            if manager.limiter.frame_too_large(raw):
+                metrics.oversize_frames.inc()
+                logger.warning(f"📦 Dropping oversize frame (length {len(raw)}) in room {room_id} (limit {MAX_FRAME_BYTES} bytes)")
+                if RATE_LIMIT_ACTION == RateLimitAction.DISCONNECT:
+                    await websocket.close(code=FRAME_TOO_BIG_CLOSE_CODE)
+                    break
+                continue
             
-            # Add sender info if not present
+            data = codec.decode(raw) if codec else json.loads(raw)
+            metrics.messages_in.inc(metrics.message_type(data.get('type')))
+            if data.get('type') == 'pong':
+                connection.answers_pings = True  # From here on silence means it's gone
+                continue
+            
+            # Token buckets per connection and per room, by message type
+            if not await manager.limiter.admit(connection, data.get('type')):
+                if RATE_LIMIT_ACTION == RateLimitAction.DISCONNECT:
+                    logger.warning(f"🚦 Disconnecting {user_info and user_info['id']} from room {room_id}: rate limit exceeded")
+                    await websocket.close(code=RATE_LIMIT_CLOSE_CODE)
+                    break
+                continue
+            message_log.log("received", room_id, data.get('type'))
+            
+            # Add sender info if not present (before the single encode in broadcast)
             if user_info and 'sender' not in data:
                 data['sender'] = user_info['id']
             
+            # Presence resync after a version gap; answered only to the requester
+            if data.get('type') == 'presence_sync' and user_info:
+                manager.send_personal(websocket, manager.presence_snapshot_message(user_info['office_id'], connection.interest))
+                continue
+            
+            # Change which room topics and presence this socket receives
+            if data.get('type') == 'subscribe':
+                manager.subscribe(connection, data)
+                continue
+            
+            # Chat catch-up after a gap; answered only to the requester
+            if data.get('type') == 'chat_sync':
+                manager.send_personal(websocket, manager.chat.since(room_id, data.get('last_seq'), data.get('epoch')))
+                continue
+            
+            # Targeted messages (WebRTC signals) go only to their recipient; any other target is relayed as before
+            if data.get('target') and isinstance(data['target'], str):
+                manager.send_to_user(room_id, data['target'], data)
+                continue
+            
+            # Number chat for history/resume; the sender learns its seq from the ack
+            if data.get('type') == 'chat':
+                seq = manager.chat.record(room_id, data)
+                manager.send_personal(websocket, {'type': 'chat_ack', 'seq': seq, 'epoch': manager.chat.rooms[room_id].epoch})
+            
+            # Remember strokes for late joiners ('clear' truncates the log)
+            if data.get('type') in ('draw', 'clear'):
+                manager.whiteboard.record(room_id, data)
+            
             # Broadcast to all other participants
             await manager.broadcast(room_id, data, exclude_websocket=websocket)
             
-    except WebSocketDisconnect:
+    except WebSocketDisconnect as e:
         logger.info(f"🔌 WebSocket disconnected from room: {room_id}")
+        # 1000/1001 mean the client left on purpose (closed the tab, left the room); anything else may come back
+        resumable = e.code not in (1000, 1001)
     except Exception as e:
-        logger.error(f"❌ WebSocket error in room {room_id}: {e}")
+        logger.error(f"❌ WebSocket error in room {room_id}: {e}", extra={'event': 'error', 'room_id': room_id})
+        resumable = True
     finally:
-        manager.disconnect(room_id, websocket)
+        manager.disconnect(room_id, websocket, resumable=resumable)
+
+startup_timings = {'import_seconds': round(time.perf_counter() - _import_started, 3)}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_max_size=1024 * 1024,
+                ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() != "false")
\ No newline at end of file
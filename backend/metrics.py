@@ -0,0 +1,179 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Message types we label by; anything else a client sends is counted as 'other'
+# so a misbehaving client can't blow up the number of series
+MESSAGE_TYPES = frozenset({
+    'join', 'chat', 'draw', 'draw_batch', 'clear', 'signal', 'presence_sync', 'ping', 'pong',
+    'participants_list', 'user_joined', 'user_left', 'user_moved_room',
+    'presence_snapshot', 'presence_diff', 'whiteboard_snapshot', 'chat_history', 'chat_ack', 'chat_sync',
+    'session', 'resumed', 'reconnect', 'subscribe', 'subscribed',
+})
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def message_type(message_type: Optional[str]) -> str:
+    # Straight from the client, so it may be a list or dict: those can't be looked up in a frozenset
+    return message_type if isinstance(message_type, str) and message_type in MESSAGE_TYPES else 'other'
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}', *self.samples()]
+
+
+class Counter(Metric):
+    """Monotonic counter; label values are passed positionally: inc('chat', amount=3)"""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Gauge(Metric):
+    """Value set directly, or read from a callback at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self) -> Iterable[str]:
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+                return
+        yield f'{self.name} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    """Fixed-bucket histogram; observe(value, *labels) is a bisect and two additions"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {repr(series[-1])}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# WebSocket traffic
+messages_in = REGISTRY.register(Counter(
+    'ws_messages_in_total', 'Messages received from clients', ['type']))
+messages_out = REGISTRY.register(Counter(
+    'ws_messages_out_total', 'Frames queued to client connections', ['type']))
+fanout_size = REGISTRY.register(Histogram(
+    'ws_fanout_recipients', 'Local recipients per fanned-out message', ['scope'], buckets=SIZE_BUCKETS))
+broadcast_seconds = REGISTRY.register(Histogram(
+    'ws_broadcast_seconds', 'Time to encode and queue one broadcast', ['scope']))
+send_seconds = REGISTRY.register(Histogram(
+    'ws_send_seconds', 'Time for one websocket send in a connection writer'))
+send_failures = REGISTRY.register(Counter(
+    'ws_send_failures_total', 'Websocket sends that raised'))
+send_dropped = REGISTRY.register(Counter(
+    'ws_send_dropped_total', 'Frames dropped or coalesced by full send queues', ['reason']))
+
+rate_limited = REGISTRY.register(Counter(
+    'ws_rate_limited_total', 'Messages over a rate limit', ['scope', 'type', 'action']))
+oversize_frames = REGISTRY.register(Counter(
+    'ws_oversize_frames_total', 'Frames rejected for exceeding the maximum frame size'))
+liveness_evictions = REGISTRY.register(Counter(
+    'ws_liveness_evictions_total', 'Connections closed for not answering pings'))
+
+# Firebase
+firebase_seconds = REGISTRY.register(Histogram(
+    'firebase_call_seconds', 'Latency of blocking Firebase SDK calls run on the thread pool', ['op', 'outcome']))
+
+# Event loop
+loop_lag_seconds = REGISTRY.register(Histogram(
+    'event_loop_lag_seconds', 'How late the event loop woke a sleeping probe task'))
+loop_lag_last = REGISTRY.register(Gauge(
+    'event_loop_lag_last_seconds', 'Most recent event loop lag sample'))
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    """Sleep for `interval` repeatedly and record how much later than asked we woke up"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        loop_lag_seconds.observe(lag)
+        loop_lag_last.set(lag)
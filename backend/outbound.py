@@ -0,0 +1,169 @@
+from fastapi import WebSocket
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, Optional, Tuple, Union
+import asyncio
+import json
+import logging
+import time
+
+import metrics
+
+try:
+    import orjson  # Optional faster encoder
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to consumers that fall too far behind (1013 = "try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class OverflowPolicy(str, Enum):
+    """What a full send queue does with the next outbound message"""
+    DROP_OLDEST = "drop_oldest"  # Discard the oldest pending message
+    COALESCE = "coalesce"        # Replace a pending message of the same type/sender, else drop oldest
+    DISCONNECT = "disconnect"    # Close the slow consumer
+
+
+def encode_message(message: dict) -> str:
+    """Encode a message to a JSON text frame (same compact form as send_json)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(message).decode('utf-8')
+        except TypeError:
+            pass  # e.g. non-string keys; let the stdlib encoder handle or reject it
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def coalesce_key(message: dict) -> str:
+    """Messages sharing this key supersede each other under the coalesce policy"""
+    return f"{message.get('type', 'unknown')}:{message.get('sender', message.get('id', ''))}"
+
+
+Frame = Union[str, bytes]  # JSON text, or a binary frame for clients that negotiated one
+
+
+class OutboundQueue:
+    """Bounded outbound queue for one WebSocket, drained by its own writer task"""
+
+    def __init__(self, websocket: WebSocket, max_size: int = 256,
+                 policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 encode: Callable[[dict], Frame] = encode_message):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.policy = policy
+        self.encode = encode  # How this connection's messages are serialized
+        self.pending: Deque[Tuple[str, Frame]] = deque()  # (coalesce key, encoded frame)
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Per-connection counters
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.high_water = 0
+
+    def start(self):
+        """Spawn the writer task; must be called from a running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    def stop(self):
+        """Stop the writer and discard anything still pending"""
+        self.closed = True
+        self.pending.clear()
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def enqueue(self, message: dict) -> bool:
+        """Encode and queue a message for this connection only"""
+        return self.enqueue_frame(coalesce_key(message), self.encode(message))
+
+    def enqueue_frame(self, key: str, frame: Frame) -> bool:
+        """Queue a pre-encoded frame without waiting on the socket. Returns False if it was not accepted"""
+        if self.closed:
+            return False
+
+        if len(self.pending) >= self.max_size:
+            if not self._handle_overflow(key, frame):
+                return False
+        else:
+            self.pending.append((key, frame))
+
+        self.high_water = max(self.high_water, len(self.pending))
+        self._wakeup.set()
+        return True
+
+    def _handle_overflow(self, key: str, frame: Frame) -> bool:
+        if self.policy == OverflowPolicy.DISCONNECT:
+            logger.warning(f"🐢 Send queue full ({self.max_size}), disconnecting slow consumer")
+            self.dropped += len(self.pending) + 1
+            metrics.send_dropped.inc('disconnect', amount=len(self.pending) + 1)
+            self.stop()
+            asyncio.create_task(self._close_slow_consumer())
+            return False
+
+        if self.policy == OverflowPolicy.COALESCE:
+            # Newest-first scan; the superseded entry is removed and the new one goes to the
+            # tail so it is never delivered ahead of messages queued before it
+            for index in range(len(self.pending) - 1, -1, -1):
+                if self.pending[index][0] == key:
+                    del self.pending[index]
+                    self.pending.append((key, frame))
+                    self.coalesced += 1
+                    metrics.send_dropped.inc('coalesced')
+                    return True
+
+        self.pending.popleft()
+        self.pending.append((key, frame))
+        self.dropped += 1
+        metrics.send_dropped.inc('drop_oldest')
+        return True
+
+    async def _close_slow_consumer(self):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception as e:
+            logger.debug(f"Slow consumer already closed: {e}")
+
+    async def _writer(self):
+        try:
+            while not self.closed:
+                if not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                _, frame = self.pending.popleft()
+                try:
+                    started = time.perf_counter()
+                    if isinstance(frame, str):
+                        await self.websocket.send_text(frame)
+                    else:
+                        await self.websocket.send_bytes(frame)
+                    metrics.send_seconds.observe(time.perf_counter() - started)
+                    self.sent += 1
+                except Exception as e:
+                    # The socket is gone; the receive loop will run the disconnect path
+                    self.failed += 1
+                    metrics.send_failures.inc()
+                    logger.error(f"❌ Failed to send message to connection: {e}")
+                    self.closed = True
+                    self.pending.clear()
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queue_depth': len(self.pending),
+            'queue_high_water': self.high_water,
+            'queue_max_size': self.max_size,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'failed': self.failed,
+        }
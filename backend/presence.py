@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import uuid
+
+
+class PresenceCache:
+    """In-process office presence kept current from connect/disconnect/move events
+
+    Every change bumps the office's version, which doubles as the ETag for
+    GET /offices/{office_id}/participants and as the sequence number of the
+    presence diffs pushed to subscribers. It also bumps a version for each
+    room it touches (sent as room_versions), so a subscriber that only sees
+    some rooms can still spot a missed diff.
+
+    Only occupied offices and rooms keep an entry. Versions never go back,
+    though: an office that empties leaves its last version as a floor that
+    offices (re)starting later count up from, and a room that fills again
+    starts at its office's version, which is never below the room's own.
+    So a cached ETag can't match a later, different state.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]  # Versions restart with the process; keep old ETags from matching
+        self.offices: Dict[str, Dict[str, Dict[str, dict]]] = {}  # office_id -> room_id -> {user_id: user}
+        self.versions: Dict[str, int] = {}  # office_id -> version (occupied offices)
+        self.room_versions: Dict[str, Dict[str, int]] = {}  # office_id -> room_id -> version (occupied rooms)
+        self.floor = 0  # Highest version of any office that has emptied
+        self._snapshots: Dict[str, Tuple[int, dict]] = {}  # office_id -> (version, snapshot)
+
+    def _diff(self, office_id: str, change: dict, room_ids: Iterable[str]) -> dict:
+        version = self.versions.get(office_id, self.floor) + 1
+        occupied = self.offices.get(office_id, {})
+        versions = self.room_versions.setdefault(office_id, {})
+        touched = {}
+        for room_id in room_ids:
+            # Room versions bump at most once per office version, so a new room starting there is past any old one
+            touched[room_id] = versions[room_id] + 1 if room_id in versions else version
+            if room_id in occupied:
+                versions[room_id] = touched[room_id]
+            else:
+                versions.pop(room_id, None)
+        if not versions:
+            del self.room_versions[office_id]
+        if occupied:
+            self.versions[office_id] = version
+        else:
+            self.versions.pop(office_id, None)
+            self.floor = max(self.floor, version)
+        return {
+            'type': 'presence_diff',
+            'office_id': office_id,
+            'version': version,
+            'room_versions': touched,
+            'changes': [change]
+        }
+
+    def join(self, office_id: str, room_id: str, user: dict) -> dict:
+        """Record a user entering a room and return the presence diff"""
+        self.offices.setdefault(office_id, {}).setdefault(room_id, {})[user['id']] = user
+        return self._diff(office_id, {'op': 'join', 'room_id': room_id, 'user': user}, (room_id,))
+
+    def leave(self, office_id: str, room_id: str, user_id: str) -> Optional[dict]:
+        """Record a user leaving; returns None if they weren't present"""
+        rooms = self.offices.get(office_id, {})
+        if rooms.get(room_id, {}).pop(user_id, None) is None:
+            return None
+        if not rooms[room_id]:
+            del rooms[room_id]
+        if not rooms:
+            self.offices.pop(office_id, None)
+            self._snapshots.pop(office_id, None)
+        return self._diff(office_id, {'op': 'leave', 'room_id': room_id, 'user_id': user_id}, (room_id,))
+
+    def move(self, office_id: str, user_id: str, from_room: Optional[str], to_room: str) -> Optional[dict]:
+        """Record a room change; returns None if the user isn't known in from_room"""
+        rooms = self.offices.get(office_id, {})
+        user = rooms.get(from_room, {}).pop(user_id, None)
+        if user is None:
+            return None
+        if not rooms[from_room]:
+            del rooms[from_room]
+        user = {**user, 'room_id': to_room, 'current_room': to_room}
+        rooms.setdefault(to_room, {})[user_id] = user
+        return self._diff(office_id, {
+            'op': 'move', 'user_id': user_id, 'from_room': from_room, 'room_id': to_room, 'user': user
+        }, (from_room, to_room))
+
+    def version(self, office_id: str) -> int:
+        # An empty office's state is the same whatever it was before, so any version past its last will do
+        return self.versions.get(office_id, self.floor)
+
+    def etag(self, office_id: str) -> str:
+        return f'W/"{self.epoch}-{self.version(office_id)}"'
+
+    def snapshot(self, office_id: str, room_ids: Optional[Iterable[str]] = None) -> dict:
+        """Roster in the shape served by GET /offices/{office_id}/participants
+        
+        The whole office is memoised per version; with room_ids only those rooms are included.
+        """
+        version = self.version(office_id)
+        if room_ids is not None:
+            return self._build_snapshot(office_id, version, room_ids)
+        cached = self._snapshots.get(office_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        snapshot = self._build_snapshot(office_id, version, self.offices.get(office_id, {}))
+        self._snapshots[office_id] = (version, snapshot)
+        return snapshot
+
+    def _build_snapshot(self, office_id: str, version: int, room_ids: Iterable[str]) -> dict:
+        occupied = self.offices.get(office_id, {})
+        versions = self.room_versions.get(office_id, {})
+        rooms: Dict[str, List[dict]] = {
+            room_id: list(occupied[room_id].values()) for room_id in room_ids if room_id in occupied
+        }
+        return {
+            'office_id': office_id,
+            'version': version,
+            'room_versions': {room_id: versions[room_id] for room_id in rooms if room_id in versions},
+            'rooms': rooms,
+            'total_participants': sum(len(users) for users in rooms.values()),
+            'active_rooms': len([room for room, users in rooms.items() if users])
+        }
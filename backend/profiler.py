@@ -0,0 +1,77 @@
+from collections import Counter
+from typing import Optional
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread
+
+    Meant to be switched on for a minute in production: the target thread is
+    never interrupted, the sampler just reads sys._current_frames() every
+    `interval` seconds. Results are folded stacks ("outer;inner count" lines),
+    which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self):
+        self.samples: Counter = Counter()
+        self.interval = 0.01
+        self.started_at: Optional[float] = None
+        self.sample_count = 0
+        self._target: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, target_thread: Optional[int] = None):
+        """Start sampling `target_thread` (default: the calling thread, i.e. the event loop)"""
+        if self.running:
+            return
+        self.samples.clear()
+        self.sample_count = 0
+        self.interval = interval
+        self._target = target_thread or threading.get_ident()
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        logger.warning(f"🔬 Sampling profiler started ({interval * 1000:.0f}ms interval)")
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        logger.warning(f"🔬 Sampling profiler stopped after {self.sample_count} samples")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def folded(self, limit: Optional[int] = None) -> str:
+        """Folded stacks, most frequent first"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common(limit))
+
+    def status(self) -> dict:
+        return {
+            'running': self.running,
+            'interval_ms': round(self.interval * 1000, 2),
+            'samples': self.sample_count,
+            'seconds': round(time.monotonic() - self.started_at, 1) if self.started_at else 0,
+        }
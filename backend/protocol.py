@@ -0,0 +1,104 @@
+from typing import Iterable, List, Optional
+import json
+
+try:
+    import msgpack  # Optional; without it every client gets JSON
+except ImportError:
+    msgpack = None
+
+# Clients ask for binary frames with Sec-WebSocket-Protocol; clients that don't get JSON text as before
+MSGPACK_SUBPROTOCOL = "virtual-office.msgpack.v1"
+
+# Compact layouts: fixed-position arrays instead of maps for the highest-volume messages.
+#   draw:       [DRAW, sender, id, from_x, from_y, to_x, to_y]
+#   draw_batch: [DRAW_BATCH, sender, [id, from_x, from_y, to_x, to_y, id, from_x, ...]]
+# Anything with other fields goes as a plain map, so nothing is lost.
+DRAW = 1
+DRAW_BATCH = 2
+DRAW_KEYS = frozenset({'type', 'id', 'from', 'to', 'sender'})
+SEGMENT_KEYS = frozenset({'id', 'from', 'to'})
+
+
+def _segment(message: dict) -> Optional[list]:
+    start, end = message['from'], message['to']
+    if not (isinstance(start, dict) and isinstance(end, dict) and len(start) == 2 and len(end) == 2):
+        return None
+    return [message['id'], start['x'], start['y'], end['x'], end['y']]
+
+
+def _compact(message: dict) -> Optional[list]:
+    try:
+        message_type = message.get('type')
+        if message_type == 'draw' and SEGMENT_KEYS <= message.keys() <= DRAW_KEYS:
+            segment = _segment(message)
+            return None if segment is None else [DRAW, message.get('sender'), *segment]
+        if message_type == 'draw_batch' and message.keys() == {'type', 'sender', 'messages'}:
+            flat = []
+            for segment in message['messages']:
+                if segment.keys() != SEGMENT_KEYS:
+                    return None
+                values = _segment(segment)
+                if values is None:
+                    return None
+                flat.extend(values)
+            return [DRAW_BATCH, message['sender'], flat]
+    except (KeyError, TypeError, AttributeError):
+        pass
+    return None
+
+
+def _expand(array: list) -> dict:
+    if array[0] == DRAW:
+        _, sender, segment_id, x1, y1, x2, y2 = array
+        message = {'type': 'draw', 'id': segment_id, 'from': {'x': x1, 'y': y1}, 'to': {'x': x2, 'y': y2}}
+        if sender is not None:
+            message['sender'] = sender
+        return message
+    if array[0] == DRAW_BATCH:
+        _, sender, flat = array
+        return {'type': 'draw_batch', 'sender': sender, 'messages': [
+            {'id': flat[i], 'from': {'x': flat[i + 1], 'y': flat[i + 2]}, 'to': {'x': flat[i + 3], 'y': flat[i + 4]}}
+            for i in range(0, len(flat), 5)
+        ]}
+    raise ValueError(f"unknown compact message code {array[0]!r}")
+
+
+class MessagePackCodec:
+    """MessagePack binary frames, with fixed layouts for draw traffic
+
+    Floats go as 32-bit, which is plenty for canvas coordinates.
+    """
+
+    name = MSGPACK_SUBPROTOCOL
+
+    def __init__(self):
+        self._packer = msgpack.Packer(use_single_float=True)
+
+    def encode(self, message: dict) -> bytes:
+        return self._packer.pack(_compact(message) or message)
+
+    def decode(self, frame: bytes) -> dict:
+        value = msgpack.unpackb(frame, raw=False, strict_map_key=False)
+        if isinstance(value, list):
+            return _expand(value)
+        if not isinstance(value, dict):
+            raise ValueError("binary frame is not a message")
+        return value
+
+    def from_json_frame(self, frame: str) -> bytes:
+        """Re-encode a JSON frame built for text clients (once per fan-out, not per recipient)"""
+        return self.encode(json.loads(frame))
+
+
+MSGPACK = MessagePackCodec() if msgpack is not None else None
+
+
+def negotiate(offered: Iterable[str]) -> Optional[MessagePackCodec]:
+    """Codec for the subprotocols a client offered; None means JSON text"""
+    if MSGPACK is not None and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK
+    return None
+
+
+def available() -> List[str]:
+    return [MSGPACK_SUBPROTOCOL] if MSGPACK is not None else []
@@ -0,0 +1,145 @@
+from enum import Enum
+from typing import Dict, Optional, Tuple, Union
+import asyncio
+import logging
+import time
+
+import metrics
+from registry import Connection
+
+logger = logging.getLogger(__name__)
+
+# Close codes: 1008 = policy violation, 1009 = message too big
+RATE_LIMIT_CLOSE_CODE = 1008
+FRAME_TOO_BIG_CLOSE_CODE = 1009
+
+Limits = Dict[str, Tuple[float, float]]  # message type ('*' = any other) -> (tokens per second, burst)
+
+
+class RateLimitAction(str, Enum):
+    """What happens to a message over its rate limit"""
+    DROP = "drop"              # Discard the message
+    THROTTLE = "throttle"      # Stop reading from the sender until it is back under its rate
+    DISCONNECT = "disconnect"  # Close the sender with 1008
+
+
+def parse_limits(spec: str) -> Limits:
+    """Parse 'draw=200/400,chat=5/20,*=20/50' into {type: (rate, burst)}; 'off' or '' disables"""
+    limits: Limits = {}
+    if spec.strip().lower() in ('', 'off'):
+        return limits
+    for part in spec.split(','):
+        message_type, _, value = part.strip().partition('=')
+        rate, _, burst = value.partition('/')
+        limits[message_type.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+
+class RateLimiter:
+    """Token buckets per connection and per room, keyed by message type
+
+    A message needs a token from both its connection's bucket and its room's
+    bucket for that type (or for '*'). Connection buckets live on the
+    Connection record and go away with it; room buckets are dropped with
+    forget_room() once the room empties.
+    """
+
+    def __init__(self, connection_limits: Limits, room_limits: Limits,
+                 action: RateLimitAction = RateLimitAction.DROP, max_frame_bytes: int = 64 * 1024,
+                 max_throttle: float = 1.0):
+        self.connection_limits = connection_limits
+        self.room_limits = room_limits
+        self.action = action
+        self.max_frame_bytes = max_frame_bytes
+        self.max_throttle = max_throttle  # Longest a throttled sender is paused before the message is dropped
+        self.rooms: Dict[str, Dict[str, TokenBucket]] = {}
+
+    @staticmethod
+    def _bucket(buckets: Dict[str, TokenBucket], limits: Limits, message_type: str,
+                now: float) -> Optional[TokenBucket]:
+        key = message_type if message_type in limits else '*'
+        bucket = buckets.get(key)
+        if bucket is None:
+            limit = limits.get(key)
+            if limit is None:
+                return None
+            bucket = buckets[key] = TokenBucket(limit[0], limit[1], now)
+        # TokenBucket.refill() inlined; this runs twice per received message
+        tokens = bucket.tokens + (now - bucket.updated) * bucket.rate
+        bucket.tokens = tokens if tokens < bucket.burst else bucket.burst
+        bucket.updated = now
+        return bucket
+
+    def frame_too_large(self, raw: Union[str, bytes]) -> bool:
+        # len() counts characters for text; only encode when it could be over the limit in UTF-8
+        size = len(raw)
+        if size > self.max_frame_bytes:
+            return True
+        return (size * 4 > self.max_frame_bytes and isinstance(raw, str)
+                and len(raw.encode('utf-8')) > self.max_frame_bytes)
+
+    async def admit(self, connection: Connection, message_type: Optional[str], throttled: bool = False) -> bool:
+        """Take one token for this message; returns False if it must not be relayed"""
+        message_type = message_type if message_type and isinstance(message_type, str) else 'unknown'  # Bucket key
+        now = time.monotonic()
+        if connection.rate_buckets is None:
+            connection.rate_buckets = {}
+        room_buckets = self.rooms.get(connection.room_id)
+        if room_buckets is None:
+            room_buckets = self.rooms[connection.room_id] = {}
+        own = self._bucket(connection.rate_buckets, self.connection_limits, message_type, now)
+        room = self._bucket(room_buckets, self.room_limits, message_type, now)
+
+        if (own is None or own.tokens >= 1) and (room is None or room.tokens >= 1):
+            if own is not None:
+                own.tokens -= 1
+            if room is not None:
+                room.tokens -= 1
+            return True
+        return await self._over_limit(connection, message_type, own, room, throttled)
+
+    async def _over_limit(self, connection: Connection, message_type: str, own: Optional[TokenBucket],
+                          room: Optional[TokenBucket], throttled: bool) -> bool:
+        short = [(scope, bucket) for scope, bucket in (('connection', own), ('room', room))
+                 if bucket is not None and bucket.tokens < 1]
+        scope = short[0][0]
+        label = metrics.message_type(message_type)
+        if self.action == RateLimitAction.THROTTLE and not throttled:
+            wait = max((1 - bucket.tokens) / bucket.rate for _, bucket in short)
+            if wait <= self.max_throttle:
+                metrics.rate_limited.inc(scope, label, 'throttle')
+                # Not reading from the socket meanwhile pushes back on the sender through TCP
+                await asyncio.sleep(wait)
+                return await self.admit(connection, message_type, throttled=True)
+
+        action = 'disconnect' if self.action == RateLimitAction.DISCONNECT else 'drop'
+        metrics.rate_limited.inc(scope, label, action)
+        logger.debug(f"🚦 {scope} rate limit hit for {message_type} in room {connection.room_id}")
+        return False
+
+    def forget_room(self, room_id: str):
+        self.rooms.pop(room_id, None)
+
+    def stats(self) -> dict:
+        return {
+            'action': self.action.value,
+            'max_frame_bytes': self.max_frame_bytes,
+            'connection_limits': self.connection_limits,
+            'room_limits': self.room_limits,
+            'rooms_tracked': len(self.rooms),
+        }
@@ -0,0 +1,132 @@
+from fastapi import WebSocket
+from typing import Dict, Iterator, Optional
+import itertools
+import time
+
+from interest import EVERYTHING, Interest, InterestIndex
+from outbound import OutboundQueue
+
+
+class Connection:
+    """Everything the server tracks for one WebSocket"""
+
+    __slots__ = ('id', 'websocket', 'send_queue', 'room_id', 'office_id', 'user_id',
+                 'current_room', 'participant', 'last_seen', 'reported_seen', 'sweep_slot',
+                 'rate_buckets', 'codec', 'interest', 'answers_pings')
+
+    def __init__(self, connection_id: int, websocket: WebSocket, send_queue: OutboundQueue,
+                 room_id: Optional[str] = None, office_id: Optional[str] = None,
+                 user_id: Optional[str] = None, participant: Optional[dict] = None):
+        self.id = connection_id
+        self.websocket = websocket
+        self.send_queue = send_queue
+        self.room_id = room_id          # Room whose /ws/{room_id} socket this is
+        self.office_id = office_id
+        self.user_id = user_id          # None until the client has sent 'join'
+        self.current_room = room_id     # Room shown in office presence (changes on move)
+        self.participant = participant  # Public user info sent in participants_list
+        self.last_seen = time.monotonic()  # Last frame received from the client
+        self.reported_seen = 0.0        # last_seen value last written to Firebase
+        self.sweep_slot: Optional[int] = None  # Liveness timing-wheel slot, None when not scheduled
+        self.rate_buckets: Optional[dict] = None  # message type -> TokenBucket, created on first message
+        self.codec = None               # Negotiated binary codec (protocol.py), None for JSON text
+        self.interest: Interest = EVERYTHING  # What it subscribed to (interest.py)
+        self.answers_pings = False      # Said so in join, or has sent a pong; only these are evicted
+
+
+class ConnectionRegistry:
+    """Connection records plus the indexes needed to find them in O(1)
+
+    Rooms keep insertion order, so iteration matches join order.
+    Every index is cleaned up in remove(), including empty rooms and offices.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.connections: Dict[int, Connection] = {}  # connection id -> record
+        self.by_socket: Dict[WebSocket, Connection] = {}  # websocket -> record
+        self.rooms: Dict[str, Dict[int, Connection]] = {}  # room_id -> {connection id: record}
+        self.room_users: Dict[str, Dict[str, Connection]] = {}  # room_id -> {user_id: record}
+        self.offices: Dict[str, Dict[str, Connection]] = {}  # office_id -> {user_id: record}
+        self.users: Dict[str, Connection] = {}  # user_id -> record
+        self.interests = InterestIndex()  # room topic / presence scope -> subscribed records
+
+    def add(self, websocket: WebSocket, send_queue: OutboundQueue, room_id: Optional[str] = None,
+            office_id: Optional[str] = None, user_id: Optional[str] = None,
+            participant: Optional[dict] = None, interest: Interest = EVERYTHING) -> Connection:
+        connection = Connection(next(self._ids), websocket, send_queue, room_id, office_id, user_id, participant)
+        connection.interest = interest
+        self.connections[connection.id] = connection
+        self.by_socket[websocket] = connection
+        if room_id is not None:
+            self.rooms.setdefault(room_id, {})[connection.id] = connection
+        if user_id is not None:
+            # A user reconnecting before their old socket is reaped takes over the indexes
+            self.users[user_id] = connection
+            self.room_users.setdefault(room_id, {})[user_id] = connection
+            self.offices.setdefault(office_id, {})[user_id] = connection
+        self.interests.add(connection)
+        return connection
+
+    def remove(self, connection: Connection):
+        self.connections.pop(connection.id, None)
+        if self.by_socket.get(connection.websocket) is connection:
+            del self.by_socket[connection.websocket]
+
+        if connection.room_id is not None:
+            self._discard(self.rooms, connection.room_id, connection.id, connection)
+        if connection.user_id is not None:
+            if self.users.get(connection.user_id) is connection:
+                del self.users[connection.user_id]
+            self._discard(self.room_users, connection.room_id, connection.user_id, connection)
+            self._discard(self.offices, connection.office_id, connection.user_id, connection)
+        self.interests.remove(connection)
+
+    def subscribe(self, connection: Connection, interest: Interest):
+        """Replace what a connection is subscribed to"""
+        self.interests.remove(connection)
+        connection.interest = interest
+        self.interests.add(connection)
+
+    def rebind(self, connection: Connection, websocket: Optional[WebSocket] = None):
+        """Move a connection to a new socket; with None only the old socket's entry goes (detached)"""
+        if self.by_socket.get(connection.websocket) is connection:
+            del self.by_socket[connection.websocket]
+        if websocket is not None:
+            connection.websocket = websocket
+            self.by_socket[websocket] = connection
+
+    @staticmethod
+    def _discard(index: dict, outer_key, inner_key, connection: Connection):
+        """Remove index[outer_key][inner_key] if it still points at connection; drop empty buckets"""
+        bucket = index.get(outer_key)
+        if bucket is None or bucket.get(inner_key) is not connection:
+            return
+        del bucket[inner_key]
+        if not bucket:
+            del index[outer_key]
+
+    def get(self, websocket: WebSocket) -> Optional[Connection]:
+        return self.by_socket.get(websocket)
+
+    def room(self, room_id: str, topic: Optional[str] = None) -> Iterator[Connection]:
+        """Connections in a room; with a topic, only those subscribed to it"""
+        if topic is not None:
+            return self.interests.room(room_id, topic)
+        return iter(self.rooms.get(room_id, {}).values())
+
+    def room_size(self, room_id: str) -> int:
+        return len(self.rooms.get(room_id, ()))
+
+    def room_user(self, room_id: str, user_id: str) -> Optional[Connection]:
+        return self.room_users.get(room_id, {}).get(user_id)
+
+    def room_members(self, room_id: str) -> Iterator[Connection]:
+        """Joined users of a room (connections that sent 'join')"""
+        return iter(self.room_users.get(room_id, {}).values())
+
+    def office_members(self, office_id: str) -> Iterator[Connection]:
+        return iter(self.offices.get(office_id, {}).values())
+
+    def user(self, user_id: str) -> Optional[Connection]:
+        return self.users.get(user_id)
@@ -0,0 +1,168 @@
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import secrets
+
+from outbound import Frame, coalesce_key, encode_message
+from registry import Connection
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayBuffer:
+    """Stands in for a detached connection's send queue, keeping what it would have sent
+
+    Has the enqueue side of OutboundQueue so fan-out code doesn't need to know
+    the connection is detached. Past `max_frames` it stops keeping frames and
+    marks itself overflowed; the client then gets a fresh state snapshot
+    instead of a replay.
+    """
+
+    def __init__(self, pending: Iterable[Tuple[str, Frame]] = (), max_frames: int = 128,
+                 encode: Callable[[dict], Frame] = encode_message):
+        self.max_frames = max_frames
+        self.encode = encode
+        self.frames: Deque[Tuple[str, Frame]] = deque()  # (coalesce key, encoded frame)
+        self.overflowed = False
+        for key, frame in pending:
+            self.enqueue_frame(key, frame)
+
+    def enqueue(self, message: dict) -> bool:
+        return self.enqueue_frame(coalesce_key(message), self.encode(message))
+
+    def enqueue_frame(self, key: str, frame: Frame) -> bool:
+        if len(self.frames) >= self.max_frames:
+            if not self.overflowed:
+                self.overflowed = True
+                self.frames.clear()
+            return False
+        if self.overflowed:
+            return False
+        self.frames.append((key, frame))
+        return True
+
+    def stop(self):
+        self.frames.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'detached': True, 'queue_depth': len(self.frames), 'replay_overflowed': self.overflowed}
+
+
+class Session:
+    __slots__ = ('token', 'connection', 'replay', 'timer')
+
+    def __init__(self, token: str, connection: Connection):
+        self.token = token
+        self.connection = connection
+        self.replay: Optional[ReplayBuffer] = None  # Set while the client is away
+        self.timer: Optional[asyncio.TimerHandle] = None  # Fires at the end of the grace period
+
+
+class SessionStore:
+    """Resume tokens for joined connections, and the grace period after a drop
+
+    Every joined connection gets a token. When its socket drops, detach()
+    swaps the send queue for a ReplayBuffer and starts a `grace` second
+    timer; the connection stays registered, so nobody sees a leave. A client
+    presenting the token before the timer fires gets the same Connection back
+    through reattach(); otherwise `expire` runs the usual leave path.
+    """
+
+    def __init__(self, grace: float = 30.0, max_replay_frames: int = 128):
+        self.grace = grace
+        self.max_replay_frames = max_replay_frames
+        self.sessions: Dict[str, Session] = {}  # token -> session
+        self.by_connection: Dict[int, Session] = {}  # connection id -> session
+
+        # Metrics
+        self.detached = 0
+        self.resumed = 0
+        self.resynced = 0
+        self.expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.grace > 0
+
+    def issue(self, connection: Connection) -> str:
+        """New token for a connection (replacing any earlier one, so each token works once)"""
+        self.discard(connection)
+        session = Session(secrets.token_urlsafe(18), connection)
+        self.sessions[session.token] = session
+        self.by_connection[connection.id] = session
+        return session.token
+
+    def detach(self, connection: Connection, expire: Callable[[Connection], None]) -> Optional[ReplayBuffer]:
+        """Start the grace period; returns the buffer to install as the send queue, None without a session"""
+        session = self.by_connection.get(connection.id)
+        if session is None or not self.enabled:
+            return None
+        # Frames that never made it out of the old queue go first
+        session.replay = ReplayBuffer(connection.send_queue.pending, self.max_replay_frames, connection.send_queue.encode)
+        session.timer = asyncio.get_running_loop().call_later(self.grace, self._expire, session, expire)
+        self.detached += 1
+        return session.replay
+
+    def _expire(self, session: Session, expire: Callable[[Connection], None]):
+        self.discard(session.connection)
+        self.expired += 1
+        try:
+            expire(session.connection)
+        except Exception as e:
+            logger.error(f"❌ Failed to expire session for {session.connection.user_id}: {e}")
+
+    def lookup(self, token: str, room_id: str, user_id: str) -> Optional[Connection]:
+        """The connection a token resumes, if it is still held for this room and user"""
+        session = self.sessions.get(token) if isinstance(token, str) else None
+        if session is None:
+            return None
+        connection = session.connection
+        if connection.room_id != room_id or connection.user_id != user_id:
+            return None
+        return connection
+
+    def reattach(self, connection: Connection) -> Optional[ReplayBuffer]:
+        """End the grace period; returns what was buffered meanwhile"""
+        session = self.by_connection.get(connection.id)
+        if session is None:
+            return None
+        if session.timer:
+            session.timer.cancel()
+            session.timer = None
+        replay, session.replay = session.replay, None
+        if replay is not None:
+            if replay.overflowed:
+                self.resynced += 1
+            else:
+                self.resumed += 1
+        return replay
+
+    def held(self) -> List[Connection]:
+        """Connections currently waiting out their grace period"""
+        return [session.connection for session in self.sessions.values() if session.replay is not None]
+
+    def discard(self, connection: Connection):
+        session = self.by_connection.pop(connection.id, None)
+        if session is not None:
+            self.sessions.pop(session.token, None)
+            if session.timer:
+                session.timer.cancel()
+
+    def close(self):
+        for session in self.sessions.values():
+            if session.timer:
+                session.timer.cancel()
+        self.sessions.clear()
+        self.by_connection.clear()
+
+    def stats(self) -> dict:
+        return {
+            'grace_seconds': self.grace,
+            'active': len(self.sessions),
+            'held': sum(1 for session in self.sessions.values() if session.replay is not None),
+            'detached': self.detached,
+            'resumed': self.resumed,
+            'resynced': self.resynced,
+            'expired': self.expired,
+        }
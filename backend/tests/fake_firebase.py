@@ -0,0 +1,75 @@
+from typing import Any, List, Optional
+
+
+class FakeReference:
+    """In-memory stand-in for firebase_admin.db.Reference
+
+    Covers what the backend calls: child(), get(), set(), update() with
+    multi-path keys and delete(). Set `fail_updates` to make the next N
+    update() calls raise, as a dropped connection would.
+    """
+
+    def __init__(self, root: Optional[dict] = None, path: str = ''):
+        self._root = root if root is not None else {'tree': None, 'updates': [], 'fail_updates': 0}
+        self.path = path.strip('/')
+
+    @property
+    def tree(self) -> Optional[dict]:
+        return self._root['tree']
+
+    @property
+    def updates(self) -> List[dict]:
+        """Every update() payload that was applied, in order"""
+        return self._root['updates']
+
+    @property
+    def fail_updates(self) -> int:
+        return self._root['fail_updates']
+
+    @fail_updates.setter
+    def fail_updates(self, count: int):
+        self._root['fail_updates'] = count
+
+    def _parts(self, path: str = '') -> List[str]:
+        full = '/'.join(part for part in (self.path, path.strip('/')) if part)
+        return full.split('/') if full else []
+
+    def child(self, path: str) -> 'FakeReference':
+        return FakeReference(self._root, '/'.join(self._parts(path)))
+
+    def get(self, shallow: bool = False) -> Any:
+        node = self.tree
+        for part in self._parts():
+            if not isinstance(node, dict):
+                return None
+            node = node.get(part)
+        if shallow and isinstance(node, dict):
+            return {key: True for key in node}
+        return node
+
+    def _write(self, parts: List[str], value: Any):
+        def write(node, parts):
+            if not parts:
+                return value
+            node = dict(node) if isinstance(node, dict) else {}
+            child = write(node.get(parts[0]), parts[1:])
+            if child is None or child == {}:
+                node.pop(parts[0], None)
+            else:
+                node[parts[0]] = child
+            return node or None
+        self._root['tree'] = write(self.tree, parts)
+
+    def set(self, value: Any):
+        self._write(self._parts(), value)
+
+    def delete(self):
+        self._write(self._parts(), None)
+
+    def update(self, value: dict):
+        if self.fail_updates:
+            self.fail_updates -= 1
+            raise ConnectionError("fake Firebase unavailable")
+        for path, child_value in value.items():
+            self._write(self._parts(path), child_value)
+        self.updates.append(dict(value))
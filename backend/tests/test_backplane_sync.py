@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+import main
+from backplane import Backplane, InProcessBackplane, InProcessBus
+
+
+class FakeWebSocket:
+    """Keeps whatever the writer task sends"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def node(bus: InProcessBus, name: str) -> main.ConnectionManager:
+    return main.ConnectionManager(InProcessBackplane(bus, node_id=name, heartbeat_interval=60))
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+async def join(manager: main.ConnectionManager, user_id: str, room_id: str = 'r') -> FakeWebSocket:
+    websocket = FakeWebSocket()
+    await manager.connect(room_id, websocket, {'id': user_id, 'name': user_id, 'office_id': 'o'})
+    return websocket
+
+
+def ids(participants):
+    return sorted(participant['id'] for participant in participants)
+
+
+def test_late_node_learns_existing_participants():
+    async def scenario():
+        bus = InProcessBus()
+        a = node(bus, 'a')
+        await a.start()
+        await join(a, 'ua')
+
+        b = node(bus, 'b')
+        await b.start()
+        await settle()
+        await join(b, 'ub')
+        await settle()
+
+        assert ids(b.get_room_participants('r')) == ['ua', 'ub']
+        assert ids(a.get_room_participants('r')) == ['ua', 'ub']
+        assert b.presence.snapshot('o')['total_participants'] == 2
+        assert b.send_to_user('r', 'ua', {'type': 'signal', 'target': 'ua'})
+        assert not b.unknown_target_drops
+        await a.close()
+        await b.close()
+    asyncio.run(scenario())
+
+
+def test_roster_is_resent_after_a_purged_peer_returns():
+    async def scenario():
+        bus = InProcessBus()
+        a, b = node(bus, 'a'), node(bus, 'b')
+        await a.start()
+        await b.start()
+        await join(a, 'ua')
+        await a.move_user_to_room('ua', 'lounge')
+        await settle()
+        assert ids(b.get_room_participants('r')) == ['ua']
+
+        # b decided a had stalled; a's next envelope makes it a new peer again
+        await b.backplane._peer_gone('a')
+        assert b.get_room_participants('r') == []
+        a.backplane.publish({'kind': 'heartbeat'})
+        await settle()
+
+        assert ids(b.get_room_participants('r')) == ['ua']
+        rooms = b.presence.snapshot('o')['rooms']
+        assert ids(rooms['lounge']) == ['ua'] and 'r' not in rooms
+        await a.close()
+        await b.close()
+    asyncio.run(scenario())
+
+
+def test_applying_a_roster_is_idempotent():
+    async def scenario():
+        bus = InProcessBus()
+        b = node(bus, 'b')
+        await b.start()
+        roster = [{'office_id': 'o', 'room_id': 'r', 'user_id': 'ua', 'current_room': 'r',
+                   'participant': {'id': 'ua', 'name': 'ua', 'office_id': 'o', 'room_id': 'r'}}]
+        b._apply_remote_roster('a', roster)
+        version = b.presence.version('o')
+        b._apply_remote_roster('a', roster)
+        assert b.presence.version('o') == version
+        assert ids(b.get_room_participants('r')) == ['ua']
+
+        b._apply_remote_roster('a', [])
+        assert b.get_room_participants('r') == []
+        assert 'a' not in b.remote_users and 'r' not in b.remote_rooms
+        await b.close()
+    asyncio.run(scenario())
+
+
+def test_held_session_expiring_after_a_move_to_another_node_keeps_the_user():
+    async def scenario():
+        bus = InProcessBus()
+        a, b = node(bus, 'a'), node(bus, 'b')
+        await a.start()
+        await b.start()
+        watcher = await join(b, 'uw')
+        websocket = FakeWebSocket()
+        connection = await a.connect('r', websocket, {'id': 'ub', 'name': 'ub', 'office_id': 'o'})
+        a.sessions.issue(connection)
+        await settle()
+
+        # ub's socket to a drops (held for the grace period) and they reconnect through b
+        a.sessions.grace = 0.05
+        a.disconnect('r', websocket, resumable=True)
+        await join(b, 'ub')
+        await settle()
+        assert ids(b.get_room_participants('r')) == ['ub', 'uw']
+        assert ids(a.get_room_participants('r')) == ['ub', 'uw']
+        assert b.room_participant_count('r') == 2
+
+        watcher.sent.clear()
+        await asyncio.sleep(0.1)  # a's grace period runs out
+        await settle()
+        assert not [frame for frame in watcher.sent if 'user_left' in frame]
+        for manager in (a, b):
+            assert ids(manager.get_room_participants('r')) == ['ub', 'uw']
+            assert ids(manager.presence.snapshot('o')['rooms']['r']) == ['ub', 'uw']
+        assert a.sessions.expired == 1
+        await a.close()
+        await b.close()
+    asyncio.run(scenario())
+
+
+def test_a_backplane_without_a_transport_cannot_be_created():
+    class Incomplete(Backplane):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(node_id='x')
@@ -0,0 +1,82 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+from chat_history import ChatHistory
+
+
+def history(count: int = 3) -> ChatHistory:
+    chat = ChatHistory(max_messages=10)
+    for i in range(count):
+        chat.record('r', {'type': 'chat', 'text': str(i)})
+    return chat
+
+
+def test_since_returns_only_newer_messages():
+    chat = history()
+    frame = chat.since('r', 1, chat.rooms['r'].epoch)
+    assert [message['seq'] for message in frame['messages']] == [2, 3]
+    assert not frame['truncated']
+
+
+def test_since_treats_malformed_last_seq_as_nothing_seen():
+    chat = history()
+    epoch = chat.rooms['r'].epoch
+    for last_seq in ('1', 1.5, True, [1], {'seq': 1}, -4):
+        frame = chat.since('r', last_seq, epoch)
+        assert [message['seq'] for message in frame['messages']] == [1, 2, 3], last_seq
+    assert chat.since('empty', '7')['truncated'] is False
+
+
+def test_join_with_malformed_last_seq_still_cleans_up():
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/ws/chat-room') as first:
+            first.send_json({'type': 'join', 'id': 'ua', 'name': 'A', 'office_id': 'o'})
+            first.send_json({'type': 'chat', 'text': 'hi'})
+            while (ack := first.receive_json())['type'] != 'chat_ack':
+                pass
+
+            with client.websocket_connect('/ws/chat-room') as second:
+                second.send_json({'type': 'join', 'id': 'ub', 'name': 'B', 'office_id': 'o',
+                                  'last_seq': '1', 'chat_epoch': ack['epoch']})
+                while (frame := second.receive_json())['type'] != 'chat_history':
+                    pass
+                assert [message['text'] for message in frame['messages']] == ['hi']
+                second.send_json({'type': 'chat_sync', 'last_seq': {'bad': 1}, 'epoch': ack['epoch']})
+                while (frame := second.receive_json())['type'] != 'chat_history':
+                    pass
+                second.close(1000)
+
+            while (left := first.receive_json())['type'] != 'user_left':
+                pass
+            assert left['user_id'] == 'ub'
+        assert main.manager.registry.user('ub') is None
+        assert 'ub' not in json.dumps(main.manager.presence.snapshot('o'))
+
+
+def test_recorded_messages_carry_the_room_epoch():
+    chat = history(1)
+    message = {'type': 'chat', 'text': 'x'}
+    chat.record('r', message)
+    assert message['epoch'] == chat.rooms['r'].epoch
+    frame = chat.since('r', message['seq'], message['epoch'])
+    assert frame['messages'] == [] and not frame['truncated']
+
+
+def test_flush_compacts_the_log_once_it_outgrows_what_is_kept(tmp_path):
+    path = tmp_path / 'chat.log'
+    chat = ChatHistory(max_messages=5, max_bytes=1024, log_path=str(path))
+    for i in range(200):
+        chat.record('r', {'type': 'chat', 'text': 'x' * 40, 'n': i})
+        chat.flush()
+    assert chat.compactions > 0
+    assert path.stat().st_size <= chat.compact_ratio * chat.max_bytes + 200
+    chat.record('r', {'type': 'chat', 'text': 'last'})
+    chat.close()
+
+    reloaded = ChatHistory(max_messages=5, max_bytes=1024, log_path=str(path))
+    room = reloaded.rooms['r']
+    assert room.epoch == chat.rooms['r'].epoch and room.next_seq == 202
+    assert [message['seq'] for message, _ in room.messages] == [197, 198, 199, 200, 201]
+    reloaded.close()
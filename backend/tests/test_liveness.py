@@ -0,0 +1,38 @@
+import liveness
+from liveness import LivenessSweeper
+from registry import ConnectionRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def sweep(monkeypatch, seconds: int, answers_pings: bool):
+    clock = Clock()
+    monkeypatch.setattr(liveness.time, 'monotonic', clock)
+    pings, evicted = [], []
+    sweeper = LivenessSweeper(pings.append, evicted.append, interval=2, timeout=6, tick=1)
+    connection = ConnectionRegistry().add(object(), None, 'r')
+    connection.answers_pings = answers_pings
+    sweeper.track(connection)
+    for _ in range(seconds):
+        clock.now += 1
+        sweeper.advance()
+    return connection, pings, evicted
+
+
+def test_silent_client_that_answers_pings_is_evicted(monkeypatch):
+    connection, pings, evicted = sweep(monkeypatch, 10, answers_pings=True)
+    assert evicted == [connection]
+    assert pings == [connection]
+
+
+def test_client_without_ping_support_is_never_evicted(monkeypatch):
+    connection, pings, evicted = sweep(monkeypatch, 30, answers_pings=False)
+    assert evicted == []
+    # Still pinged every interval, in case it starts answering
+    assert 10 <= len(pings) <= 15
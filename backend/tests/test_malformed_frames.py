@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def receive(websocket, message_type: str) -> dict:
+    while (frame := websocket.receive_json())['type'] != message_type:
+        pass
+    return frame
+
+
+def test_non_string_target_is_relayed_to_the_room():
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/ws/frames-room') as first, client.websocket_connect('/ws/frames-room') as second:
+            first.send_json({'type': 'join', 'id': 'ua', 'name': 'A', 'office_id': 'o'})
+            second.send_json({'type': 'join', 'id': 'ub', 'name': 'B', 'office_id': 'o'})
+            receive(first, 'participants_list')
+            receive(second, 'participants_list')
+            for target in (['ub'], {'id': 'ub'}):
+                first.send_json({'type': 'signal', 'target': target})
+                assert receive(second, 'signal')['target'] == target
+
+            # The sender is still connected
+            first.send_json({'type': 'chat', 'text': 'still here'})
+            assert receive(first, 'chat_ack')['seq'] == 1
+
+
+def test_non_string_type_is_relayed_without_dropping_the_sender():
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/ws/types-room') as first, client.websocket_connect('/ws/types-room') as second:
+            first.send_json({'type': 'join', 'id': 'ua', 'name': 'A', 'office_id': 'o'})
+            second.send_json({'type': 'join', 'id': 'ub', 'name': 'B', 'office_id': 'o'})
+            receive(first, 'participants_list')
+            receive(second, 'participants_list')
+            for message_type in (['chat'], {'draw': 1}, 7):
+                first.send_json({'type': message_type, 'text': 'odd'})
+                while (frame := second.receive_json())['type'] != message_type:
+                    pass
+                first.send_json({'type': message_type, 'target': 'nobody'})
+
+            first.send_json({'type': 'chat', 'text': 'still here'})
+            assert receive(first, 'chat_ack')['seq'] == 1
+    assert 'other' in main.manager.unknown_target_drops
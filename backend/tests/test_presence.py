@@ -0,0 +1,41 @@
+from presence import PresenceCache
+
+
+def user(user_id: str) -> dict:
+    return {'id': user_id, 'name': user_id}
+
+
+def test_room_versions_keep_rising_after_a_room_empties():
+    presence = PresenceCache()
+    presence.join('o', 'lobby', user('ua'))
+    presence.join('o', 'r', user('ub'))
+    left = presence.leave('o', 'r', user('ub')['id'])
+    assert 'r' not in presence.room_versions['o']
+
+    rejoined = presence.join('o', 'r', user('uc'))
+    assert rejoined['room_versions']['r'] > left['room_versions']['r']
+    assert rejoined['version'] == left['version'] + 1
+
+
+def test_empty_offices_are_dropped_without_reusing_versions():
+    presence = PresenceCache()
+    presence.join('o', 'r', user('ua'))
+    occupied_etag = presence.etag('o')
+    presence.leave('o', 'r', 'ua')
+    assert 'o' not in presence.versions and 'o' not in presence.room_versions
+    empty_etag = presence.etag('o')
+    assert empty_etag != occupied_etag
+
+    presence.join('o', 'r', user('ub'))
+    assert presence.etag('o') not in (occupied_etag, empty_etag)
+    assert presence.snapshot('o')['rooms']['r'][0]['id'] == 'ub'
+
+
+def test_diffs_stay_consecutive_for_a_dashboard_across_an_empty_office():
+    presence = PresenceCache()
+    versions = [presence.snapshot('o')['version']]
+    versions.append(presence.join('o', 'r', user('ua'))['version'])
+    versions.append(presence.leave('o', 'r', 'ua')['version'])
+    versions.append(presence.snapshot('o')['version'])
+    versions.append(presence.join('o', 'r', user('ua'))['version'])
+    assert versions == [0, 1, 2, 2, 3]
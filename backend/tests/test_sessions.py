@@ -0,0 +1,57 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from sessions import SessionStore
+
+
+def test_lookup_ignores_tokens_that_are_not_strings():
+    store = SessionStore(30, 10)
+    for token in (['t'], {'t': 1}, 7, None):
+        assert store.lookup(token, 'r', 'u') is None
+
+
+def test_join_with_malformed_resume_token_joins_fresh():
+    with TestClient(main.app) as client:
+        for token in (['t'], {'t': 1}, 7):
+            with client.websocket_connect('/ws/session-room') as websocket:
+                websocket.send_json({'type': 'join', 'id': 'ua', 'name': 'A', 'office_id': 'o', 'resume_token': token})
+                while (frame := websocket.receive_json())['type'] != 'participants_list':
+                    assert frame['type'] != 'resumed'
+            assert not main.manager.registry.users
+
+
+def receive(websocket, message_type: str) -> dict:
+    while (frame := websocket.receive_json())['type'] != message_type:
+        pass
+    return frame
+
+
+def test_resume_replays_what_was_missed():
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/ws/resume-room') as first:
+            first.send_json({'type': 'join', 'id': 'ua', 'name': 'A', 'office_id': 'o'})
+            token = receive(first, 'session')['token']
+            first.close(4000)  # Not a clean close: the session is held
+        deadline = time.monotonic() + 5
+        while not main.manager.sessions.held() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with client.websocket_connect('/ws/resume-room') as other:
+            other.send_json({'type': 'join', 'id': 'ub', 'name': 'B', 'office_id': 'o'})
+            other.send_json({'type': 'chat', 'text': 'while you were out'})
+            receive(other, 'chat_ack')
+
+            with client.websocket_connect('/ws/resume-room') as again:
+                again.send_json({'type': 'join', 'id': 'ua', 'name': 'A', 'office_id': 'o', 'resume_token': token})
+                resumed = receive(again, 'resumed')
+                assert not resumed['resync'] and resumed['replayed'] >= 2
+                assert resumed['token'] != token
+                assert receive(again, 'user_joined')['user']['id'] == 'ub'
+                assert receive(again, 'chat')['text'] == 'while you were out'
+
+                # Back on the live path, and listed once
+                other.send_json({'type': 'chat', 'text': 'welcome back'})
+                assert receive(again, 'chat')['text'] == 'welcome back'
+                assert sorted(p['id'] for p in main.manager.get_room_participants('resume-room')) == ['ua', 'ub']
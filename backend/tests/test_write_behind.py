@@ -0,0 +1,176 @@
+import asyncio
+
+from write_behind import FirebaseWriteBehind
+from tests.fake_firebase import FakeReference
+
+PATH = 'offices/o1/rooms/r1/participants/u1'
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def writer(root=None, **kwargs) -> FirebaseWriteBehind:
+    # Long interval: tests flush explicitly
+    return FirebaseWriteBehind(root or FakeReference(), flush_interval=60, max_workers=1, **kwargs)
+
+
+def test_same_path_keeps_last_write():
+    async def scenario():
+        wb = writer()
+        wb.set(PATH, {'name': 'A'})
+        wb.set(PATH, {'name': 'B'})
+        assert wb.pending == {PATH: {'name': 'B'}}
+        assert wb.merged == 1
+        await wb.close()
+    run(scenario())
+
+
+def test_pending_ancestor_absorbs_descendant_write():
+    async def scenario():
+        wb = writer()
+        wb.set(PATH, {'name': 'A', 'last_seen': 't0'})
+        wb.set(f'{PATH}/last_seen', 't1')
+        assert wb.pending == {PATH: {'name': 'A', 'last_seen': 't1'}}
+        await wb.close()
+    run(scenario())
+
+
+def test_descendant_delete_inside_pending_ancestor():
+    async def scenario():
+        wb = writer()
+        wb.set(PATH, {'name': 'A', 'last_seen': 't0'})
+        wb.delete(f'{PATH}/last_seen')
+        assert wb.pending == {PATH: {'name': 'A'}}
+        await wb.close()
+    run(scenario())
+
+
+def test_ancestor_write_supersedes_pending_descendants():
+    async def scenario():
+        wb = writer()
+        wb.set(f'{PATH}/last_seen', 't1')
+        wb.set('offices/o1/rooms/r1/participants/u2/last_seen', 't1')
+        wb.delete('offices/o1/rooms/r1')
+        assert wb.pending == {'offices/o1/rooms/r1': None}
+        assert wb.merged == 2
+        await wb.close()
+    run(scenario())
+
+
+def test_sibling_prefix_is_not_a_descendant():
+    async def scenario():
+        wb = writer()
+        wb.set('offices/o1/rooms/r10/participants/u1', {'name': 'A'})
+        wb.delete('offices/o1/rooms/r1')
+        assert set(wb.pending) == {'offices/o1/rooms/r10/participants/u1', 'offices/o1/rooms/r1'}
+        await wb.close()
+    run(scenario())
+
+
+def test_flush_sends_one_multi_path_update():
+    async def scenario():
+        root = FakeReference()
+        wb = writer(root)
+        wb.set(PATH, {'name': 'A'})
+        wb.set('offices/o1/rooms/r2/participants/u2', {'name': 'B'})
+        await wb.flush()
+        assert len(root.updates) == 1
+        assert root.child(PATH).get() == {'name': 'A'}
+        assert root.child('offices/o1/rooms/r2/participants/u2/name').get() == 'B'
+        assert wb.pending == {}
+        await wb.close()
+    run(scenario())
+
+
+def test_failed_flush_is_merged_under_newer_writes():
+    async def scenario():
+        root = FakeReference()
+        wb = writer(root)
+        wb.set(PATH, {'name': 'A', 'last_seen': 't0'})
+        root.fail_updates = 1
+        await wb.flush()
+        assert wb.failed_flushes == 1
+        assert wb.pending == {PATH: {'name': 'A', 'last_seen': 't0'}}
+
+        # Written after the failure; must win over the retried batch
+        wb.set(f'{PATH}/last_seen', 't1')
+        await wb.flush()
+        assert root.child(PATH).get() == {'name': 'A', 'last_seen': 't1'}
+        assert wb.dropped_writes == 0
+        await wb.close()
+    run(scenario())
+
+
+def test_failed_delete_is_not_resurrected_by_retry():
+    async def scenario():
+        root = FakeReference()
+        root.child(PATH).set({'name': 'A'})
+        wb = writer(root)
+        wb.set(f'{PATH}/last_seen', 't1')
+        root.fail_updates = 1
+        await wb.flush()
+        wb.delete(PATH)
+        await wb.flush()
+        assert root.child(PATH).get() is None
+        await wb.close()
+    run(scenario())
+
+
+def test_batch_dropped_after_max_retries():
+    async def scenario():
+        root = FakeReference()
+        wb = writer(root, max_retries=2)
+        wb.set(PATH, {'name': 'A'})
+        root.fail_updates = 3
+        for _ in range(3):
+            await wb.flush()
+        assert wb.failed_flushes == 3
+        assert wb.dropped_writes == 1
+        assert wb.pending == {}
+        assert root.tree is None
+
+        # The failure count starts over for later writes
+        wb.set(PATH, {'name': 'B'})
+        await wb.flush()
+        assert root.child(PATH).get() == {'name': 'B'}
+        await wb.close()
+    run(scenario())
+
+
+def test_close_flushes_pending_and_ignores_later_writes():
+    async def scenario():
+        root = FakeReference()
+        wb = writer(root)
+        wb.set(PATH, {'name': 'A'})
+        await wb.close()
+        assert root.child(PATH).get() == {'name': 'A'}
+        wb.set(PATH, {'name': 'B'})
+        assert wb.pending == {}
+        assert wb.closed
+    run(scenario())
+
+
+def test_close_retries_a_failing_flush():
+    async def scenario():
+        root = FakeReference()
+        wb = writer(root)
+        wb.set(PATH, {'name': 'A'})
+        root.fail_updates = 1
+        await wb.close()
+        assert root.child(PATH).get() == {'name': 'A'}
+    run(scenario())
+
+
+def test_background_flusher_sends_after_interval():
+    async def scenario():
+        root = FakeReference()
+        wb = FirebaseWriteBehind(root, flush_interval=0.01, max_workers=1)
+        wb.set(PATH, {'name': 'A'})
+        for _ in range(100):
+            if root.updates:
+                break
+            await asyncio.sleep(0.01)
+        assert root.child(PATH).get() == {'name': 'A'}
+        await wb.close()
+    run(scenario())
@@ -0,0 +1,183 @@
+from array import array
+from typing import Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Stroke:
+    """A polyline drawn by one sender, stored as flat float32 x,y pairs"""
+
+    __slots__ = ('sender', 'points')
+
+    def __init__(self, sender: str, x1: float, y1: float, x2: float, y2: float):
+        self.sender = sender
+        self.points = array('f', (x1, y1, x2, y2))
+
+    def continues_at(self, x: float, y: float) -> bool:
+        # Compare in float32, which is what the point was stored as
+        return array('f', (x, y)) == self.points[-2:]
+
+
+class WhiteboardLog:
+    """Stroke log for one room
+
+    New segments extend the sender's open stroke while they connect to it.
+    compact() folds finished strokes into two flat arrays (points plus stroke
+    offsets), which drops the per-stroke object overhead.
+    """
+
+    def __init__(self):
+        self.points = array('f')   # Compacted strokes: x,y pairs back to back
+        self.offsets = array('I')  # Start index into points of each compacted stroke
+        self.tail: List[Stroke] = []  # Strokes not yet compacted, oldest first
+        self.open: Dict[str, Stroke] = {}  # sender -> stroke still being drawn
+        self.segments = 0
+        self.version = 0
+        self._snapshot: Optional[dict] = None
+        self._snapshot_version = -1
+
+    def add_segment(self, sender: str, x1: float, y1: float, x2: float, y2: float):
+        stroke = self.open.get(sender)
+        if stroke is not None and stroke.continues_at(x1, y1):
+            stroke.points.extend((x2, y2))
+        else:
+            stroke = Stroke(sender, x1, y1, x2, y2)
+            self.tail.append(stroke)
+            self.open[sender] = stroke
+        self.segments += 1
+        self.version += 1
+
+    def clear(self):
+        self.points = array('f')
+        self.offsets = array('I')
+        self.tail.clear()
+        self.open.clear()
+        self.segments = 0
+        self.version += 1
+
+    def compact(self):
+        """Fold every stroke that is no longer being drawn into the flat arrays"""
+        still_open = {id(stroke) for stroke in self.open.values()}
+        remaining = []
+        for stroke in self.tail:
+            if id(stroke) in still_open:
+                remaining.append(stroke)
+            else:
+                self.offsets.append(len(self.points))
+                self.points.extend(stroke.points)
+        self.tail = remaining
+        # Senders whose stroke got folded start a new one on their next segment
+        self.open = {sender: stroke for sender, stroke in self.open.items() if id(stroke) in still_open}
+
+    def close_strokes(self):
+        """Treat every stroke as finished (e.g. before compacting an idle room)"""
+        self.open.clear()
+
+    def evict_oldest(self, target_bytes: int) -> int:
+        """Drop the oldest compacted strokes until nbytes() <= target_bytes; returns strokes dropped"""
+        excess = self.nbytes() - target_bytes
+        count, cut = 0, 0
+        while count < len(self.offsets) and excess > 0:
+            end = self.offsets[count + 1] if count + 1 < len(self.offsets) else len(self.points)
+            excess -= (end - cut) * self.points.itemsize + self.offsets.itemsize
+            cut = end
+            count += 1
+        if count:
+            # One slice for the whole batch; arrays don't support cheap pops from the front
+            self.points = self.points[cut:]
+            self.offsets = array('I', (offset - cut for offset in self.offsets[count:]))
+            self.version += 1
+        return count
+
+    def nbytes(self) -> int:
+        tail_floats = sum(len(stroke.points) for stroke in self.tail)
+        return (len(self.points) + tail_floats) * self.points.itemsize + len(self.offsets) * self.offsets.itemsize
+
+    def strokes(self) -> Iterator[array]:
+        for index, start in enumerate(self.offsets):
+            end = self.offsets[index + 1] if index + 1 < len(self.offsets) else len(self.points)
+            yield self.points[start:end]
+        for stroke in self.tail:
+            yield stroke.points
+
+    def snapshot_message(self) -> dict:
+        """One frame with every stroke, cached until the log changes"""
+        if self._snapshot_version != self.version:
+            self._snapshot = {
+                'type': 'whiteboard_snapshot',
+                'strokes': [[round(value, 1) for value in points] for points in self.strokes()]
+            }
+            self._snapshot_version = self.version
+        return self._snapshot
+
+    def __bool__(self) -> bool:
+        return bool(self.offsets) or bool(self.tail)
+
+
+class WhiteboardStore:
+    """Per-room stroke logs with a memory cap per room"""
+
+    def __init__(self, max_bytes_per_room: int = 1024 * 1024, compact_every: int = 512):
+        self.max_bytes_per_room = max_bytes_per_room
+        self.compact_every = compact_every
+        self.rooms: Dict[str, WhiteboardLog] = {}
+        self.evicted_strokes = 0
+
+    def record(self, room_id: str, message: dict):
+        """Apply a relayed 'draw', 'draw_batch' or 'clear' message to the room's log"""
+        message_type = message.get('type')
+        if message_type == 'draw_batch':
+            for item in message.get('messages', ()):
+                self.record(room_id, {**item, 'type': 'draw', 'sender': message.get('sender', '')})
+            return
+        if message_type == 'clear':
+            log = self.rooms.get(room_id)
+            if log:
+                log.clear()
+            return
+        if message_type != 'draw':
+            return
+
+        try:
+            start, end = message['from'], message['to']
+            x1, y1, x2, y2 = float(start['x']), float(start['y']), float(end['x']), float(end['y'])
+        except (KeyError, TypeError, ValueError):
+            logger.debug(f"Ignoring malformed draw message in room {room_id}")
+            return
+
+        log = self.rooms.setdefault(room_id, WhiteboardLog())
+        log.add_segment(str(message.get('sender', message.get('id', ''))), x1, y1, x2, y2)
+
+        if log.segments % self.compact_every == 0:
+            log.compact()
+            self._enforce_cap(log)
+
+    def _enforce_cap(self, log: WhiteboardLog):
+        if log.nbytes() > self.max_bytes_per_room:
+            # Keep some headroom so we don't evict on every segment
+            self.evicted_strokes += log.evict_oldest(int(self.max_bytes_per_room * 0.9))
+
+    def snapshot_message(self, room_id: str) -> Optional[dict]:
+        log = self.rooms.get(room_id)
+        if not log:
+            return None
+        return log.snapshot_message()
+
+    def compact_all(self):
+        """Periodic pass: fold finished strokes in every room"""
+        for log in self.rooms.values():
+            log.close_strokes()
+            log.compact()
+            self._enforce_cap(log)
+
+    def drop(self, room_id: str):
+        """Forget a room's log once nobody is left in it"""
+        self.rooms.pop(room_id, None)
+
+    def stats(self) -> dict:
+        return {
+            'rooms': len(self.rooms),
+            'bytes': sum(log.nbytes() for log in self.rooms.values()),
+            'evicted_strokes': self.evicted_strokes,
+        }
@@ -0,0 +1,180 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _set_in(tree: Optional[dict], parts: list, value: Any) -> Optional[dict]:
+    """Return a copy of tree with value written at parts (None deletes)"""
+    tree = dict(tree) if isinstance(tree, dict) else {}
+    head, rest = parts[0], parts[1:]
+    if rest:
+        tree[head] = _set_in(tree.get(head), rest, value)
+    elif value is None:
+        tree.pop(head, None)
+    else:
+        tree[head] = value
+    return tree or None
+
+
+class FirebaseWriteBehind:
+    """Coalesces Realtime Database writes per path and applies them off the event loop
+
+    Writes are merged into a pending map keyed by path and flushed every
+    flush_interval seconds as one multi-path update() on a bounded thread pool.
+    A None value deletes the path, matching update() semantics.
+    """
+
+    def __init__(self, root_ref, flush_interval: float = 0.05, max_workers: int = 4,
+                 max_retries: int = 3):
+        self.root_ref = root_ref
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firebase")
+        self.pending: Dict[str, Any] = {}  # path -> value (None = delete)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._failures = 0
+        self.closed = False
+
+        # Metrics
+        self.writes = 0
+        self.merged = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped_writes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def start(self):
+        """Start the background flusher; must be called from a running event loop"""
+        if self._flush_task is None or self._flush_task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def set(self, path: str, value: Any):
+        """Queue a write of value at path"""
+        if self.closed:
+            logger.warning(f"⚠️ Write to {path} after shutdown ignored")
+            return
+        self.writes += 1
+        self._merge(path.strip('/'), value)
+        self.start()
+        self._wakeup.set()
+
+    def delete(self, path: str):
+        """Queue removal of path"""
+        self.set(path, None)
+
+    def _merge(self, path: str, value: Any):
+        parts = path.split('/')
+
+        # A pending write to an ancestor absorbs this one
+        for depth in range(1, len(parts)):
+            ancestor = '/'.join(parts[:depth])
+            if ancestor in self.pending:
+                self.pending[ancestor] = _set_in(self.pending[ancestor], parts[depth:], value)
+                self.merged += 1
+                return
+
+        # This write supersedes pending writes to the path itself and to its descendants
+        prefix = path + '/'
+        superseded = [key for key in self.pending if key == path or key.startswith(prefix)]
+        for key in superseded:
+            del self.pending[key]
+        self.merged += len(superseded)
+        self.pending[path] = value
+
+    async def run(self, func: Callable, *args) -> Any:
+        """Run a blocking SDK call (e.g. Reference.get) on the bounded thread pool"""
+        loop = asyncio.get_running_loop()
+        op = getattr(func, '__name__', 'call')
+        started = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self.executor, func, *args)
+        except Exception:
+            metrics.firebase_seconds.observe(time.perf_counter() - started, op, 'error')
+            raise
+        metrics.firebase_seconds.observe(time.perf_counter() - started, op, 'ok')
+        return result
+
+    async def _flush_loop(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                # Let writes from the same burst pile up before sending
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """Send everything pending as a single multi-path update"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+
+            started = time.perf_counter()
+            try:
+                await self.run(self.root_ref.update, batch)
+                self._failures = 0
+            except Exception as e:
+                self.failed_flushes += 1
+                self._failures += 1
+                if self._failures > self.max_retries:
+                    self.dropped_writes += len(batch)
+                    self._failures = 0
+                    logger.error(f"❌ Dropping {len(batch)} Firebase writes after repeated failures: {e}")
+                else:
+                    logger.error(f"❌ Firebase flush failed, will retry: {e}")
+                    # Re-apply the failed batch underneath anything written since
+                    newer, self.pending = self.pending, {}
+                    for path, value in list(batch.items()) + list(newer.items()):
+                        self._merge(path, value)
+                    if self._wakeup:
+                        self._wakeup.set()
+                return
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self.total_flush_ms += elapsed_ms
+
+    async def close(self):
+        """Flush pending writes and stop the flusher; used on shutdown"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        for _ in range(self.max_retries + 1):
+            if not self.pending:
+                break
+            await self.flush()
+        self.closed = True
+        self.executor.shutdown(wait=True)
+        logger.info(f"💾 Firebase write-behind closed after {self.flushes} flushes")
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': len(self.pending),
+            'writes': self.writes,
+            'merged': self.merged,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'dropped_writes': self.dropped_writes,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'max_flush_ms': round(self.max_flush_ms, 2),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
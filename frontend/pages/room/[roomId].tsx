@@ -42,6 +42,15 @@ export default function Room() {
   const peersRef = useRef<PeerRef[]>([]);
   const socketRef = useRef<WebSocket | null>(null);
   const streamRef = useRef<MediaStream | null>(null);
+  // Last chat seq seen in the server's numbering, so a rejoin only fetches what was missed
+  const lastChatSeqRef = useRef(0);
+  const chatEpochRef = useRef<string | null>(null);
+  // Server-issued resume token; reconnecting with it skips the leave/join round trip
+  const sessionTokenRef = useRef<string | null>(null);
+  const reconnectAttemptsRef = useRef(0);
+  // Set when a draining server says how long to wait before coming back
+  const reconnectDelayRef = useRef<number | null>(null);
+  const leavingRef = useRef(false);
 
   const [peers, setPeers] = useState<PeerRef[]>([]);
   const [messages, setMessages] = useState<ChatMsg[]>([]);
@@ -325,6 +334,18 @@ export default function Room() {
       ctx.stroke();
     } else if (msg.type === 'clear') {
       ctx.clearRect(0, 0, canvas.width, canvas.height);
+    } else if (msg.type === 'whiteboard_snapshot') {
+      // The snapshot is the whole board, so anything drawn before (e.g. before a reconnect) goes
+      ctx.clearRect(0, 0, canvas.width, canvas.height);
+      // Each stroke is a flat [x1, y1, x2, y2, ...] polyline
+      for (const points of msg.strokes || []) {
+        ctx.beginPath();
+        ctx.moveTo(points[0], points[1]);
+        for (let i = 2; i < points.length; i += 2) {
+          ctx.lineTo(points[i], points[i + 1]);
+        }
+        ctx.stroke();
+      }
     }
   };
 
@@ -336,6 +357,14 @@ export default function Room() {
         console.log('👥 Received participants list:', msg.participants);
         setParticipants(msg.participants || []);
         
+        // After a reconnect that couldn't resume, drop peers for people who left meanwhile
+        peersRef.current = peersRef.current.filter(({ id, peer }) => {
+          if ((msg.participants || []).some((p: any) => p.id === id)) return true;
+          peer.destroy();
+          return false;
+        });
+        setPeers([...peersRef.current]);
+        
         // Create peer connections for existing participants
         if (msg.participants && msg.participants.length > 0) {
           msg.participants.forEach((participant: any) => {
@@ -434,6 +463,13 @@ export default function Room() {
         
       case 'chat':
         console.log('💬 Chat message from:', msg.sender);
+        if (msg.seq && msg.epoch && msg.epoch !== chatEpochRef.current) {
+          // First message we've seen numbered in this epoch (e.g. joined before the room had any chat)
+          chatEpochRef.current = msg.epoch;
+          lastChatSeqRef.current = msg.seq;
+        } else if (msg.seq) {
+          lastChatSeqRef.current = Math.max(lastChatSeqRef.current, msg.seq);
+        }
         setMessages((prev) => [...prev, { 
           id: msg.sender, 
           text: msg.text,
@@ -442,11 +478,68 @@ export default function Room() {
         }]);
         break;
         
+      case 'chat_ack':
+        // Our own message's place in the room's numbering
+        chatEpochRef.current = msg.epoch;
+        lastChatSeqRef.current = Math.max(lastChatSeqRef.current, msg.seq);
+        break;
+        
+      case 'chat_history': {
+        // Messages sent while we were away (all kept messages on first join)
+        const missed = (msg.messages || []).filter((m: any) => 
+          msg.epoch !== chatEpochRef.current || m.seq > lastChatSeqRef.current
+        );
+        console.log('💬 Chat history:', missed.length, 'messages', msg.truncated ? '(older ones dropped)' : '');
+        chatEpochRef.current = msg.epoch;
+        lastChatSeqRef.current = msg.last_seq;
+        setMessages((prev) => [...prev, ...missed.map((m: any) => ({
+          id: m.sender,
+          text: m.text,
+          timestamp: m.timestamp ? new Date(m.timestamp).toLocaleTimeString() : '',
+          sender: m.sender
+        }))]);
+        break;
+      }
+        
       case 'draw':
       case 'clear':
         console.log('🎨 Whiteboard action from:', msg.id, msg.type);
         handleRemoteDrawing(msg);
         break;
+        
+      case 'session':
+      case 'resumed':
+        // Resume token for the next reconnect (each one is single-use)
+        sessionTokenRef.current = msg.token;
+        if (msg.type === 'resumed') {
+          console.log('▶️ Session resumed,', msg.resync ? 'resyncing state' : `${msg.replayed} missed messages replayed`);
+        }
+        break;
+        
+      case 'reconnect':
+        // The server is restarting: its close follows; reconnect after the delay it picked (spread across clients).
+        // The resume token won't be known to the next instance, so come back with a plain join.
+        reconnectDelayRef.current = msg.delay_ms ?? 0;
+        sessionTokenRef.current = null;
+        console.log(`🚰 Server restarting, reconnecting ${msg.delay_ms}ms after close`);
+        break;
+        
+      case 'ping':
+        // Server liveness check; idle sockets that don't answer get evicted
+        socketRef.current?.send(JSON.stringify({ type: 'pong' }));
+        break;
+        
+      case 'draw_batch':
+        // Segments the server held for one batching window, in drawing order
+        for (const segment of msg.messages || []) {
+          handleRemoteDrawing({ ...segment, type: 'draw', sender: msg.sender });
+        }
+        break;
+        
+      case 'whiteboard_snapshot':
+        console.log('🎨 Replaying whiteboard:', msg.strokes?.length, 'strokes');
+        handleRemoteDrawing(msg);
+        break;
     }
   };
 
@@ -606,80 +699,115 @@ export default function Room() {
         
         const signalingUrl = getWsUrl();
         console.log('🔗 Attempting WebSocket connection to:', signalingUrl);
-        const ws = new WebSocket(signalingUrl);
-        socketRef.current = ws;
-
-        ws.onopen = async () => {
-          console.log('✅ WebSocket connected successfully');
-          setIsConnected(true);
-          setConnectionStatus('Connected');
+        // Reconnects reuse this; within the server's grace period they resume the same session
+        const openSocket = () => {
+          const ws = new WebSocket(signalingUrl);
+          socketRef.current = ws;
+
+          ws.onopen = async () => {
+            console.log('✅ WebSocket connected successfully');
+            setIsConnected(true);
+            setConnectionStatus('Connected');
+            setMediaError('');
+            const isReconnect = reconnectAttemptsRef.current > 0;
+            reconnectAttemptsRef.current = 0;
           
-          // Start activity tracking
-          try {
-            if (user?.uid && actualRoomId && officeId) {
-              const sessionId = await startActivityTracking(
-                user.uid,
-                officeId,
-                actualRoomId,
-                userName
-              );
-              setActivitySessionId(sessionId);
-              console.log('✅ Activity tracking started:', sessionId);
+            // Start activity tracking (once; a reconnect continues the same activity session)
+            try {
+              if (user?.uid && actualRoomId && officeId && !isReconnect) {
+                const sessionId = await startActivityTracking(
+                  user.uid,
+                  officeId,
+                  actualRoomId,
+                  userName
+                );
+                setActivitySessionId(sessionId);
+                console.log('✅ Activity tracking started:', sessionId);
+              }
+            } catch (error) {
+              console.error('❌ Failed to start activity tracking:', error);
             }
-          } catch (error) {
-            console.error('❌ Failed to start activity tracking:', error);
-          }
           
-          // Send join message with authenticated user info
-          const userInfo = {
-            type: 'join', 
-            id: myId.current,
-            name: userName,
-            email: user?.email || '',
-            avatar: user?.photoURL || '',
-            firebaseUid: user?.uid || '',
-            displayName: user?.displayName || userName,
-            office_id: officeId || 'default',
-            role: isOwner ? 'owner' : 'member'
-          };
+            // Send join message with authenticated user info
+            const userInfo = {
+              type: 'join', 
+              id: myId.current,
+              name: userName,
+              email: user?.email || '',
+              avatar: user?.photoURL || '',
+              firebaseUid: user?.uid || '',
+              displayName: user?.displayName || userName,
+              office_id: officeId || 'default',
+              role: isOwner ? 'owner' : 'member',
+              // Office presence comes over the dashboard's own stream; this socket only needs room traffic
+              subscribe: { presence: 'none' },
+              // Answers the server's ping messages, so it may be evicted when it stops answering
+              capabilities: ['ping'],
+              // Lets the server send only the chat missed since the last connection
+              ...(chatEpochRef.current ? { last_seq: lastChatSeqRef.current, chat_epoch: chatEpochRef.current } : {}),
+              ...(sessionTokenRef.current ? { resume_token: sessionTokenRef.current } : {})
+            };
           
-          ws.send(JSON.stringify(userInfo));
-          console.log('📤 Sent join message with authenticated user info:', {
-            id: userInfo.id,
-            name: userInfo.name,
-            firebaseUid: userInfo.firebaseUid
-          });
-        };
+            ws.send(JSON.stringify(userInfo));
+            console.log('📤 Sent join message with authenticated user info:', {
+              id: userInfo.id,
+              name: userInfo.name,
+              firebaseUid: userInfo.firebaseUid
+            });
+          };
 
-        ws.onerror = (error) => {
-          console.error('❌ WebSocket error:', error);
-          setConnectionStatus('Connection failed');
-          setMediaError('Failed to connect to room server. Please check your internet connection and try refreshing the page.');
-        };
+          ws.onerror = (error) => {
+            console.error('❌ WebSocket error:', error);
+            if (sessionTokenRef.current || reconnectDelayRef.current !== null || reconnectAttemptsRef.current > 0) {
+              return; // onclose follows and reconnects
+            }
+            setConnectionStatus('Connection failed');
+            setMediaError('Failed to connect to room server. Please check your internet connection and try refreshing the page.');
+          };
 
-        ws.onclose = (event) => {
-          console.warn('🔌 WebSocket closed:', event.code, event.reason);
-          setIsConnected(false);
-          setConnectionStatus('Disconnected');
+          ws.onclose = (event) => {
+            console.warn('🔌 WebSocket closed:', event.code, event.reason);
+            setIsConnected(false);
+            setConnectionStatus('Disconnected');
           
-          if (event.code !== 1000) { // Not a normal closure
-            if (event.code === 1006) {
-              setMediaError('Connection lost unexpectedly. This may be due to media access issues. Please check your camera/microphone permissions and refresh the page.');
-            } else {
-            setMediaError('Connection lost. Please refresh the page to reconnect.');
+            // Unexpected drop: reconnect with jittered backoff so a whole office doesn't return at once.
+            // Inside the server's grace period this resumes silently; after it, it is an ordinary join.
+            // Had a session, was told to come back, or is mid-way through retrying
+            const canReconnect = sessionTokenRef.current || reconnectDelayRef.current !== null || reconnectAttemptsRef.current > 0;
+            if (event.code !== 1000 && !leavingRef.current && canReconnect && reconnectAttemptsRef.current < 8) {
+              const delay = reconnectDelayRef.current
+                ?? Math.min(8000, 250 * 2 ** reconnectAttemptsRef.current) * (0.5 + Math.random());
+              reconnectDelayRef.current = null;
+              reconnectAttemptsRef.current += 1;
+              setConnectionStatus('Reconnecting...');
+              console.log(`🔁 Reconnecting in ${Math.round(delay)}ms (attempt ${reconnectAttemptsRef.current})`);
+              setTimeout(() => {
+                if (!leavingRef.current) openSocket();
+              }, delay);
+              return;
             }
-          }
-        };
+          
+            if (event.code !== 1000) { // Not a normal closure
+              if (event.code === 1006) {
+                setMediaError('Connection lost unexpectedly. This may be due to media access issues. Please check your camera/microphone permissions and refresh the page.');
+              } else {
+              setMediaError('Connection lost. Please refresh the page to reconnect.');
+              }
+            }
+          };
 
-        ws.onmessage = (e) => {
-          try {
-            const data = JSON.parse(e.data);
-            console.log('📥 Received message:', data.type);
-            handleSocketMsg(data, stream);
-          } catch (error) {
-            console.error('❌ Failed to parse WebSocket message:', error);
-          }
+          ws.onmessage = (e) => {
+            try {
+              const data = JSON.parse(e.data);
+              console.log('📥 Received message:', data.type);
+              handleSocketMsg(data, stream);
+            } catch (error) {
+              console.error('❌ Failed to parse WebSocket message:', error);
+            }
+          };
         };
+        leavingRef.current = false;
+        openSocket();
       })
       .catch((err) => {
         console.error('❌ Media error:', err);
@@ -700,6 +828,7 @@ export default function Room() {
     // Cleanup
     return () => {
       console.log('🧹 Cleaning up room connection');
+      leavingRef.current = true;
       
       // Stop activity tracking
       if (activitySessionId) {
@@ -2159,6 +2288,40 @@ export default function Room() {
   );
 }
 
+// Apply a presence diff from the backend to an office snapshot
+const applyPresenceDiff = (data: any, diff: any) => {
+  const rooms: Record<string, any[]> = { ...data.rooms };
+  const removeUser = (roomId: string, userId: string) => {
+    const remaining = (rooms[roomId] || []).filter((p: any) => p.id !== userId);
+    if (remaining.length) {
+      rooms[roomId] = remaining;
+    } else {
+      delete rooms[roomId];
+    }
+  };
+
+  diff.changes.forEach((change: any) => {
+    if (change.op === 'join') {
+      removeUser(change.room_id, change.user.id);
+      rooms[change.room_id] = [...(rooms[change.room_id] || []), change.user];
+    } else if (change.op === 'leave') {
+      removeUser(change.room_id, change.user_id);
+    } else if (change.op === 'move') {
+      removeUser(change.from_room, change.user_id);
+      rooms[change.room_id] = [...(rooms[change.room_id] || []), change.user];
+    }
+  });
+
+  const roomLists = Object.values(rooms);
+  return {
+    ...data,
+    version: diff.version,
+    rooms,
+    total_participants: roomLists.reduce((total, list) => total + list.length, 0),
+    active_rooms: roomLists.filter(list => list.length > 0).length
+  };
+};
+
 // Office Dashboard Component
 const OfficeDashboard = ({ officeId, onClose, currentRoomId, isMobile }: {
   officeId: string;
@@ -2170,12 +2333,22 @@ const OfficeDashboard = ({ officeId, onClose, currentRoomId, isMobile }: {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    const baseUrl = process.env.NEXT_PUBLIC_BACKEND_WS_URL || 'http://localhost:8000';
+    const httpUrl = baseUrl.replace('wss:', 'https:').replace('ws:', 'http:');
+    const presenceUrl = `${httpUrl.replace('https:', 'wss:').replace('http:', 'ws:')}/ws/offices/${officeId}/presence`;
+
+    let presenceSocket: WebSocket | null = null;
+    let pollInterval: ReturnType<typeof setInterval> | null = null;
+    let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+    let reconnectAttempts = 0;
+    let reconnectDelay: number | null = null; // From a draining server's reconnect hint
+    let presenceVersion = -1;
+    let resyncing = false;
+    let stopped = false;
+
     const fetchOfficeData = async () => {
       try {
-        const baseUrl = process.env.NEXT_PUBLIC_BACKEND_WS_URL || 'http://localhost:8000';
-        const wsUrl = baseUrl.replace('wss:', 'https:').replace('ws:', 'http:');
-        
-        const apiUrl = `${wsUrl}/offices/${officeId}/participants`;
+        const apiUrl = `${httpUrl}/offices/${officeId}/participants`;
         console.log('📊 Fetching office data from:', apiUrl);
         console.log('📊 Environment variable value:', process.env.NEXT_PUBLIC_BACKEND_WS_URL);
         
@@ -2190,11 +2363,80 @@ const OfficeDashboard = ({ officeId, onClose, currentRoomId, isMobile }: {
       }
     };
 
-    fetchOfficeData();
-    
-    // Refresh every 3 seconds for real-time feel
-    const interval = setInterval(fetchOfficeData, 3000);
-    return () => clearInterval(interval);
+    // Fallback only while the presence stream is down (or the server doesn't have it)
+    const startPolling = () => {
+      if (pollInterval) return;
+      fetchOfficeData();
+      pollInterval = setInterval(fetchOfficeData, 3000);
+    };
+
+    const stopPolling = () => {
+      if (pollInterval) clearInterval(pollInterval);
+      pollInterval = null;
+    };
+
+    // Server pushes a snapshot, then diffs as people join, leave and move
+    const connectPresence = () => {
+      const socket = new WebSocket(presenceUrl);
+      presenceSocket = socket;
+
+      socket.onopen = () => {
+        reconnectAttempts = 0;
+        stopPolling(); // The snapshot that follows replaces polled data
+      };
+
+      socket.onmessage = (e) => {
+        try {
+          const msg = JSON.parse(e.data);
+          if (msg.type === 'presence_snapshot') {
+            resyncing = false;
+            presenceVersion = msg.version;
+            setOfficeData(msg);
+            setLoading(false);
+          } else if (msg.type === 'presence_diff') {
+            if (msg.version !== presenceVersion + 1) {
+              // Missed an update; ask for a full snapshot and ignore diffs until it arrives
+              if (!resyncing) {
+                console.warn('📊 Presence version gap, resyncing');
+                resyncing = true;
+                socket.send(JSON.stringify({ type: 'presence_sync' }));
+              }
+              return;
+            }
+            presenceVersion = msg.version;
+            setOfficeData((prev: any) => prev ? applyPresenceDiff(prev, msg) : prev);
+          } else if (msg.type === 'reconnect') {
+            // Server is restarting; its close follows
+            reconnectDelay = msg.delay_ms ?? 0;
+          }
+        } catch (error) {
+          console.error('❌ Failed to parse presence message:', error);
+        }
+      };
+
+      socket.onclose = () => {
+        if (stopped) return;
+        // Poll while away, and come back to the stream with jittered backoff (deploys close every stream at once)
+        startPolling();
+        const delay = reconnectDelay ?? Math.min(30000, 500 * 2 ** reconnectAttempts) * (0.5 + Math.random());
+        reconnectDelay = null;
+        reconnectAttempts += 1;
+        console.warn(`📊 Presence stream closed, polling and reconnecting in ${Math.round(delay)}ms`);
+        reconnectTimer = setTimeout(() => {
+          reconnectTimer = null;
+          if (!stopped) connectPresence();
+        }, delay);
+      };
+    };
+
+    connectPresence();
+
+    return () => {
+      stopped = true;
+      presenceSocket?.close();
+      if (reconnectTimer) clearTimeout(reconnectTimer);
+      stopPolling();
+    };
   }, [officeId]);
 
   const getRoomName = (roomId: string) => {